@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Field decoding: a single base 128 varint compared to the byte-by-byte decoding,
+# raw tuples decoded by the compiled tuple decoder compared to the per-field
+# struct format strings used before (the latter measures the compiled decoders,
+# not the varint decoding alone).
+# Tuple encoding: pack_tuple compiled per type signature compared to pack_field per value.
+# Request encoding: prepared requests compared to the Request classes.
+
+import itertools
+import struct
+import timeit
+
+import txtarantool as tnt
+
+
+def legacy_unpack_int_base128(varint, offset):
+    res = ord(varint[offset])
+    if ord(varint[offset]) >= 0x80:
+        offset += 1
+        res = ((res - 0x80) << 7) + ord(varint[offset])
+        if ord(varint[offset]) >= 0x80:
+            offset += 1
+            res = ((res - 0x80) << 7) + ord(varint[offset])
+            if ord(varint[offset]) >= 0x80:
+                offset += 1
+                res = ((res - 0x80) << 7) + ord(varint[offset])
+                if ord(varint[offset]) >= 0x80:
+                    offset += 1
+                    res = ((res - 0x80) << 7) + ord(varint[offset])
+    return res, offset + 1
+
+
+def legacy_unpack_tuple(buff, offset):
+    cardinality = tnt.struct_L.unpack_from(buff, offset)[0]
+    _tuple = [''] * cardinality
+    offset += 4
+    for i in xrange(cardinality):
+        field_size, offset = legacy_unpack_int_base128(buff, offset)
+        field_data = struct.unpack_from("<%ds" % field_size, buff, offset)[0]
+        _tuple[i] = tnt.field(field_data)
+        offset += field_size
+    return tuple(_tuple)
+
+
+def legacy_pack_tuple(request, values):
+    cardinality = [tnt.struct_L.pack(len(values))]
+    packed_items = [request.pack_field(v) for v in values]
+    return b''.join(itertools.chain(cardinality, packed_items))
+
+
+# Function and arguments of the statement being timed, timeit runs it in its own namespace
+_timed = {}
+
+
+def bench(name, legacy, current, number, args=(), rounds=3):
+    """
+    Time f(*args) with f being the legacy and the current function. The rounds alternate
+    between them, so a slow period of the machine affects both, and the best time is taken.
+    """
+    names = ["a%d" % i for i in xrange(len(args))]
+    stmt = "f(%s)" % ", ".join(names)
+    setup = "; ".join(["from %s import _timed" % __name__, "f = _timed['f']"] +
+                      ["%s = _timed['%s']" % (n, n) for n in names])
+    times = ([], [])
+    for _ in xrange(rounds):
+        for side, f in enumerate((legacy, current)):
+            _timed.clear()
+            _timed.update(zip(names, args), f=f)
+            times[side].append(min(timeit.Timer(stmt, setup).repeat(3, number)))
+    t_legacy, t_current = min(times[0]), min(times[1])
+    print "%-44s legacy %7.3f us  current %7.3f us  speedup %5.2fx" % (
+        name, t_legacy / number * 1e6, t_current / number * 1e6, t_legacy / t_current)
+
+
+def main():
+    for value in (100, 1000, 100000):
+        packed = tnt.Request.pack_int_base128(value)
+        assert legacy_unpack_int_base128(packed, 0) == tnt.Response._unpack_int_base128(packed, 0)
+        bench("varint %d (%d bytes)" % (value, len(packed)),
+              legacy_unpack_int_base128, tnt.Response._unpack_int_base128, 100000, (packed, 0), rounds=25)
+
+    for name, values in (
+        ("tuple of 8 short fields", [b"key%d" % i for i in xrange(8)]),
+        ("tuple of 4 200 B fields", [b"x" * 200] * 4),
+    ):
+        buff = tnt.struct_L.pack(len(values)) + b"".join(tnt.Request.pack_str(v) for v in values)
+        decode = tnt.get_tuple_decoder(None)
+        assert legacy_unpack_tuple(buff, 0) == decode(buff, 0)
+        bench("compiled decoder, " + name, legacy_unpack_tuple, decode, 20000, (buff, 0))
+
+    request = tnt.Request()
+    for name, values in (
+        ("pack 20 int fields", tuple(xrange(1000, 1020))),
+        ("pack 10 int + 10 str fields", tuple(v for i in xrange(10) for v in (i * 1000, b"value%d" % i))),
+        ("pack 20 str fields", tuple(b"value%d" % i for i in xrange(20))),
+    ):
+        assert legacy_pack_tuple(request, values) == request.pack_tuple(values)
+        bench(name, legacy_pack_tuple, tnt.Request.pack_tuple, 5000, (request, values))
+
+    preparer = tnt.PreparedRequestsMixin()
+    for name, request, prepared, args in (
+        ("select by int key", tnt.RequestSelect, preparer.prepare_select(1, 0), (1, 0, 0, 0xffffffff)),
+        ("insert", tnt.RequestInsert, preparer.prepare_insert(1), (1, tnt.Request.TNT_FLAG_ADD)),
+        ("call", tnt.RequestCall, preparer.prepare_call(b"box.select_range"), (b"box.select_range", 0)),
+    ):
+        values = (12345,) if request is tnt.RequestSelect else (12345, b"name", b"email@example.com")
+        assert bytes(request("utf-8", "strict", 1, *(args + values))) == prepared.packet(1, values)
+        bench("encode " + name,
+              lambda: bytes(request("utf-8", "strict", 1, *(args + values))),
+              lambda: prepared.packet(1, values),
+              20000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# IproDeferredQueue with 100k requests waiting for reply: allocation, replies,
+# request churn and failure of all the requests on disconnect, compared to the
+# dict probed for a free id used before. Near the wrap point the old queue
+# probes all the ids of the long-lived requests in a single get().
+
+import time
+from collections import deque
+
+from twisted.internet import defer
+
+import txtarantool as tnt
+
+OUTSTANDING = 100000
+CHURN = 100000
+
+
+class LegacyIproDeferredQueue(object):
+
+    def __init__(self, backlog=None):
+        self.waiting = {0: deque()}
+        self.backlog = backlog
+        self.id = 1
+
+    def _cancelGet(self, d):
+        self.waiting.pop(d._ipro_request_id)
+
+    def broadcast(self, obj):
+        for request_id in self.waiting.keys():
+            if request_id != 0:
+                self.waiting.pop(request_id).callback(obj)
+            else:
+                for p in self.waiting.get(0):
+                    p.callback(obj)
+
+    def put(self, request_id, obj):
+        self.waiting.pop(request_id).callback(obj)
+
+    def get(self):
+        d = defer.Deferred(canceller=self._cancelGet)
+
+        d._ipro_request_id = self.id
+        self.waiting[self.id] = d
+
+        while True:
+            self.id += 1
+            if self.id > 0xffffffff:
+                self.id = 1
+            if not self.id in self.waiting:
+                break
+
+        return d
+
+
+def timed(f):
+    t0 = time.time()
+    f()
+    return time.time() - t0
+
+
+def run(queue_class, near_wrap):
+    queue = queue_class()
+    results = []
+    ds = []
+
+    results.append(timed(lambda: ds.extend(queue.get() for i in xrange(OUTSTANDING))))
+
+    if near_wrap:
+        # Long-lived requests hold the ids right after the wrap point
+        if hasattr(queue, "id"):
+            queue.id = 0xffffffff
+
+    worst = [0]
+
+    def churn():
+        for i in xrange(CHURN):
+            t0 = time.time()
+            d = queue.get()
+            worst[0] = max(worst[0], time.time() - t0)
+            queue.put(d._ipro_request_id, None)
+    results.append(timed(churn))
+    results.append(worst[0] * 1000)
+
+    def reply_all():
+        for d in ds[::2]:
+            queue.put(d._ipro_request_id, None)
+    results.append(timed(reply_all))
+
+    results.append(timed(lambda: queue.broadcast(None)))
+    return results
+
+
+def main():
+    print "%d outstanding requests, %d get/put cycles" % (OUTSTANDING, CHURN)
+    print "%-20s %10s %10s %10s %10s %10s" % ("", "allocate", "churn", "worst get", "reply half", "broadcast")
+    for name, queue_class in (("legacy", LegacyIproDeferredQueue), ("slots", tnt.IproDeferredQueue)):
+        for near_wrap in (False, True):
+            print "%-20s %9.3fs %9.3fs %8.3fms %9.3fs %9.3fs" % (
+                (name + (" near wrap" if near_wrap else ""),) + tuple(run(queue_class, near_wrap)))
+
+
+if __name__ == "__main__":
+    main()
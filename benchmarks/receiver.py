@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Throughput of IprotoPacketReceiver framing for different read sizes.
+# Per-byte cost should not depend on how fragmented the stream is.
+
+import time
+
+from twisted.test import proto_helpers
+
+import txtarantool as tnt
+
+
+class Receiver(tnt.IprotoPacketReceiver):
+    MAX_BODY = 16 * 1024 * 1024
+
+    def __init__(self):
+        self.packets = 0
+
+    def packetReceived(self, header, body):
+        self.packets += 1
+
+
+def make_stream(body_size, total_size):
+    body = b"x" * body_size
+    packet = tnt.struct_LLL.pack(tnt.Request.TNT_OP_SELECT, body_size, 1) + body
+    return packet * max(1, total_size // len(packet))
+
+
+def run(stream, chunk_size):
+    chunks = [stream[i:i + chunk_size] for i in xrange(0, len(stream), chunk_size)]
+    receiver = Receiver()
+    receiver.makeConnection(proto_helpers.StringTransport())
+
+    t0 = time.time()
+    for chunk in chunks:
+        receiver.dataReceived(chunk)
+    elapsed = time.time() - t0
+
+    return receiver.packets, elapsed
+
+
+def main():
+    streams = [
+        ("100 B packets", make_stream(100, 1024 * 1024)),
+        ("1 MB packet", make_stream(1024 * 1024, 1024 * 1024)),
+    ]
+
+    for name, stream in streams:
+        for chunk_size, chunk_name in ((1, "1 B"), (1024, "1 KB"), (64 * 1024, "64 KB")):
+            # Single byte reads are too slow to push the whole stream through
+            data = stream if chunk_size > 1 else stream[:256 * 1024]
+            packets, elapsed = run(data, chunk_size)
+            print "%-14s %6s chunks: %8.2f MB/s, %d packets" % (
+                name, chunk_name, len(data) / elapsed / 1024 / 1024, packets)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1342 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C0301,W0105,W0401,W0614
+"""
+Tests for txtarantool.TarantoolProtocol (no server required)
+"""
+from twisted.internet import defer
+from twisted.internet import task
+from twisted.python import failure
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+
+import txtarantool as tnt
+
+
+def pack_reply(request_type, request_id, tuples, return_code=0):
+    """
+    Build binary reply packet containing given tuples of bytes
+    """
+    body = [tnt.struct_LL.pack(return_code, len(tuples))]
+    for t in tuples:
+        fields = b''.join(tnt.Request.pack_str(f) for f in t)
+        body.append(tnt.struct_LL.pack(len(fields), len(t)) + fields)
+    body = b''.join(body)
+    return tnt.struct_LLL.pack(request_type, len(body), request_id) + body
+
+
+def sent_request_ids(transport):
+    """
+    Parse request ids of all the packets written to the transport
+    """
+    data = transport.value()
+    ids = []
+    offset = 0
+    while offset < len(data):
+        request_type, body_length, request_id = tnt.struct_LLL.unpack_from(data, offset)
+        ids.append(request_id)
+        offset += 12 + body_length
+    return ids
+
+
+class FakeFactory(object):
+
+    def addConnection(self, conn):
+        pass
+
+    def delConnection(self, conn):
+        pass
+
+
+class ProtocolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = tnt.TarantoolProtocol()
+        self.protocol.factory = FakeFactory()
+        self.transport = proto_helpers.StringTransport()
+        self.protocol.makeConnection(self.transport)
+
+
+class TestStreamedReplies(ProtocolTestCase):
+    """
+    Tests for replies longer than MAX_BODY
+    """
+
+    def test__select_streamed(self):
+        """
+        Test that oversized reply is decoded by parts and fires the request
+        """
+        self.protocol.MAX_BODY = 64
+        tuples = [(b"key%d" % i, b"v" * 30) for i in xrange(20)]
+
+        d = self.protocol.select(0, 0, None, b"key")
+        [request_id] = sent_request_ids(self.transport)
+        data = pack_reply(tnt.Request.TNT_OP_SELECT, request_id, tuples)
+
+        for i in xrange(0, len(data), 7):
+            self.protocol.dataReceived(data[i:i + 7])
+            # Only a part of the body is ever buffered
+            self.assertTrue(len(self.protocol._buffer) - self.protocol._offset < 64)
+
+        r = self.successResultOf(d)
+        self.assertEqual(list(r), tuples, "Streamed reply is decoded")
+        self.assertEqual(r.rowcount, 20)
+
+    def test__streamed_casting_error(self):
+        """
+        Test that decoding error of the streamed reply fails the request only
+        """
+        self.protocol.MAX_BODY = 16
+        d1 = self.protocol.select(0, 0, (int,), b"key")
+        d2 = self.protocol.ping()
+        request_id = sent_request_ids(self.transport)[0]
+
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, [(b"not an int",)] * 3))
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_PING, 0, []))
+
+        self.failureResultOf(d1, ValueError)
+        self.successResultOf(d2)
+        self.assertTrue(self.protocol.connected)
+
+    def test__streaming_disabled(self):
+        """
+        Test that oversized reply drops the connection if streaming is disabled
+        """
+        self.protocol.MAX_BODY = 16
+        self.protocol.streamReplies = False
+        d = self.protocol.select(0, 0, None, b"key")
+        [request_id] = sent_request_ids(self.transport)
+
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, [(b"x" * 20,)]))
+        self.assertTrue(self.transport.disconnecting)
+        self.assertNoResult(d)
+
+
+class TestSelectStream(ProtocolTestCase):
+    """
+    Tests for select_stream
+    """
+
+    def test__select_stream(self):
+        """
+        Test that tuples are passed to the callback and the request fires with the row count
+        """
+        tuples = [(b"key%d" % i, b"value") for i in xrange(10)]
+        received = []
+
+        d = self.protocol.select_stream(0, 0, None, received.append, b"key")
+        [request_id] = sent_request_ids(self.transport)
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, tuples))
+
+        self.assertEqual(self.successResultOf(d), 10)
+        self.assertEqual(received, tuples, "Every tuple is passed to the callback")
+
+    def test__select_stream_streamed(self):
+        """
+        Test that tuples of the oversized reply are passed to the callback while it is received
+        """
+        self.protocol.MAX_BODY = 64
+        tuples = [(i, b"v" * 30) for i in xrange(20)]
+        received = []
+
+        d = self.protocol.select_stream(0, 0, (int, str), received.append, b"key")
+        [request_id] = sent_request_ids(self.transport)
+        data = pack_reply(tnt.Request.TNT_OP_SELECT, request_id,
+                          [(tnt.struct_L.pack(i), v) for i, v in tuples])
+
+        self.protocol.dataReceived(data[:len(data) // 2])
+        self.assertTrue(0 < len(received) < 20, "Tuples are passed before the whole reply is received")
+        self.assertNoResult(d)
+
+        self.protocol.dataReceived(data[len(data) // 2:])
+        self.assertEqual(self.successResultOf(d), 20)
+        self.assertEqual(received, tuples)
+
+    def test__select_stream_callback_error(self):
+        """
+        Test that exception raised by the callback fails the request and skips the rest of the reply
+        """
+        received = []
+
+        def callback(value):
+            received.append(value)
+            raise ValueError("Unexpected tuple")
+
+        d = self.protocol.select_stream(0, 0, None, callback, b"key")
+        [request_id] = sent_request_ids(self.transport)
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, [(b"a",), (b"b",)]))
+
+        self.failureResultOf(d, ValueError)
+        self.assertEqual(received, [(b"a",)])
+        self.assertTrue(self.protocol.connected)
+
+    def test__select_stream_error(self):
+        """
+        Test that error reply fails the request
+        """
+        self.protocol.maxRetries = 0
+        d = self.protocol.select_stream(0, 0, None, lambda value: None, b"key")
+        [request_id] = sent_request_ids(self.transport)
+        body = tnt.struct_L.pack(0x201) + b"Tuple is locked\x00"
+        self.protocol.dataReceived(tnt.struct_LLL.pack(tnt.Request.TNT_OP_SELECT, len(body), request_id) + body)
+
+        self.failureResultOf(d, tnt.TarantoolError)
+
+
+class TestExecute(ProtocolTestCase):
+    """
+    Tests for prepared requests
+    """
+
+    def test__execute(self):
+        """
+        Test that prepared request is sent and its reply is decoded
+        """
+        select = self.protocol.prepare_select(0, 0)
+        d = self.protocol.execute(select, (int, str), 1)
+        [request_id] = sent_request_ids(self.transport)
+        self.assertEqual(self.transport.value(), bytes(tnt.RequestSelect("utf-8", "strict", request_id, 0, 0, 0, 0xffffffff, 1)))
+
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, [(tnt.struct_L.pack(1), b"one")]))
+        self.assertEqual(list(self.successResultOf(d)), [(1, b"one")])
+
+
+class CountingTransport(proto_helpers.StringTransport):
+
+    writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        proto_helpers.StringTransport.write(self, data)
+
+    def writeSequence(self, data):
+        self.writes += 1
+        proto_helpers.StringTransport.write(self, b''.join(data))
+
+
+class TestCorkedWrites(ProtocolTestCase):
+    """
+    Tests for write coalescing
+    """
+
+    def setUp(self):
+        self.protocol = tnt.TarantoolProtocol()
+        self.protocol.factory = FakeFactory()
+        self.protocol.corkWrites = True
+        self.clock = task.Clock()
+        self.protocol.callLater = self.clock.callLater
+        self.transport = CountingTransport()
+        self.protocol.makeConnection(self.transport)
+
+    def test__flush_on_next_iteration(self):
+        """
+        Test that requests issued at once are written by a single call
+        """
+        ds = [self.protocol.select(0, 0, None, i) for i in xrange(200)]
+        self.assertEqual(self.transport.writes, 0, "Requests are collected")
+
+        self.clock.advance(0)
+        self.assertEqual(self.transport.writes, 1, "Requests are written at once")
+        self.assertEqual(len(sent_request_ids(self.transport)), 200)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+        request_id = sent_request_ids(self.transport)[10]
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, [(b"x",)]))
+        self.assertEqual(list(self.successResultOf(ds[10])), [(b"x",)])
+
+    def test__flush_after_delay(self):
+        """
+        Test that requests are collected for corkDelay seconds
+        """
+        self.protocol.corkDelay = 0.001
+        self.protocol.ping()
+        self.clock.advance(0.0005)
+        self.protocol.ping()
+        self.assertEqual(self.transport.writes, 0)
+
+        self.clock.advance(0.0005)
+        self.assertEqual(self.transport.writes, 1)
+        self.assertEqual(len(sent_request_ids(self.transport)), 2)
+
+    def test__flush_on_max_bytes(self):
+        """
+        Test that collected requests are written as soon as their size reaches corkMaxBytes
+        """
+        self.protocol.corkMaxBytes = 100
+        for i in xrange(10):
+            self.protocol.select(0, 0, None, b"k" * 40)
+        self.assertEqual(self.transport.writes, 5, "Every 2 requests are written together")
+
+        self.clock.advance(0)
+        self.assertEqual(self.transport.writes, 5, "Nothing left to write")
+        self.assertEqual(len(sent_request_ids(self.transport)), 10)
+
+    def test__connection_lost(self):
+        """
+        Test that pending flush is cancelled when connection is lost
+        """
+        d = self.protocol.ping()
+        self.protocol.connectionLost(None)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.failureResultOf(d, tnt.ConnectionError)
+
+
+class TestSelectMany(ProtocolTestCase):
+    """
+    Tests for select_many
+    """
+
+    def reply(self, tuples):
+        [request_id] = sent_request_ids(self.transport)
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, tuples))
+
+    def test__select_many(self):
+        """
+        Test that all the keys are sent in a single request
+        """
+        d = self.protocol.select_many(0, 0, (int, str), [1, 2, 3])
+        self.assertEqual(self.transport.value(),
+                         bytes(tnt.RequestSelectMany("utf-8", "strict", 1, 0, 0, 0, 0xffffffff, [1, 2, 3])))
+
+        self.reply([(tnt.struct_L.pack(1), b"one"), (tnt.struct_L.pack(3), b"three")])
+        self.assertEqual(list(self.successResultOf(d)), [(1, b"one"), (3, b"three")])
+
+    def test__select_many_grouped(self):
+        """
+        Test that tuples are grouped by keys
+        """
+        d = self.protocol.select_many(0, 1, None, [(b"a", 1), (b"b", 2), (b"c", 3)], key_fields=(1, 0))
+        self.reply([
+            (tnt.struct_L.pack(1), b"a", b"x"),
+            (tnt.struct_L.pack(1), b"a", b"y"),
+            (tnt.struct_L.pack(3), b"c", b"z"),
+        ])
+
+        groups = self.successResultOf(d)
+        self.assertEqual([[t[2] for t in group] for group in groups], [[b"x", b"y"], [], [b"z"]])
+
+    def test__select_many_grouped_record(self):
+        """
+        Test that records are grouped by keys
+        """
+        User = tnt.record_class("User", [("id", int), ("name", unicode)])
+        d = self.protocol.select_many(0, 0, User, [2, 1], key_fields=[0])
+        self.reply([(tnt.struct_L.pack(2), b"two"), (tnt.struct_L.pack(1), b"one")])
+
+        self.assertEqual(self.successResultOf(d), [[User(2, u"two")], [User(1, u"one")]])
+
+    def test__select_many_invalid_key(self):
+        """
+        Test that keys not matching key fields are not sent
+        """
+        self.assertRaises(ValueError, self.protocol.select_many, 0, 0, None, [(1, 2)], key_fields=[0])
+        self.assertRaises(ValueError, self.protocol.select_many, 0, 1, None, [b"a"], key_fields=[1, 0])
+        self.assertRaises(ValueError, self.protocol.select_many, 0, 0, None, [1], key_fields=[0], columnar=True)
+        self.assertEqual(self.transport.value(), b"")
+
+    def test__select_many_grouped_columnar_default(self):
+        """
+        Test that tuples are grouped by rows when replies are columnar by default
+        """
+        self.protocol.responseClass = tnt.ColumnarResponse
+        d = self.protocol.select_many(0, 0, (int, str), [2, 1], key_fields=[0])
+        self.reply([(tnt.struct_L.pack(2), b"two"), (tnt.struct_L.pack(1), b"one")])
+
+        self.assertEqual(self.successResultOf(d), [[(2, b"two")], [(1, b"one")]])
+
+
+class TestBatchedSelects(unittest.TestCase):
+    """
+    Tests for selects batched by the connection handler
+    """
+
+    def setUp(self):
+        self.factory = tnt.TarantoolFactory(1, batchKeyFields={(0, 0): [0], (0, 1): [1, 2]})
+        self.clock = task.Clock()
+        self.handler = self.factory.handler
+        self.handler.callLater = self.clock.callLater
+        self.protocol = self.factory.buildProtocol(None)
+        self.transport = proto_helpers.StringTransport()
+        self.protocol.makeConnection(self.transport)
+
+    def reply(self, tuples):
+        [request_id] = sent_request_ids(self.transport)
+        self.transport.clear()
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, tuples))
+
+    def test__batched(self):
+        """
+        Test that selects issued at once are sent as a single request and every caller gets its tuples
+        """
+        ds = [self.handler.select(0, 0, (int, str), key) for key in (1, 2, 3, 2)]
+        self.assertEqual(self.transport.value(), b"", "Selects are collected")
+
+        self.clock.advance(0)
+        self.assertEqual(self.transport.value(),
+                         bytes(tnt.RequestSelectMany("utf-8", "strict", 1, 0, 0, 0, 0xffffffff, [(1,), (2,), (3,)])),
+                         "Unique keys are sent in a single request")
+
+        self.reply([(tnt.struct_L.pack(3), b"three"), (tnt.struct_L.pack(1), b"one")])
+        results = [self.successResultOf(d) for d in ds]
+        self.assertEqual(results, [[(1, b"one")], [], [(3, b"three")], []])
+        self.assertEqual(results[0].rowcount, 1)
+        self.assertEqual(results[1].rowcount, 0)
+
+    def test__batched_composite_key(self):
+        """
+        Test batching of selects by the secondary index
+        """
+        d1 = self.handler.select(0, 1, None, b"a", b"b")
+        d2 = self.handler.select(0, 1, None, b"c", b"d")
+        self.clock.advance(0)
+        self.reply([(b"1", b"c", b"d"), (b"2", b"a", b"b"), (b"3", b"a", b"b")])
+
+        self.assertEqual(self.successResultOf(d1), [(b"2", b"a", b"b"), (b"3", b"a", b"b")])
+        self.assertEqual(self.successResultOf(d2), [(b"1", b"c", b"d")])
+
+    def test__batched_options(self):
+        """
+        Test that selects with the same timeout and response class are batched and the options are applied
+        """
+        self.factory.multiplexed = True
+        self.protocol.clock = task.Clock()
+        ds = [self.handler.select(0, 0, None, key, timeout=1) for key in (1, 2)]
+        self.handler.select(0, 0, None, 3, timeout=2)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 2, "Selects with other options are batched apart")
+
+        self.clock.advance(0)
+        self.assertEqual(len(sent_request_ids(self.transport)), 2)
+        self.protocol.clock.pump([0.5] * 3)
+        for d in ds:
+            self.failureResultOf(d, tnt.TimeoutError)
+
+        self.transport.clear()
+        ds = [self.handler.select(0, 0, None, key, response_class=tnt.LazyResponse) for key in (1, 2)]
+        self.clock.advance(0)
+        self.reply([(tnt.struct_L.pack(1), b"one")])
+        results = [self.successResultOf(d) for d in ds]
+        self.assertEqual([type(r) for r in results], [tnt.LazyResponse] * 2)
+        self.assertEqual(results, [[(tnt.struct_L.pack(1), b"one")], []])
+
+    def test__batched_columnar(self):
+        """
+        Test that every caller gets its tuples by columns with response_class=ColumnarResponse
+        """
+        ds = [self.handler.select(0, 0, (int, str), key, response_class=tnt.ColumnarResponse) for key in (1, 3)]
+        self.clock.advance(0)
+        self.reply([(tnt.struct_L.pack(3), b"three"), (tnt.struct_L.pack(1), b"one")])
+
+        results = [self.successResultOf(d) for d in ds]
+        self.assertEqual([[list(column) for column in r] for r in results], [[[1], [b"one"]], [[3], [b"three"]]])
+        self.assertEqual([r.rowcount for r in results], [1, 1])
+
+    def test__batched_packed_keys(self):
+        """
+        Test that keys equal in python but packed differently are sent apart
+        """
+        self.handler.select(0, 0, None, 1)
+        self.handler.select(0, 0, None, 1L)
+        self.clock.advance(0)
+        self.assertEqual(self.transport.value(),
+                         bytes(tnt.RequestSelectMany("utf-8", "strict", 1, 0, 0, 0, 0xffffffff, [(1,), (1L,)])))
+
+    def test__not_batched(self):
+        """
+        Test that selects of the other indexes or with other arguments are sent at once
+        """
+        for args, kwargs in (((1, 0, None, 1), {}), ((0, 1, None, 1), {}), ((0, 0, None, 1), {"columnar": True})):
+            d = self.handler.select(*args, **kwargs)
+            self.assertEqual(len(sent_request_ids(self.transport)), 1, "Select is sent at once")
+            self.reply([])
+            self.successResultOf(d)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test__max_keys(self):
+        """
+        Test that selects are sent as soon as batchMaxKeys are collected
+        """
+        self.factory.batchMaxKeys = 2
+        self.handler.select(0, 0, None, 1)
+        self.handler.select(0, 0, None, 2)
+        self.assertEqual(len(sent_request_ids(self.transport)), 1)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test__failure(self):
+        """
+        Test that every caller gets the error of the batch
+        """
+        ds = [self.handler.select(0, 0, None, key) for key in (1, 2)]
+        self.clock.advance(0)
+        self.protocol.connectionLost(None)
+        for d in ds:
+            self.failureResultOf(d, tnt.ConnectionError)
+
+
+class TestMultiplexedPool(unittest.TestCase):
+    """
+    Tests for the multiplexed pool mode
+    """
+
+    def setUp(self):
+        self.factory = tnt.TarantoolFactory(2, multiplexed=True, maxPending=2)
+        self.handler = self.factory.handler
+        self.connections = []
+        for i in xrange(2):
+            protocol = self.factory.buildProtocol(None)
+            protocol.makeConnection(proto_helpers.StringTransport())
+            self.connections.append(protocol)
+
+    def reply(self, protocol, request_id):
+        protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, [(b"%d" % request_id,)]))
+
+    def test__pipelined(self):
+        """
+        Test that requests are sent over all the connections without waiting for replies
+        """
+        ds = [self.handler.select(0, 0, None, i) for i in xrange(5)]
+        self.assertEqual([sent_request_ids(c.transport) for c in self.connections], [[1, 2], [1, 2]],
+                         "maxPending requests are sent over every connection")
+
+        self.reply(self.connections[1], 2)
+        self.assertEqual(self.successResultOf(ds[2]), [(b"2",)])
+        request_ids = sent_request_ids(self.connections[1].transport)
+        self.assertEqual(len(request_ids), 3, "Waiting request is sent as soon as the reply is received")
+
+        self.reply(self.connections[1], request_ids[2])
+        self.assertEqual(self.successResultOf(ds[4]), [(b"%d" % request_ids[2],)])
+
+    def test__connection_lost(self):
+        """
+        Test that requests of the lost connection fail and the others are sent over the remaining connection
+        """
+        ds = [self.handler.select(0, 0, None, i) for i in xrange(4)]
+        self.connections[0].connectionLost(None)
+        self.failureResultOf(ds[1], tnt.ConnectionError)
+        self.failureResultOf(ds[3], tnt.ConnectionError)
+
+        self.handler.select(0, 0, None, 5)
+        self.assertEqual(sent_request_ids(self.connections[0].transport), [1, 2])
+
+    def test__not_connected(self):
+        """
+        Test that requests fail if there are no connections
+        """
+        for c in self.connections:
+            c.connectionLost(None)
+        self.failureResultOf(self.handler.select(0, 0, None, 1), tnt.ConnectionError)
+
+
+class TestPoolTimeouts(unittest.TestCase):
+    """
+    Tests for the deadlines of the requests waiting for a free connection of the pool
+    """
+
+    def setUp(self):
+        self.factory = tnt.TarantoolFactory(1)
+        self.clock = self.factory.handler.clock = task.Clock()
+        self.protocol = self.factory.buildProtocol(None)
+        self.protocol.clock = self.clock
+        self.protocol.makeConnection(proto_helpers.StringTransport())
+
+    def test__busy_pool(self):
+        """
+        Test that waiting for the busy connection counts against the timeout
+        """
+        busy = self.factory.handler.select(0, 0, None, 1)
+        d = self.factory.handler.select(0, 0, None, 2, timeout=1)
+        self.clock.advance(1)
+        self.failureResultOf(d, tnt.TimeoutError)
+        self.assertEqual(len(self.factory.connectionQueue.waiting), 0, "Request does not wait any more")
+        self.assertEqual(sent_request_ids(self.protocol.transport), [1], "Expired request is not sent")
+
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, 1, [(b"x",)]))
+        self.assertEqual(self.successResultOf(busy), [(b"x",)])
+        self.assertEqual(self.factory.connectionQueue.pending, [self.protocol], "Connection is put back")
+
+    def test__deadline_passed(self):
+        """
+        Test that request is not sent once its deadline has passed
+        """
+        self.clock.advance(5)
+        self.failureResultOf(self.factory.handler.select(0, 0, None, 1, deadline=4), tnt.TimeoutError)
+        self.assertEqual(self.protocol.transport.value(), b"")
+
+
+class TestAdmission(ProtocolTestCase):
+    """
+    Tests for flow control of the requests
+    """
+
+    def reply(self, request_id):
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, []))
+
+    def test__max_pending(self):
+        """
+        Test that requests wait for replies to the previous ones and are sent in order
+        """
+        self.protocol.maxPending = 2
+        ds = [self.protocol.select(0, 0, None, i) for i in xrange(4)]
+        request_ids = sent_request_ids(self.transport)
+        self.assertEqual(len(request_ids), 2)
+
+        self.reply(request_ids[1])
+        self.successResultOf(ds[1])
+        self.assertEqual(self.transport.value()[-4:], tnt.struct_L.pack(2), "The first waiting request is sent")
+        self.assertNoResult(ds[3])
+
+        self.reply(request_ids[0])
+        self.assertEqual(len(sent_request_ids(self.transport)), 4)
+
+    def test__max_waiting(self):
+        """
+        Test that requests fail if too many of them are waiting
+        """
+        self.protocol.maxPending = 1
+        self.protocol.maxWaiting = 1
+        self.protocol.ping()
+        d = self.protocol.ping()
+        self.failureResultOf(self.protocol.ping(), tnt.QueueUnderflow)
+        self.assertNoResult(d)
+
+    def test__transport_paused(self):
+        """
+        Test that requests wait while the transport's write buffer is full
+        """
+        self.assertTrue(self.transport.producer is self.protocol.producer, "Producer is registered")
+
+        self.transport.producer.pauseProducing()
+        d = self.protocol.select(0, 0, None, 1)
+        self.assertEqual(self.transport.value(), b"")
+
+        self.transport.producer.resumeProducing()
+        [request_id] = sent_request_ids(self.transport)
+        self.reply(request_id)
+        self.successResultOf(d)
+
+    def test__cancel_waiting(self):
+        """
+        Test that cancelled waiting request is not sent
+        """
+        self.protocol.producer.pauseProducing()
+        d = self.protocol.select(0, 0, None, 1)
+        d.cancel()
+        self.failureResultOf(d, defer.CancelledError)
+
+        self.protocol.producer.resumeProducing()
+        self.assertEqual(self.transport.value(), b"")
+
+    def test__connection_lost(self):
+        """
+        Test that waiting requests fail when connection is lost
+        """
+        self.protocol.producer.pauseProducing()
+        d = self.protocol.select(0, 0, None, 1)
+        self.protocol.connectionLost(None)
+        self.failureResultOf(d, tnt.ConnectionError)
+
+    def test__invalid_request(self):
+        """
+        Test that invalid request fails the same way whether it is sent at once or waits
+        """
+        self.failureResultOf(self.protocol.select(0, 0, None, 1.5), TypeError)
+
+        self.protocol.producer.pauseProducing()
+        d = self.protocol.select(0, 0, None, 1.5)
+        self.protocol.producer.resumeProducing()
+        self.failureResultOf(d, TypeError)
+        self.assertEqual(self.transport.value(), b"", "Nothing is sent")
+        self.assertEqual(len(self.protocol.replyQueue), 0, "Request ids are released")
+
+
+class TestTimeouts(ProtocolTestCase):
+    """
+    Tests for request timeouts and deadlines
+    """
+
+    def setUp(self):
+        ProtocolTestCase.setUp(self)
+        self.clock = self.protocol.clock = task.Clock()
+
+    def reply(self, request_id):
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, [(b"x",)]))
+
+    def test__timeout(self):
+        """
+        Test that request fails once timeout expires and its id is released
+        """
+        d = self.protocol.select(0, 0, None, 1, timeout=1)
+        self.clock.advance(0.5)
+        self.assertNoResult(d)
+
+        self.clock.advance(0.6)
+        self.failureResultOf(d, tnt.TimeoutError)
+        self.assertEqual(len(self.protocol.replyQueue), 0, "Request id is released")
+        self.assertEqual(self.clock.getDelayedCalls(), [], "Timer wheel is stopped")
+
+    def test__unknown_option(self):
+        """
+        Test that misspelled options are not ignored
+        """
+        self.assertRaises(TypeError, self.protocol.select, 0, 0, None, 1, timout=1)
+        self.assertRaises(TypeError, self.protocol.ping, deadlne=1)
+        self.assertRaises(TypeError, self.protocol.insert, 0, 1, limit=1)
+        self.assertRaises(TypeError, self.protocol.select, 0, 0, None, 1, key_fields=[0])
+        self.assertEqual(self.transport.value(), b"", "Nothing is sent")
+
+    def test__replied_in_time(self):
+        """
+        Test that timer is cancelled when reply arrives
+        """
+        d = self.protocol.select(0, 0, None, 1, timeout=1)
+        [request_id] = sent_request_ids(self.transport)
+        self.reply(request_id)
+
+        self.assertEqual(self.successResultOf(d)[0][0], b"x")
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test__deadline(self):
+        """
+        Test that the earlier of deadline and timeout is used
+        """
+        d1 = self.protocol.select(0, 0, None, 1, deadline=2, timeout=5)
+        d2 = self.protocol.select(0, 0, None, 1, deadline=5, timeout=3)
+        self.clock.advance(2.1)
+        self.failureResultOf(d1, tnt.TimeoutError)
+        self.assertNoResult(d2)
+        self.clock.advance(1)
+        self.failureResultOf(d2, tnt.TimeoutError)
+
+    def test__default_timeout(self):
+        """
+        Test that requestTimeout applies to every request including waiting for admission
+        """
+        self.protocol.requestTimeout = 1
+        self.protocol.maxPending = 1
+        ds = [self.protocol.select(0, 0, None, 1), self.protocol.ping()]
+        self.clock.advance(1.1)
+
+        for d in ds:
+            self.failureResultOf(d, tnt.TimeoutError)
+        self.assertEqual(len(sent_request_ids(self.transport)), 1, "Expired waiting request is not sent")
+
+    def test__late_reply(self):
+        """
+        Test that late reply is dropped and the connection is kept
+        """
+        d = self.protocol.select(0, 0, None, 1, timeout=1)
+        [request_id] = sent_request_ids(self.transport)
+        self.clock.advance(2)
+        self.failureResultOf(d, tnt.TimeoutError)
+
+        self.reply(request_id)
+        self.assertFalse(self.transport.disconnecting, "Connection is kept")
+
+        d = self.protocol.select(0, 0, None, 1)
+        self.reply(sent_request_ids(self.transport)[-1])
+        self.successResultOf(d)
+
+    def test__late_streamed_reply(self):
+        """
+        Test that late streamed reply is skipped
+        """
+        self.protocol.streamReplies = True
+        self.protocol.MAX_BODY = 16
+        d = self.protocol.select(0, 0, None, 1, timeout=1)
+        [request_id] = sent_request_ids(self.transport)
+        self.clock.advance(2)
+        self.failureResultOf(d, tnt.TimeoutError)
+
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_id, [(b"x" * 100,)] * 3))
+        self.assertFalse(self.transport.disconnecting, "Connection is kept")
+
+    def test__single_timer(self):
+        """
+        Test that a single delayed call serves all the requests
+        """
+        ds = [self.protocol.select(0, 0, None, i, timeout=1 + i * 0.001) for i in xrange(1000)]
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+
+        self.clock.pump([0.1] * 20)
+        for d in ds:
+            self.failureResultOf(d, tnt.TimeoutError)
+        self.assertEqual(len(self.protocol.replyQueue), 0)
+
+    def test__connection_lost(self):
+        """
+        Test that timers are stopped when connection is lost
+        """
+        d = self.protocol.select(0, 0, None, 1, timeout=1)
+        self.protocol.connectionLost(None)
+        self.failureResultOf(d, tnt.ConnectionError)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+class TestRetries(ProtocolTestCase):
+    """
+    Tests for retries of the "try again" replies
+    """
+
+    def setUp(self):
+        ProtocolTestCase.setUp(self)
+        self.clock = self.protocol.clock = task.Clock()
+
+    def try_again(self, request_id):
+        body = tnt.struct_L.pack(0x201) + b"Tuple is locked\x00"
+        self.protocol.dataReceived(tnt.struct_LLL.pack(tnt.Request.TNT_OP_SELECT, len(body), request_id) + body)
+
+    def test__retry(self):
+        """
+        Test that request is sent again after a delay and fires with the successful reply
+        """
+        d = self.protocol.select(0, 0, None, 1)
+        self.try_again(sent_request_ids(self.transport)[-1])
+        self.assertNoResult(d)
+        self.assertEqual(len(sent_request_ids(self.transport)), 1, "Retry is delayed")
+
+        self.clock.advance(self.protocol.retryDelay)
+        request_ids = sent_request_ids(self.transport)
+        self.assertEqual(len(request_ids), 2)
+        self.protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, request_ids[-1], [(b"x",)]))
+
+        self.assertEqual(list(self.successResultOf(d)), [(b"x",)])
+        self.assertEqual(self.protocol.retryBudget.retries, 1)
+
+    def test__max_retries(self):
+        """
+        Test that the last "try again" reply is returned once the request is retried maxRetries times
+        """
+        self.protocol.maxRetries = 2
+        d = self.protocol.select(0, 0, None, 1)
+        for i in xrange(3):
+            self.try_again(sent_request_ids(self.transport)[-1])
+            self.clock.advance(self.protocol.retryMaxDelay)
+
+        self.assertEqual(self.successResultOf(d).completion_status, 1)
+        self.assertEqual(len(sent_request_ids(self.transport)), 3)
+        self.assertEqual((self.protocol.retryBudget.retries, self.protocol.retryBudget.exhausted), (2, 1))
+
+    def test__budget(self):
+        """
+        Test that retries stop when the budget is exhausted
+        """
+        budget = self.protocol.retryBudget = tnt.RetryBudget(ratio=0.5, reserve=1)
+        ds = [self.protocol.select(0, 0, None, i) for i in xrange(2)]
+        for request_id in sent_request_ids(self.transport):
+            self.try_again(request_id)
+        self.clock.advance(self.protocol.retryMaxDelay)
+
+        self.assertEqual(len(sent_request_ids(self.transport)), 3, "Only one request is retried")
+        self.assertEqual((budget.retries, budget.denied), (1, 1))
+        self.assertEqual(len([d for d in ds if d.called]), 1)
+
+    def test__timeout_while_delayed(self):
+        """
+        Test that request expiring while waiting for retry is not sent again
+        """
+        self.protocol.retryDelay = 10
+        d = self.protocol.select(0, 0, None, 1, timeout=1)
+        self.try_again(sent_request_ids(self.transport)[-1])
+        self.clock.pump([0.5] * 3)
+
+        self.failureResultOf(d, tnt.TimeoutError)
+        self.assertEqual(self.clock.getDelayedCalls(), [], "Retry is cancelled")
+
+    def test__connection_lost_while_delayed(self):
+        """
+        Test that request waiting for retry fails when the connection is lost
+        """
+        d = self.protocol.select(0, 0, None, 1)
+        self.try_again(sent_request_ids(self.transport)[-1])
+        self.protocol.connectionLost(None)
+
+        self.failureResultOf(d, tnt.ConnectionError)
+        self.assertEqual(self.clock.getDelayedCalls(), [], "Retry is cancelled")
+
+
+class TestReplicatedPool(unittest.TestCase):
+    """
+    Tests for routing of the requests to the primary and the replicas
+    """
+
+    def setUp(self):
+        self.handlers = []
+        self.transports = []
+        for i in xrange(3):
+            factory = tnt.TarantoolFactory(1, multiplexed=True)
+            protocol = factory.buildProtocol(None)
+            self.transports.append(proto_helpers.StringTransport())
+            protocol.makeConnection(self.transports[-1])
+            self.handlers.append(factory.handler)
+        self.handler = tnt.ReplicatedConnectionHandler(self.handlers[0], self.handlers[1:])
+
+    def sent(self):
+        return [len(sent_request_ids(t)) for t in self.transports]
+
+    def test__routing(self):
+        """
+        Test that reads go to the replicas in turn and writes to the primary
+        """
+        self.handler.select(0, 0, None, 1)
+        self.handler.select_ext(0, 0, 0, 10, None, 1)
+        self.handler.ping()
+        self.assertEqual(self.sent(), [0, 1, 2])
+
+        self.handler.insert(0, 1, b"x")
+        self.handler.update(0, (1,), [(1, "=", b"y")])
+        self.handler.call(b"proc", None)
+        self.assertEqual(self.sent(), [3, 1, 2])
+
+    def test__execute(self):
+        """
+        Test that prepared requests are routed by their type
+        """
+        self.handler.execute(self.handler.prepare_select(0, 0), None, 1)
+        self.handler.execute(self.handler.prepare_insert(0), None, 1)
+        self.assertEqual(self.sent(), [1, 0, 1])
+
+    def test__override(self):
+        """
+        Test that replica keyword argument overrides routing
+        """
+        self.handler.select(0, 0, None, 1, replica=False)
+        self.handler.call(b"proc", None, replica=True)
+        self.assertEqual(self.sent(), [1, 0, 1])
+
+    def test__replicas_not_connected(self):
+        """
+        Test that reads go to the primary if no replica is connected
+        """
+        for handler in self.handlers[1:]:
+            handler._factory.pool[0].connectionLost(None)
+        self.handler.select(0, 0, None, 1)
+        self.assertEqual(self.sent(), [1, 0, 0])
+
+
+class RecordingHandler(object):
+    """
+    Connection handler replying to selects with the tuples it is given
+    """
+
+    def __init__(self, name, tuples=()):
+        self.name = name
+        self.tuples = list(tuples)
+        self.calls = []
+        self.sent_rows = 0
+
+    def reply(self, rows, columnar=False, field_types=None):
+        self.sent_rows += len(rows)
+        response_class = tnt.ColumnarResponse if columnar else tnt.Response
+        response = response_class((tnt.Request.TNT_OP_SELECT, 0, 0), None, "utf-8", "strict", field_types)
+        response._return_code = response._completion_status = 0
+        for row in rows:
+            response._append_tuple(row)
+        response._rowcount = len(rows)
+        return defer.succeed(response)
+
+    def __getattr__(self, method):
+        def wrapper(*args, **kwargs):
+            self.calls.append((method,) + args)
+            if method == "select_many":
+                keys = args[3]
+                if kwargs.get("key_fields"):
+                    return defer.succeed([[t for t in self.tuples if t[0] == key] for key in keys])
+                return self.reply([t for t in self.tuples if t[0] in keys])
+            if method == "select_ext":
+                offset, limit = args[2:4]
+                return self.reply(self.tuples[offset:offset + limit])
+            if method == "select":
+                return self.reply(self.tuples, kwargs.get("columnar"), args[2])
+            return self.reply(self.tuples)
+        return wrapper
+
+
+class TestShardedPool(unittest.TestCase):
+    """
+    Tests for routing of the requests to the shards
+    """
+
+    def setUp(self):
+        self.shards = dict((name, RecordingHandler(name)) for name in ("a", "b", "c"))
+        self.handler = tnt.ShardedConnectionHandler(self.shards)
+
+    def test__ring(self):
+        """
+        Test that adding a node moves only the keys the new node gets
+        """
+        ring = tnt.HashRing()
+        for name in ("a", "b", "c", "d"):
+            ring.add(name, name)
+        keys = [b"key%d" % i for i in xrange(10000)]
+        before = [ring.get(key) for key in keys]
+        ring.add("e", "e")
+        moved = [after for key, prev, after in zip(keys, before, [ring.get(key) for key in keys]) if prev != after]
+
+        self.assertEqual(set(moved), set(["e"]), "Keys move only to the new node")
+        self.assertTrue(1000 < len(moved) < 3000, "About 1/N of the keys are moved")
+
+    def test__routing(self):
+        """
+        Test that requests by the same key go to the same shard
+        """
+        for key in xrange(20):
+            shard = self.handler.shard_for(key)
+            self.handler.insert(0, key, b"value")
+            self.handler.update(0, (key,), [(1, "=", b"x")])
+            self.handler.delete(0, key)
+            self.handler.select(0, 0, None, key)
+            self.assertEqual([call[0] for call in shard.calls[-4:]], ["insert", "update", "delete", "select"])
+        self.assertTrue(all(shard.calls for shard in self.shards.values()), "Keys are spread over the shards")
+
+    def test__key_types(self):
+        """
+        Test that the same key value is routed to the same shard whatever its type or packing
+        """
+        for key in (1, 2 ** 40):
+            self.assertTrue(self.handler.shard_for(key) is self.handler.shard_for(long(key)))
+
+        self.handler.keyTypes[1] = (int,)
+        for key in xrange(20):
+            self.assertTrue(self.handler.shard_for(tnt.field(key), 1) is self.handler.shard_for(key))
+        self.handler.keyTypes[2] = (str,)
+        self.assertTrue(self.handler.shard_for(u"key", 2) is self.handler.shard_for(b"key", 2))
+
+    def test__remove_shard(self):
+        """
+        Test that the pool of the removed shard is closed
+        """
+        shard = self.shards["b"]
+        self.handler.remove_shard("b")
+        self.assertEqual(shard.calls, [("disconnect",)])
+        self.assertEqual(sorted(self.handler.shards), ["a", "c"])
+
+    def test__key_extractor(self):
+        """
+        Test that the primary key is taken from the tuple by the extractor of the space
+        """
+        self.handler.keyExtractors[1] = lambda values: values[1:2]
+        self.handler.replace(1, b"value", 42)
+        self.assertEqual(self.handler.shard_for(42).calls, [("replace", 1, b"value", 42)])
+
+    def test__secondary_index(self):
+        """
+        Test that select by a secondary index is sent to all the shards and the results are merged
+        """
+        for name, shard in self.shards.items():
+            shard.tuples = [(name, b"x")]
+        r = self.successResultOf(self.handler.select(0, 1, None, b"x"))
+        self.assertEqual(sorted(r), [("a", b"x"), ("b", b"x"), ("c", b"x")])
+        self.assertEqual(r.rowcount, 3)
+
+    def test__secondary_index_columnar(self):
+        """
+        Test that columns of the shards' replies are concatenated
+        """
+        for i, (name, shard) in enumerate(sorted(self.shards.items())):
+            shard.tuples = [(i * 10 + j, name) for j in xrange(i + 1)]
+        r = self.successResultOf(self.handler.select(0, 1, (int, str), b"x", columnar=True))
+        self.assertTrue(isinstance(r, tnt.ColumnarResponse))
+        self.assertEqual(len(r), 2, "Two columns")
+        self.assertEqual(sorted(zip(*r)), [(0, "a"), (10, "b"), (11, "b"), (20, "c"), (21, "c"), (22, "c")])
+        self.assertEqual(r.rowcount, 6)
+
+    def test__select_many(self):
+        """
+        Test that keys are split by their shards and the groups are returned in the order of the keys
+        """
+        keys = range(30)
+        for shard in self.shards.values():
+            shard.tuples = [(key, b"v") for key in keys if self.handler.shard_for(key) is shard]
+
+        groups = self.successResultOf(self.handler.select_many(0, 0, None, keys, key_fields=[0]))
+        self.assertEqual(groups, [[(key, b"v")] for key in keys])
+        for shard in self.shards.values():
+            self.assertEqual(len(shard.calls), 1, "A single request per shard")
+
+        r = self.successResultOf(self.handler.select_many(0, 0, None, keys))
+        self.assertEqual(sorted(r), [(key, b"v") for key in keys])
+
+    def test__call(self):
+        """
+        Test that call is routed by shard or shard_key
+        """
+        self.assertRaises(ValueError, self.handler.call, b"proc", None)
+        self.handler.call(b"proc", None, shard="b")
+        self.handler.call(b"proc", None, 7, shard_key=7)
+        self.assertEqual(self.shards["b"].calls[0], ("call", b"proc", None))
+        self.assertEqual(self.handler.shard_for(7).calls[-1], ("call", b"proc", None, 7))
+
+    def test__execute(self):
+        """
+        Test that prepared requests are routed by their key
+        """
+        self.handler.execute(self.handler.prepare_insert(0), None, 5, b"x")
+        self.handler.execute(self.handler.prepare_select(0, 0), None, 5)
+        self.assertEqual(len(self.handler.shard_for(5).calls), 2)
+        self.assertRaises(ValueError, self.handler.execute, self.handler.prepare_select(0, 1), None, 5)
+
+    def test__select_range(self):
+        """
+        Test that pages of the shards are merged in the index order and only the needed pages are fetched
+        """
+        values = range(100)
+        for i, shard in enumerate(sorted(self.shards.values(), key=lambda shard: shard.name)):
+            # Most of the first tuples are on the first shard
+            shard.tuples = [(b"id%d" % v, v) for v in values if (v % 3 == i if v >= 20 else i == 0)]
+
+        r = self.successResultOf(self.handler.select_range(1, 1, (str, int), [1], b"x", offset=5, limit=20))
+        self.assertEqual([row[1] for row in r], range(5, 25))
+        self.assertEqual(r.rowcount, 20)
+
+        fetched = sum(shard.sent_rows for shard in self.shards.values())
+        self.assertTrue(fetched <= 2 * 25, "No more than offset + limit tuples and a page per shard are fetched")
+        self.assertTrue(all(call[:3] + call[5:] == ("select_ext", 1, 1, (str, int), b"x")
+                            for shard in self.shards.values() for call in shard.calls))
+
+    def test__select_range_all(self):
+        """
+        Test that all the tuples are merged without limit
+        """
+        for i, shard in enumerate(self.shards.values()):
+            shard.tuples = [(b"id", v) for v in xrange(i, 30, 3)]
+
+        r = self.successResultOf(self.handler.select_range(1, 1, None, [1], b"x", page_size=4, key_types=[int]))
+        self.assertEqual([row[1] for row in r], range(30))
+
+    def test__select_range_raw_fields(self):
+        """
+        Test that raw fields are merged by their values casted to key_types
+        """
+        for i, shard in enumerate(self.shards.values()):
+            shard.tuples = [(b"id", tnt.field(v)) for v in xrange(i * 100, 1000, 300)]
+
+        r = self.successResultOf(self.handler.select_range(1, 1, None, [1], b"x", key_types=[int]))
+        self.assertEqual([int(row[1]) for row in r], range(0, 1000, 100))
+        self.failureResultOf(self.handler.select_range(1, 1, None, [1], b"x"), ValueError)
+
+
+class TestAutoscaler(unittest.TestCase):
+    """
+    Tests for the pool size adjustment
+    """
+
+    def make_factory(self, **kwargs):
+        factory = tnt.TarantoolFactory(2, minPoolSize=1, maxPoolSize=4, idleTimeout=10, **kwargs)
+        factory.autoscaler.clock = self.clock
+
+        def connect():
+            protocol = factory.buildProtocol(None)
+            self.connects.append(protocol)
+            self.connectors[protocol] = object()
+            return self.connectors[protocol]
+
+        factory.connect = connect
+        for i in xrange(2):
+            factory.connect()
+        return factory
+
+    def connect_pending(self):
+        for protocol in self.connects:
+            if protocol.transport is None:
+                transport = proto_helpers.StringTransport()
+                transport.connector = self.connectors[protocol]
+                protocol.makeConnection(transport)
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.connects = []
+        self.connectors = {}
+
+    def test__scale_up_on_depth(self):
+        """
+        Test that connections are added when there are too many requests in flight
+        """
+        factory = self.make_factory(multiplexed=True, scaleUpDepth=3)
+        self.connect_pending()
+        for i in xrange(8):
+            factory.handler.select(0, 0, None, i)
+
+        self.clock.advance(1)
+        self.assertEqual(len(self.connects), 3, "Pool grows by a half")
+        self.assertEqual(factory.autoscaler.stats()["connecting"], 1)
+        self.connect_pending()
+        self.assertEqual(factory.size, 3)
+
+        for i in xrange(2):
+            for j in xrange(8):
+                factory.handler.select(0, 0, None, j)
+            self.clock.advance(1)
+            self.connect_pending()
+        self.assertEqual(factory.size, 4, "Pool does not grow above maxPoolSize")
+
+        stats = factory.autoscaler.stats()
+        self.assertEqual(stats["scaledUp"], 2)
+        self.assertEqual([d[1:3] for d in stats["decisions"]], [("up", 1), ("up", 1)])
+
+    def test__scale_up_on_wait(self):
+        """
+        Test that connections are added when requests wait for a free connection
+        """
+        factory = self.make_factory()
+        self.connect_pending()
+        conns = [self.successResultOf(factory.getConnection()) for i in xrange(2)]
+        d = factory.getConnection()
+        self.clock.advance(0.5)
+        factory.connectionQueue.put(conns[0])
+        self.successResultOf(d)
+
+        self.clock.advance(0.5)
+        self.assertEqual(len(self.connects), 3)
+        self.assertTrue(factory.autoscaler.decisions[-1][3].startswith("wait"))
+
+    def test__scale_up_on_backlog(self):
+        """
+        Test that connections are added when requests wait for the stuck connections
+        """
+        factory = self.make_factory()
+        self.connect_pending()
+        for i in xrange(2):
+            self.successResultOf(factory.getConnection())
+        ds = [factory.getConnection() for i in xrange(3)]
+        self.clock.advance(1)
+        self.assertEqual(len(self.connects), 3, "Waiting requests are seen before any gets a connection")
+        self.assertEqual(factory.autoscaler.decisions[-1][3], "wait 1.000s, 3 waiting")
+        for d in ds:
+            self.assertNoResult(d)
+
+    def test__scale_up_failed(self):
+        """
+        Test that failed connection attempts are not counted as connecting
+        """
+        factory = self.make_factory(multiplexed=True, scaleUpDepth=3)
+        factory.clock = self.clock
+        self.connect_pending()
+        for i in xrange(8):
+            factory.handler.select(0, 0, None, i)
+        self.clock.advance(1)
+        self.assertEqual(factory.autoscaler.stats()["connecting"], 1)
+
+        refused = failure.Failure(tnt.ConnectionError("Connection refused"))
+        factory.clientConnectionFailed(object(), refused)
+        self.assertEqual(factory.autoscaler.stats()["connecting"], 1, "Failed reconnect of another connection")
+        factory.clientConnectionFailed(self.connectors[self.connects[-1]], refused)
+        self.assertEqual(factory.autoscaler.stats()["connecting"], 0)
+
+    def test__scale_down_idle(self):
+        """
+        Test that idle connections are closed down to minPoolSize without reconnecting
+        """
+        factory = self.make_factory(multiplexed=True)
+        self.connect_pending()
+        busy = factory.pool[0]
+        for i in xrange(12):
+            self.clock.advance(1)
+            busy.ping()
+
+        self.assertEqual(factory.pool, [busy], "Idle connection is closed")
+        self.assertTrue(self.connects[1].transport.disconnecting)
+        self.assertTrue(self.connects[1].retired)
+
+        for i in xrange(20):
+            self.clock.advance(1)
+        self.assertEqual(factory.size, 1, "Pool does not shrink below minPoolSize")
+        self.assertEqual(factory.autoscaler.stats()["scaledDown"], 1)
+
+
+class Candidate(object):
+
+    def __init__(self, name, outstanding=0, latency=0.0, available=True):
+        self.name = name
+        self.outstanding = outstanding
+        self.latency = latency
+        self.available = available
+
+
+class TestSelectionPolicies(unittest.TestCase):
+    """
+    Tests for the policies choosing the connection of a request
+    """
+
+    def test__round_robin(self):
+        """
+        Test that available candidates are picked in turn, the least busy if none is available
+        """
+        policy = tnt.RoundRobinPolicy()
+        candidates = [Candidate("a"), Candidate("b", available=False), Candidate("c")]
+        self.assertEqual([policy.pick(candidates).name for i in xrange(4)], ["c", "a", "c", "a"])
+
+        candidates = [Candidate("a", 3, available=False), Candidate("b", 1, available=False)]
+        self.assertEqual(policy.pick(candidates).name, "b")
+
+    def test__least_outstanding(self):
+        policy = tnt.LeastOutstandingPolicy()
+        candidates = [Candidate("a", 3), Candidate("b", 1), Candidate("c", 2)]
+        self.assertEqual(policy.pick(candidates).name, "b")
+        self.assertTrue(policy.pick([]) is None)
+
+    def test__power_of_two(self):
+        """
+        Test that the cheaper of two candidates is picked
+        """
+        policy = tnt.PowerOfTwoPolicy()
+        slow = Candidate("slow", 1, 2.0)
+        fast = Candidate("fast", 5, 0.01)
+        self.assertEqual(set(policy.pick([slow, fast]).name for i in xrange(10)), set(["fast"]))
+
+        candidates = [Candidate("c%d" % i, i, 0.01) for i in xrange(10)]
+        picks = [policy.pick(candidates).name for i in xrange(1000)]
+        self.assertEqual(picks.count("c9"), 0, "The most expensive candidate is never picked")
+        self.assertTrue(picks.count("c0") > 100)
+
+    def test__latency(self):
+        """
+        Test that latency peaks are taken at once and decay while no replies arrive
+        """
+        protocol = tnt.TarantoolProtocol()
+        protocol.factory = FakeFactory()
+        protocol.makeConnection(proto_helpers.StringTransport())
+        clock = protocol.clock = task.Clock()
+
+        d = protocol.select(0, 0, None, 1)
+        clock.advance(0.5)
+        protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, sent_request_ids(protocol.transport)[-1], []))
+        self.successResultOf(d)
+        self.assertEqual(protocol.latency, 0.5)
+        self.assertEqual(protocol.outstanding, 0)
+
+        clock.advance(protocol.latencyDecay)
+        self.assertAlmostEqual(protocol.latency, 0.5 / 2.718281828, places=3)
+
+    def test__send_packet(self):
+        """
+        Test that replies to the requests sent without _expect_reply fire them
+        """
+        protocol = tnt.TarantoolProtocol()
+        protocol.factory = FakeFactory()
+        protocol.makeConnection(proto_helpers.StringTransport())
+
+        d1 = protocol.send_packet(tnt.RequestSelect("utf-8", "strict", 1, 0, 0, 0, 0xffffffff, 1))
+        d2 = protocol.replyQueue.get()
+        for d in (d1, d2):
+            protocol.dataReceived(pack_reply(tnt.Request.TNT_OP_SELECT, d._ipro_request_id, [(b"x",)]))
+        self.assertEqual(list(self.successResultOf(d1)), [(b"x",)])
+        self.successResultOf(d2)
+        self.assertTrue(protocol.connected)
+
+    def test__multiplexed_pool(self):
+        """
+        Test that requests avoid the connection stuck behind a slow request
+        """
+        factory = tnt.TarantoolFactory(3, multiplexed=True, selectionPolicy=tnt.PowerOfTwoPolicy())
+        clock = task.Clock()
+        for i in xrange(3):
+            protocol = factory.buildProtocol(None)
+            protocol.clock = clock
+            protocol.makeConnection(proto_helpers.StringTransport())
+        slow = factory.pool[0]
+        slow._latency, slow._latencyStamp = 5.0, 0
+        for conn in factory.pool[1:]:
+            conn._latency = 0.001
+
+        for i in xrange(30):
+            factory.handler.select(0, 0, None, i)
+        self.assertEqual(slow.outstanding, 0, "Slow connection gets no requests")
+        self.assertEqual(sum(conn.outstanding for conn in factory.pool), 30)
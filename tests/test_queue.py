@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C0301,W0105,W0401,W0614
+"""
+Tests for txtarantool.IproDeferredQueue
+"""
+from twisted.trial import unittest
+
+from txtarantool import IproDeferredQueue
+from txtarantool import QueueUnderflow
+
+
+class TestIproDeferredQueue(unittest.TestCase):
+    """
+    Tests for the table of requests waiting for reply
+    """
+
+    def setUp(self):
+        self.queue = IproDeferredQueue()
+
+    def test__put(self):
+        """
+        Test that reply is passed to the deferred of its request
+        """
+        ds = [self.queue.get() for i in xrange(10)]
+        ids = [d._ipro_request_id for d in ds]
+        self.assertEqual(len(set(ids)), 10, "Request ids are unique")
+        self.assertFalse(0 in ids, "Request id 0 is reserved for pings")
+        self.assertEqual(len(self.queue), 10)
+
+        self.queue.put(ids[3], "reply")
+        self.assertEqual(self.successResultOf(ds[3]), "reply")
+        self.assertFalse(self.queue.check_id(ids[3]), "Request is removed")
+        self.assertEqual(len(self.queue), 9)
+
+    def test__reused_slot(self):
+        """
+        Test that ids of the finished requests are not reused right away
+        """
+        d1 = self.queue.get()
+        self.queue.put(d1._ipro_request_id, None)
+        d2 = self.queue.get()
+
+        self.assertNotEqual(d2._ipro_request_id, d1._ipro_request_id)
+        self.assertFalse(self.queue.check_id(d1._ipro_request_id), "Late reply does not match the new request")
+        self.assertTrue(self.queue.peek(d2._ipro_request_id) is d2)
+
+    def test__cancel(self):
+        """
+        Test that cancelled request is removed
+        """
+        d = self.queue.get()
+        d.cancel()
+
+        self.assertFalse(self.queue.check_id(d._ipro_request_id))
+        self.assertTrue(self.queue.is_stale(d._ipro_request_id), "Late reply is recognized")
+        self.assertEqual(len(self.queue), 0)
+        self.failureResultOf(d)
+
+    def test__cancel_ping(self):
+        """
+        Test that reply to cancelled ping is not passed to the next one
+        """
+        ping = self.queue.get_ping()
+        ping.cancel()
+        self.failureResultOf(ping)
+        next_ping = self.queue.get_ping()
+
+        self.queue.put(0, "late")
+        self.assertNoResult(next_ping)
+        self.queue.put(0, "reply")
+        self.assertEqual(self.successResultOf(next_ping), "reply")
+        self.assertEqual(len(self.queue), 0)
+
+    def test__is_stale(self):
+        """
+        Test that only ids given out before are stale
+        """
+        d = self.queue.get()
+        self.assertFalse(self.queue.is_stale(d._ipro_request_id), "Waiting request is not stale")
+        self.queue.put(d._ipro_request_id, None)
+        self.assertTrue(self.queue.is_stale(d._ipro_request_id))
+        self.assertFalse(self.queue.is_stale(d._ipro_request_id + (1 << IproDeferredQueue.SLOT_BITS)),
+                         "Next generation of the slot is not given out yet")
+        self.assertFalse(self.queue.is_stale(d._ipro_request_id + 1), "Slot is not allocated yet")
+
+    def test__pings(self):
+        """
+        Test that pings are replied in order
+        """
+        pings = [self.queue.get_ping() for i in xrange(3)]
+        self.assertTrue(self.queue.check_id(0))
+        self.assertTrue(self.queue.peek(0) is None)
+        for i in xrange(3):
+            self.queue.put(0, i)
+        self.assertEqual([self.successResultOf(d) for d in pings], [0, 1, 2])
+
+    def test__broadcast(self):
+        """
+        Test that all the requests get the broadcasted object and are removed
+        """
+        ds = [self.queue.get() for i in xrange(1000)] + [self.queue.get_ping()]
+        for d in ds[::2]:
+            if d._ipro_request_id:
+                self.queue.put(d._ipro_request_id, "reply")
+
+        self.queue.broadcast("error")
+        self.assertEqual([self.successResultOf(d) for d in ds[1::2]], ["error"] * 500)
+        self.assertEqual(self.successResultOf(ds[-1]), "error")
+        self.assertEqual(len(self.queue), 0)
+
+    def test__backlog(self):
+        """
+        Test that no more than backlog requests can wait for reply
+        """
+        queue = IproDeferredQueue(backlog=2)
+        d = queue.get()
+        queue.get()
+        self.assertRaises(QueueUnderflow, queue.get)
+
+        queue.put(d._ipro_request_id, None)
+        queue.get()
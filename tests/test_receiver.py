@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C0301,W0105,W0401,W0614
+"""
+Tests for txtarantool.IprotoPacketReceiver
+"""
+import unittest
+
+from twisted.test import proto_helpers
+
+from txtarantool import IprotoPacketReceiver
+from txtarantool import struct_LLL
+
+
+def make_packet(request_id, body):
+    return struct_LLL.pack(17, len(body), request_id) + body
+
+
+class PacketCollector(IprotoPacketReceiver):
+
+    def __init__(self):
+        self.packets = []
+
+    def packetReceived(self, header, body):
+        self.packets.append((header, bytes(body)))
+
+
+class TestIprotoPacketReceiver(unittest.TestCase):
+    """
+    Tests for packet framing
+    """
+
+    def setUp(self):
+        self.receiver = PacketCollector()
+        self.transport = proto_helpers.StringTransport()
+        self.receiver.makeConnection(self.transport)
+
+    def test__coalesced_packets(self):
+        """
+        Test that every complete packet of a single read is dispatched
+        """
+        data = b''.join(make_packet(i, b"body%d" % i) for i in xrange(1, 51))
+        self.receiver.dataReceived(data)
+
+        self.assertEqual(len(self.receiver.packets), 50, "All coalesced packets dispatched")
+        self.assertEqual(self.receiver.packets[0], ((17, 5, 1), b"body1"))
+        self.assertEqual(self.receiver.packets[-1], ((17, 6, 50), b"body50"))
+
+    def test__fragmented_packets(self):
+        """
+        Test packets split at arbitrary positions
+        """
+        data = make_packet(1, b"AAA") + make_packet(2, b"") + make_packet(3, b"CCCCC")
+        for i in xrange(len(data)):
+            self.receiver.dataReceived(data[i:i + 1])
+
+        self.assertEqual(
+            self.receiver.packets,
+            [((17, 3, 1), b"AAA"), ((17, 0, 2), b""), ((17, 5, 3), b"CCCCC")],
+            "Packets reassembled from single byte reads"
+        )
+
+    def test__pause_resume(self):
+        """
+        Test that paused receiver stops dispatching and resumes where it left off
+        """
+        receiver = self.receiver
+
+        def pause_on_second(header, body):
+            PacketCollector.packetReceived(receiver, header, body)
+            if header[2] == 2:
+                receiver.pauseProducing()
+        receiver.packetReceived = pause_on_second
+
+        receiver.dataReceived(b''.join(make_packet(i, b"x") for i in xrange(1, 5)))
+        self.assertEqual([h[2] for h, _ in receiver.packets], [1, 2], "Dispatching stopped when paused")
+
+        receiver.resumeProducing()
+        self.assertEqual([h[2] for h, _ in receiver.packets], [1, 2, 3, 4], "Dispatching resumed")
+
+    def test__body_type(self):
+        """
+        Test that bodies are passed as bytes unless viewBodies is set
+        """
+        bodies = []
+        self.receiver.packetReceived = lambda header, body: bodies.append(body)
+        self.receiver.dataReceived(make_packet(1, b"AAAA"))
+        self.receiver.viewBodies = True
+        self.receiver.dataReceived(make_packet(2, b"BBBB"))
+
+        self.assertEqual([type(b) for b in bodies], [bytes, memoryview])
+        self.assertEqual(bodies[0], b"AAAA")
+
+    def test__retained_bodies(self):
+        """
+        Test that bodies handed out earlier are not affected by the following reads
+        """
+        bodies = []
+        self.receiver.viewBodies = True
+        self.receiver.packetReceived = lambda header, body: bodies.append(body)
+
+        data = make_packet(1, b"AAAA") + make_packet(2, b"BBBB")
+        self.receiver.dataReceived(data[:20])
+        self.receiver.dataReceived(data[20:24])
+        self.receiver.dataReceived(data[24:])
+
+        self.assertEqual([b.tobytes() for b in bodies], [b"AAAA", b"BBBB"], "Retained bodies are intact")
+
+    def test__buffer_compaction(self):
+        """
+        Test that consumed bytes are dropped from the receive buffer
+        """
+        receiver = self.receiver
+        body = b"x" * 1000
+        data = b''.join(make_packet(i, body) for i in xrange(1, 201))
+
+        # Leave an incomplete packet in the buffer after every read
+        chunk = len(data) // 7 + 3
+        for i in xrange(0, len(data), chunk):
+            receiver.dataReceived(data[i:i + chunk])
+            self.assertTrue(receiver._offset < receiver.COMPACT_THRESHOLD + len(data[i:i + chunk]))
+
+        self.assertEqual(len(receiver.packets), 200, "All packets dispatched")
+        self.assertEqual(len(receiver._buffer), 0, "Buffer is empty")
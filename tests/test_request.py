@@ -11,7 +11,12 @@ from txtarantool import Request
 from txtarantool import RequestInsert
 from txtarantool import RequestDelete
 from txtarantool import RequestSelect
+from txtarantool import RequestSelectMany
 from txtarantool import RequestUpdate
+from txtarantool import RequestCall
+from txtarantool import PreparedRequestsMixin
+from txtarantool import InvalidData
+from txtarantool import struct_L
 
 import config
 
@@ -82,6 +87,31 @@ class TestRequestSelect(unittest.TestCase):
         )
 
 
+class TestRequestSelectMany(unittest.TestCase):
+
+    def test__cast_to_bytes(self):
+        """
+        Test binary SELECT request with multiple keys representation
+        """
+
+        # select * from t1 where k0 in (1, "AAA")
+        self.assertEqual(
+            bytes(RequestSelectMany(charset, errors, 0, 1, 0, 0, 0xffff, [1, (b"AAA",)])),
+            binascii.unhexlify("110000002500000000000000"    # header
+                               "010000000000000000000000ffff0000"    # space_no, index_no, offset, limit
+                               "02000000"    # count
+                               "010000000401000000"    # (1,)
+                               "0100000003414141"),    # ("AAA",)
+            "Select using two keys"
+        )
+
+        self.assertEqual(
+            bytes(RequestSelectMany(charset, errors, 0, 1, 0, 0, 0xffff, [(1, 2)])),
+            bytes(RequestSelect(charset, errors, 0, 1, 0, 0, 0xffff, 1, 2)),
+            "Select using single key is the same as RequestSelect"
+        )
+
+
 class TestRequestUpdate(unittest.TestCase):
 
     def test__cast_to_bytes(self):
@@ -237,3 +267,76 @@ class TestRequestUpdate(unittest.TestCase):
             "Update: OR single integer value using an integer key"
         )
 
+
+class TestPackTuple(unittest.TestCase):
+
+    def test__pack_tuple(self):
+        """
+        Test that tuples of different types are packed field by field
+        """
+        request = Request(charset, errors)
+        for values in [(), [1], (1, 2L, b"AAA", 3, 4, u"Тест", b""), (b"A" * 20000, True), tuple(xrange(20))]:
+            self.assertEqual(
+                request.pack_tuple(values),
+                struct_L.pack(len(values)) + b"".join(request.pack_field(v) for v in values),
+                "Pack %r" % (values,)
+            )
+
+    def test__invalid(self):
+        """
+        Test that packing errors are the same as of pack_field
+        """
+        request = Request("ascii", "strict")
+        self.assertRaises(TypeError, request.pack_tuple, (1, 1.5))
+        self.assertRaises(InvalidData, request.pack_tuple, (1, u"Тест"))
+
+
+class TestPreparedRequest(unittest.TestCase):
+
+    def setUp(self):
+        self.preparer = PreparedRequestsMixin()
+        self.preparer.charset = charset
+        self.preparer.errors = errors
+
+    def test__same_as_request(self):
+        """
+        Test that prepared requests are packed the same way as the requests
+        """
+        preparer = self.preparer
+
+        self.assertEqual(
+            preparer.prepare_select(1, 0, 0, 0xffff).packet(7, (1, 2)),
+            bytes(RequestSelect(charset, errors, 7, 1, 0, 0, 0xffff, 1, 2)),
+            "Prepared select"
+        )
+        self.assertEqual(
+            preparer.prepare_insert(1).packet(7, (b"AAA", 2000, u"Тест")),
+            bytes(RequestInsert(charset, errors, 7, 1, Request.TNT_FLAG_ADD, b"AAA", 2000, u"Тест")),
+            "Prepared insert"
+        )
+        self.assertEqual(
+            preparer.prepare_delete(1, Request.TNT_FLAG_RETURN).packet(7, (b"AAA",)),
+            bytes(RequestDelete(charset, errors, 7, 1, Request.TNT_FLAG_RETURN, b"AAA")),
+            "Prepared delete"
+        )
+        self.assertEqual(
+            preparer.prepare_update(0x11).packet(7, ((0x22,), [(0x33, '+', 0x55), (0x44, '=', b"NNN")])),
+            bytes(RequestUpdate(charset, errors, 7, 0x11, 0, (0x22,), [(0x33, '+', 0x55), (0x44, '=', b"NNN")])),
+            "Prepared update"
+        )
+        self.assertEqual(
+            preparer.prepare_call(b"box.select_range").packet(7, (b"0", b"0", b"100")),
+            bytes(RequestCall(charset, errors, 7, b"box.select_range", 0, b"0", b"0", b"100")),
+            "Prepared call"
+        )
+
+    def test__reuse(self):
+        """
+        Test that the prepared request can be packed with different arguments and ids
+        """
+        request = self.preparer.prepare_select(1, 0)
+        for request_id, key in ((1, b"AAA"), (2, 2000), (3, b"B" * 300)):
+            self.assertEqual(
+                request.packet(request_id, (key,)),
+                bytes(RequestSelect(charset, errors, request_id, 1, 0, 0, 0xffffffff, key))
+            )
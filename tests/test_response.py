@@ -4,7 +4,11 @@
 Tests for txtarantool.response module
 """
 import binascii
+import gc
 import unittest
+import weakref
+
+import txtarantool
 
 from_hex = lambda x: binascii.unhexlify(''.join(x.split()))
 to_hex = lambda x: binascii.hexlify(x)
@@ -15,7 +19,16 @@ charset = config.charset
 errors = config.errors
 
 from txtarantool import field
+from txtarantool import fieldview
+from txtarantool import get_tuple_decoder
 from txtarantool import Response
+from txtarantool import LazyResponse
+from txtarantool import ZeroCopyResponse
+from txtarantool import ColumnarResponse
+from txtarantool import InvalidData
+from txtarantool import record_class
+from txtarantool import ResponseDecoder
+from txtarantool import TarantoolError
 
 
 class TestField(unittest.TestCase):
@@ -132,11 +145,127 @@ class TestField(unittest.TestCase):
         self.assertRaises(ValueError, long, f)
 
 
+class TestFieldView(unittest.TestCase):
+    """
+    Tests for response.fieldview class
+    """
+
+    buff = b"xx" + b"\x44\x33\x22\x11" + b"\x88\x77\x66\x55\x44\x33\x22\x11" + b"JKLMN"
+
+    def test__compare(self):
+        """
+        Test fieldview comparison and hashing
+        """
+        f = fieldview(self.buff, 14, 5)
+
+        self.assertEqual(len(f), 5)
+        self.assertEqual(f, b"JKLMN", "Compare with bytes")
+        self.assertEqual(f, field(b"JKLMN"), "Compare with field")
+        self.assertEqual(f, fieldview(b"JKLMN", 0, 5), "Compare with fieldview")
+        self.assertNotEqual(f, b"JKLM", "Compare with shorter bytes")
+        self.assertEqual(hash(f), hash(b"JKLMN"), "Hash is equal to the hash of bytes")
+        self.assertEqual({b"JKLMN": 1}[f], 1, "Look up dict with bytes keys")
+
+    def test__convert(self):
+        """
+        Test fieldview type casting
+        """
+        self.assertEqual(bytes(fieldview(self.buff, 14, 5)), b"JKLMN", "Cast fieldview to bytes")
+        self.assertEqual(fieldview(self.buff, 14, 5).view.tobytes(), b"JKLMN", "Get memoryview of fieldview")
+        self.assertEqual(int(fieldview(self.buff, 2, 4)), 0x11223344, "Cast fieldview to int")
+        self.assertEqual(long(fieldview(self.buff, 6, 8)), 0x1122334455667788, "Cast fieldview to long")
+        self.assertRaises(ValueError, int, fieldview(self.buff, 14, 5))
+        self.assertRaises(ValueError, long, fieldview(self.buff, 2, 4))
+
+
+class TestTupleDecoder(unittest.TestCase):
+    """
+    Tests for compiled tuple decoders
+    """
+
+    # tuple = (1, "JKLMN", u"Тест", 0x1122334455667788, "Z"), prefixed with garbage
+    buff = from_hex(
+        "ffff"
+        "05000000"
+        "04 01000000" "05 4a4b4c4d4e" "08 d0a2d0b5d181d182" "08 8877665544332211" "01 5a"
+    )
+
+    def test__cast(self):
+        """
+        Test decoding of the tuple fields to the given types
+        """
+        decode = get_tuple_decoder((int, str, unicode, long, any), charset, errors)
+        self.assertEqual(
+            decode(self.buff, 2),
+            (1, b"JKLMN", u"\u0422\u0435\u0441\u0442", 0x1122334455667788, b"Z")
+        )
+        self.assertTrue(isinstance(decode(self.buff, 2)[4], field), "Field is kept as is for 'any' type")
+        self.assertTrue(get_tuple_decoder([int, str, unicode, long, any], charset, errors) is decode,
+                        "Decoder is cached by field types")
+
+    def test__last_type_repeated(self):
+        """
+        Test that the last type is used for the remaining fields
+        """
+        self.assertEqual(get_tuple_decoder((int, str), charset, errors)(self.buff, 2)[1:],
+                         (b"JKLMN", b"\xd0\xa2\xd0\xb5\xd1\x81\xd1\x82", b"\x88\x77\x66\x55\x44\x33\x22\x11", b"Z"))
+        self.assertEqual(get_tuple_decoder((int, str, unicode, long, any, int, int), charset, errors)(self.buff, 2)[0], 1,
+                         "Tuple may be shorter than field types")
+        self.assertEqual(get_tuple_decoder(None, charset, errors)(self.buff, 2),
+                         (field(1), b"JKLMN", b"\xd0\xa2\xd0\xb5\xd1\x81\xd1\x82", field(0x1122334455667788), b"Z"),
+                         "Raw fields")
+
+    def test__long_fields(self):
+        """
+        Test fields with multibyte length prefixes
+        """
+        values = (b"a" * 200, b"b" * 20000, b"c")
+        buff = txtarantool.struct_L.pack(3) + b"".join(txtarantool.Request.pack_str(v) for v in values)
+        self.assertEqual(get_tuple_decoder((str,), charset, errors)(buff, 0), values)
+        self.assertEqual(get_tuple_decoder((str,), charset, errors, zero_copy=True)(memoryview(buff), 0), values)
+
+    def test__invalid(self):
+        """
+        Test decoding errors
+        """
+        self.assertRaises(ValueError, get_tuple_decoder((int, int), charset, errors), self.buff, 2)
+        self.assertRaises(ValueError, get_tuple_decoder((int, str, unicode, int), charset, errors), self.buff, 2)
+        self.assertRaises(TypeError, get_tuple_decoder, (int, float), charset, errors)
+        self.assertRaises(InvalidData, get_tuple_decoder((int, str, unicode), "ascii", errors), self.buff, 2)
+
+    def test__malformed(self):
+        """
+        Test that truncated fields and length prefixes raise InvalidData
+        """
+        truncated_field = from_hex("02000000" "04 01000000" "0a 616263")
+        truncated_length = from_hex("02000000" "04 01000000" "81")
+        missing_field = from_hex("02000000" "04 01000000")
+        for buff in (truncated_field, truncated_length, missing_field):
+            for field_types in ((str,), (int, str), None):
+                self.assertRaises(InvalidData, get_tuple_decoder(field_types, charset, errors), buff, 0)
+            self.assertRaises(InvalidData, get_tuple_decoder((str,), charset, errors, zero_copy=True), memoryview(buff), 0)
+            self.assertRaises(InvalidData, get_tuple_decoder((str,), charset, errors, zero_copy=True), buff, 0)
+        self.assertRaises(InvalidData, get_tuple_decoder((str,), charset, errors), from_hex("0100"), 0)
+
+
 class TestResponse(unittest.TestCase):
     """
     Tests for response.Response
     """
 
+    def test__unpack_int_base128(self):
+        """
+        Test base 128 decoding of the values of different length in bytes and memoryview
+        """
+        for value in (0, 1, 127, 128, 300, 16383, 16384, 2097151, 2097152, 0xffffffff):
+            packed = b"\xff" + txtarantool.Request.pack_int_base128(value) + b"\xff"
+            for buff in (packed, memoryview(packed)):
+                self.assertEqual(
+                    Response._unpack_int_base128(buff, 1),
+                    (value, len(packed) - 1),
+                    "Unpack %d from %s" % (value, type(buff).__name__)
+                )
+
     def test__init_single(self):
         """
         Test Response instance creation: unpack single record
@@ -209,3 +338,266 @@ class TestResponse(unittest.TestCase):
         self.assertEqual(r.rowcount, 1, "Check rowcount property")
         self.assertEqual(r._body_length, 20, "Check _body_length attribute")
         self.assertEqual(r._request_id, 0x44332211, "Check _request_id attribute")
+
+    def test__init_from_memoryview(self):
+        """
+        Test Response instance creation from a memoryview of the receive buffer
+        """
+        header = from_hex("0d00000014000000 11223344")
+        body = bytearray(from_hex("00000000010000000400000002000000014b015a"))
+        r = Response(header, memoryview(body))
+
+        self.assertEqual(r, [(b"K", b"Z")], "Unpack body from memoryview")
+
+        header = from_hex("0d0000000e000000 11223344")
+        body = bytearray(from_hex("02020000") + b"Some error\x00")
+        with self.assertRaises(TarantoolError) as cm:
+            Response(header, memoryview(body))
+
+        self.assertEqual(cm.exception.args, (2, u"Some error"), "Unpack error message from memoryview")
+
+
+class TestResponseDecoder(unittest.TestCase):
+    """
+    Tests for response.ResponseDecoder
+    """
+
+    def test__feed_by_parts(self):
+        """
+        Test that tuples are decoded as soon as all their bytes are fed
+        """
+        header = (0x11, 0x51, 0)
+        body = from_hex(
+            "00000000" "03000000"
+            "10000000" "02000000" "04 01000000" + "0a 31313131313131313131"
+            "10000000" "02000000" "04 02000000" + "0a 32323232323232323232"
+            "11000000" "04000000" "04 03000000" + "03 4c4c4c" + "03 4d4d4d" + "03 4e4e4e"
+        )
+        rows = []
+        decoder = ResponseDecoder(header, charset, errors, None, rows.append)
+
+        pending = b''
+        for i in xrange(0, len(body), 5):
+            pending += body[i:i + 5]
+            consumed = decoder.feed(memoryview(pending))
+            pending = pending[consumed:]
+            if i + 5 < 32:
+                self.assertEqual(rows, [], "Tuple is not decoded until it is fed entirely")
+
+        self.assertTrue(decoder.finished)
+        self.assertEqual(pending, b'')
+        self.assertEqual(decoder.response.rowcount, 3)
+        self.assertEqual(
+            rows,
+            [(b"\x01\x00\x00\x00", b"1111111111"),
+             (b"\x02\x00\x00\x00", b"2222222222"),
+             (b"\x03\x00\x00\x00", b"LLL", b"MMM", b"NNN")],
+            "Decode tuples fed by parts"
+        )
+
+
+class TestLazyResponse(unittest.TestCase):
+    """
+    Tests for response.LazyResponse
+    """
+
+    header = from_hex("11000000 51000000 00000000")
+    body = from_hex(
+        "00000000" "03000000"
+        "10000000" "02000000" "04 01000000" + "0a 31313131313131313131"
+        "10000000" "02000000" "04 02000000" + "0a 32323232323232323232"
+        "11000000" "04000000" "04 03000000" + "03 4c4c4c" + "03 4d4d4d" + "03 4e4e4e"
+    )
+    rows = [(b"\x01\x00\x00\x00", b"1111111111"),
+            (b"\x02\x00\x00\x00", b"2222222222"),
+            (b"\x03\x00\x00\x00", b"LLL", b"MMM", b"NNN")]
+
+    def test__decode_on_access(self):
+        """
+        Test that tuples are decoded only when they are accessed
+        """
+        r = LazyResponse(self.header, self.body)
+
+        self.assertEqual(len(r), 3, "Length is known before decoding")
+        self.assertEqual(r._pending, 3, "Nothing is decoded on receipt")
+
+        self.assertEqual(r[1], self.rows[1], "Decode tuple by index")
+        self.assertEqual(r[-1], self.rows[2], "Decode tuple by negative index")
+        self.assertEqual(r._pending, 1, "Only accessed tuples are decoded")
+        self.assertTrue(r[1] is r[1], "Decoded tuple is cached")
+
+        self.assertEqual(r[:2], self.rows[:2], "Decode tuples by slice")
+        self.assertEqual(r._pending, 0)
+        self.assertEqual(r._buff, None, "Body is released after all the tuples are decoded")
+
+    def test__list_compatibility(self):
+        """
+        Test that LazyResponse behaves as a list of tuples
+        """
+        self.assertEqual(list(LazyResponse(self.header, self.body)), self.rows, "Iterate")
+        self.assertEqual(LazyResponse(self.header, self.body), self.rows, "Compare")
+        self.assertEqual(self.rows, LazyResponse(self.header, self.body), "Compare reflected")
+        self.assertEqual(repr(LazyResponse(self.header, self.body)), repr(self.rows), "Represent")
+        self.assertTrue(self.rows[2] in LazyResponse(self.header, self.body), "Contains")
+        self.assertEqual(list(reversed(LazyResponse(self.header, self.body))), self.rows[::-1], "Reverse")
+
+        r = LazyResponse(self.header, self.body)
+        r.sort(reverse=True)
+        self.assertEqual(r, sorted(self.rows, reverse=True), "Sort")
+
+        self.assertTrue(LazyResponse(self.header, self.body) == LazyResponse(self.header, self.body), "Compare lazy")
+        self.assertEqual(LazyResponse(self.header, self.body) + LazyResponse(self.header, self.body),
+                         self.rows + self.rows, "Concatenate lazy")
+        self.assertEqual([(0,)] + LazyResponse(self.header, self.body), [(0,)] + self.rows, "Concatenate reflected")
+
+    def test__field_types(self):
+        """
+        Test that tuples are casted on access
+        """
+        r = LazyResponse(self.header, self.body, charset, errors, (int, str))
+        self.assertEqual(r[0], (1, b"1111111111"))
+        self.assertEqual(r[2], (3, b"LLL", b"MMM", b"NNN"))
+
+
+class TestZeroCopyResponse(unittest.TestCase):
+    """
+    Tests for response.ZeroCopyResponse
+    """
+
+    def test__init_multiple(self):
+        """
+        Test that fields reference the body
+        """
+        header = from_hex("11000000 2c000000 00000000")
+        body = bytearray(from_hex(
+            "00000000" "02000000"
+            "0b000000" "02000000" "04 01000000" + "05 4a4b4c4d4e"
+            "0b000000" "02000000" "04 02000000" + "05 4f50515253"
+        ))
+        r = ZeroCopyResponse(header, memoryview(body))
+
+        self.assertEqual(r, [(b"\x01\x00\x00\x00", b"JKLMN"), (b"\x02\x00\x00\x00", b"OPQRS")])
+        self.assertTrue(isinstance(r[0][1], fieldview), "Field is not copied")
+
+        r = ZeroCopyResponse(header, memoryview(body), charset, errors, (int, any))
+        self.assertEqual(r[1][0], 2, "Cast zero-copy field to int")
+        self.assertTrue(isinstance(r[1][1], fieldview), "Field is not copied")
+
+
+class TestColumnarResponse(unittest.TestCase):
+    """
+    Tests for response.ColumnarResponse
+    """
+
+    header = from_hex("11000000 4a000000 00000000")
+    # Tuples of the same layout
+    body_fixed = from_hex(
+        "00000000" "03000000"
+        "0e000000" "03000000" "04 01000000" + "03 414141" + "04 0a000000"
+        "0e000000" "03000000" "04 02000000" + "03 424242" + "04 14000000"
+        "0e000000" "03000000" "04 03000000" + "03 434343" + "04 1e000000"
+    )
+    # Tuples of different layouts
+    body_variable = from_hex(
+        "00000000" "03000000"
+        "0e000000" "03000000" "04 01000000" + "03 414141" + "04 0a000000"
+        "0d000000" "03000000" "04 02000000" + "02 4242" + "04 14000000"
+        "0f000000" "03000000" "04 03000000" + "04 43434343" + "04 1e000000"
+    )
+
+    def check_columns(self, body, strings):
+        r = ColumnarResponse(self.header, body, charset, errors, (int, str, int))
+
+        self.assertEqual(len(r), 3, "Response contains columns")
+        self.assertEqual(r.rowcount, 3)
+        self.assertEqual(list(r[0]), [1, 2, 3], "Integer column")
+        self.assertEqual(r[1], strings, "String column")
+        self.assertEqual(list(r[2]), [10, 20, 30], "Integer column")
+        return r
+
+    def test__columns(self):
+        """
+        Test columnar representation of the tuples
+        """
+        r = self.check_columns(self.body_fixed, [b"AAA", b"BBB", b"CCC"])
+        if txtarantool.numpy is not None:
+            self.assertTrue(isinstance(r[0], txtarantool.numpy.ndarray), "Tuples of the same layout are viewed by numpy")
+
+        r = self.check_columns(self.body_variable, [b"AAA", b"BB", b"CCCC"])
+        self.assertTrue(isinstance(r[0], txtarantool.array.array), "Tuples of different layouts are decoded to arrays")
+
+    def test__columns_without_numpy(self):
+        """
+        Test columnar representation of the tuples if numpy is not available
+        """
+        numpy, txtarantool.numpy = txtarantool.numpy, None
+        try:
+            r = self.check_columns(self.body_fixed, [b"AAA", b"BBB", b"CCC"])
+            self.assertTrue(isinstance(r[0], txtarantool.array.array), "Integer columns are arrays")
+        finally:
+            txtarantool.numpy = numpy
+
+    def test__raw_columns(self):
+        """
+        Test columns of raw fields
+        """
+        r = ColumnarResponse(self.header, self.body_variable)
+        self.assertEqual(r[1], [b"AAA", b"BB", b"CCCC"])
+        self.assertEqual(r[2], [field(10), field(20), field(30)])
+
+
+class TestRecord(unittest.TestCase):
+    """
+    Tests for records generated by record_class()
+    """
+
+    User = record_class("User", [("id", int), ("name", str), ("tags", unicode)])
+
+    header = from_hex("11000000 2c000000 00000000")
+    body = from_hex(
+        "00000000" "02000000"
+        "0c000000" "03000000" "04 01000000" + "03 414141" + "02 6161"
+        "08000000" "02000000" "04 02000000" + "02 4242"
+    )
+
+    def test__record(self):
+        """
+        Test record behaviour
+        """
+        u = self.User(1, "AAA", u"aa")
+
+        self.assertEqual((u.id, u.name, u.tags), (1, "AAA", u"aa"), "Named access")
+        self.assertEqual((u[0], u[-1], u[:2]), (1, u"aa", (1, "AAA")), "Access by index")
+        self.assertEqual(u, (1, "AAA", u"aa"), "Compare with tuple")
+        self.assertEqual(len(u), 3)
+        self.assertEqual(repr(u), "User(id=1, name='AAA', tags=u'aa')")
+        self.assertFalse(hasattr(u, "__dict__"), "Fields are kept in slots")
+        self.assertRaises(ValueError, record_class, "Bad", [("_id", int)])
+        self.assertRaises(ValueError, record_class, "Bad", [("id", int), ("id", str)])
+
+    def test__decode_records(self):
+        """
+        Test that Response decodes tuples right into records
+        """
+        r = Response(self.header, self.body, charset, errors, self.User)
+
+        self.assertTrue(isinstance(r[0], self.User))
+        self.assertEqual(r, [(1, "AAA", u"aa"), (2, "BB", None)], "Missing fields are None")
+        self.assertEqual(r[0].tags, u"aa")
+
+        self.assertRaises(InvalidData, Response, self.header, self.body, charset, errors,
+                          record_class("Short", [("id", int), ("name", str)]))
+
+    def test__decoder_released(self):
+        """
+        Test that decoder of the record class does not keep the class alive
+        """
+        Temp = record_class("Temp", [("id", int)])
+        decode = get_tuple_decoder(Temp, charset, errors)
+        self.assertTrue(get_tuple_decoder(Temp, charset, errors) is decode, "Decoder is cached by the class")
+        self.assertEqual(decode(from_hex("01000000" "04 01000000"), 0), Temp(1))
+
+        ref = weakref.ref(Temp)
+        del Temp, decode
+        gc.collect()
+        self.assertTrue(ref() is None, "Record class is collected")
@@ -30,16 +30,36 @@
 # THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
 
+import array
+import bisect
+import hashlib
+import heapq
+import keyword
+import math
+import random
+import re
 import struct
+import sys
 import itertools
+import zlib
 from collections import deque
+from operator import itemgetter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from zope.interface import implementer
 
 from twisted.internet import defer
+from twisted.internet import interfaces
 from twisted.internet import protocol
 from twisted.internet import reactor
 from twisted.internet import task
 from twisted.protocols import basic
 from twisted.protocols import policies
+from twisted.python import failure
 from twisted.python import log
 
 
@@ -55,6 +75,10 @@ class InvalidData(TarantoolError):
     pass
 
 
+class TimeoutError(TarantoolError):
+    pass
+
+
 struct_B = struct.Struct('<B')
 struct_BB = struct.Struct('<BB')
 struct_BBB = struct.Struct('<BBB')
@@ -264,9 +288,87 @@ class Request(object):
         :rtype: bytes
         """
         assert isinstance(values, (tuple, list))
-        cardinality = [struct_L.pack(len(values))]
-        packed_items = [self.pack_field(v) for v in values]
-        return b''.join(itertools.chain(cardinality, packed_items))
+        signature = tuple(map(type, values))
+        try:
+            pack = _tuple_packers[signature]
+        except KeyError:
+            if len(_tuple_packers) >= _TUPLE_PACKERS_MAX:
+                _tuple_packers.clear()
+            pack = _tuple_packers[signature] = _compile_tuple_packer(signature)
+        return pack(self, values)
+
+
+_tuple_packers = {}
+
+# Tuple packers are compiled per type signature, the cache is dropped when it grows too large
+_TUPLE_PACKERS_MAX = 1024
+
+
+def _encode_field(value, charset, errors):
+    try:
+        return value.encode(charset, errors)
+    except UnicodeEncodeError as e:
+        raise InvalidData("Error encoding unicode value '%s': %s" % (repr(value), e))
+
+
+def _compile_tuple_packer(signature):
+    """
+    Generate the function packing <tuple> of values of the given types.
+
+    Adjacent int and long fields are packed together with the cardinality
+    by a single precompiled struct, str and unicode values are joined with
+    their varint lengths as is, so the result is built by a single join.
+    Values of the other types are packed by Request.pack_field.
+    """
+    if not signature:
+        return lambda request, values: struct_L.pack(0)
+
+    names = ["v%d" % i for i in xrange(len(signature))]
+    lines = [
+        "def pack_tuple(request, values):",
+        "    %s, = values" % ", ".join(names),
+    ]
+    namespace = {
+        "int_base128": Request._int_base128,
+        "pack_int_base128": Request.pack_int_base128,
+        "encode": _encode_field,
+    }
+    parts = []
+    fmt, args = ["<", "L"], [str(len(signature))]
+
+    def flush_struct():
+        if args:
+            struct_name = "struct_%d" % len(parts)
+            namespace[struct_name] = struct.Struct("".join(fmt))
+            parts.append("%s.pack(%s)" % (struct_name, ", ".join(args)))
+            del fmt[1:], args[:]
+
+    for name, value_type in zip(names, signature):
+        if value_type is int:
+            fmt.append("BL")
+            args.extend(("4", name))
+        elif value_type is long:
+            fmt.append("BQ")
+            args.extend(("8", name))
+        elif value_type is str or value_type is unicode:
+            flush_struct()
+            if value_type is unicode:
+                lines.append("    %s = encode(%s, request.charset, request.errors)" % (name, name))
+            lines.append("    size_%s = len(%s)" % (name, name))
+            parts.append("int_base128[size_%s] if size_%s < 0x4000 else pack_int_base128(size_%s)" % (name, name, name))
+            parts.append(name)
+        else:
+            flush_struct()
+            parts.append("request.pack_field(%s)" % name)
+    flush_struct()
+
+    if len(parts) == 1:
+        lines.append("    return %s" % parts[0])
+    else:
+        lines.append("    return b''.join((%s))" % ", ".join("(%s)" % part for part in parts))
+
+    exec "\n".join(lines) in namespace
+    return namespace["pack_tuple"]
 
 
 class RequestPing(Request):
@@ -332,6 +434,23 @@ class RequestSelect(Request):
         self._bytes = self.header(self.TNT_OP_SELECT, len(request_body), request_id) + request_body
 
 
+class RequestSelectMany(Request):
+    """
+    Represents SELECT request with multiple keys
+
+    <select_request_body> ::= <space_no><index_no><offset><limit><count><tuple>+
+
+    The same as RequestSelect, but <count> keys are packed, every key is a tuple
+    of values or a single value.
+    """
+    def __init__(self, charset, errors, request_id, space_no, index_no, offset, limit, keys):
+        super(RequestSelectMany, self).__init__(charset, errors)
+        parts = [struct_LLLLL.pack(space_no, index_no, offset, limit, len(keys))]
+        parts.extend(self.pack_tuple(key if isinstance(key, (tuple, list)) else (key,)) for key in keys)
+        request_body = b''.join(parts)
+        self._bytes = self.header(self.TNT_OP_SELECT, len(request_body), request_id) + request_body
+
+
 class RequestUpdate(Request):
     """
     <update_request_body> ::= <space_no><flags><tuple><count><operation>+
@@ -382,62 +501,289 @@ class RequestCall(Request):
         self._bytes = self.header(self.TNT_OP_CALL, len(request_body), request_id) + request_body
 
 
+class PreparedRequest(Request):
+    """
+    Request template: the constant part of the body (space, index, flags, procedure name, etc.)
+    is packed once, the header and the tuple are packed for every request and joined with it at once.
+
+    Created by the prepare_* methods of the connection and sent by its execute() method.
+    """
+    def __init__(self, charset, errors, request_type, prefix):
+        """
+        :param request_type: TNT_OP_* code of the request
+        :type request_type: int
+        :param prefix: packed constant beginning of the request body
+        :type prefix: bytes
+        """
+        super(PreparedRequest, self).__init__(charset, errors)
+        self.request_type = request_type
+        self.prefix = prefix
+
+    def pack_args(self, args):
+        """
+        Pack the variable part of the request body
+
+        :return: list of packed parts of the body
+        :rtype: list of bytes
+        """
+        return [self.pack_tuple(args)]
+
+    def packet(self, request_id, args):
+        """
+        Build binary packet of the request
+
+        :param request_id: id of the request
+        :type request_id: int
+        :param args: arguments of the request, e.g. key tuple of the select
+        :type args: tuple
+
+        :return: packed request
+        :rtype: bytes
+        """
+        # The body is a single tuple, its packer is looked up right away
+        try:
+            body = _tuple_packers[tuple(map(type, args))](self, args)
+        except KeyError:
+            body = self.pack_tuple(args)
+        return b''.join((struct_LLL.pack(self.request_type, len(self.prefix) + len(body), request_id),
+                         self.prefix, body))
+
+    def __repr__(self):
+        return "<%s: %s>" % (self.__class__.__name__, self.prefix.encode("hex"))
+
+
+class PreparedUpdate(PreparedRequest):
+    """
+    Prepared UPDATE request, arguments are (key_tuple, op_list)
+    """
+    pack_operations = RequestUpdate.__dict__["pack_operations"]
+
+    def packet(self, request_id, args):
+        parts = self.pack_args(args)
+        body_length = len(self.prefix)
+        for part in parts:
+            body_length += len(part)
+        parts[0:0] = (struct_LLL.pack(self.request_type, body_length, request_id), self.prefix)
+        return b''.join(parts)
+
+    def pack_args(self, args):
+        key_tuple, op_list = args
+        parts = PreparedRequest.pack_args(self, key_tuple)
+        parts.append(struct_L.pack(len(op_list)))
+        parts.append(self.pack_operations(op_list))
+        return parts
+
+
+class PreparedRequestsMixin(object):
+    """
+    prepare_* methods creating request templates for execute()
+    """
+    charset = "utf-8"
+    errors = "strict"
+
+    def prepare_select(self, space_no, index_no, offset=0, limit=0xffffffff):
+        """
+        prepare select, execute() arguments are the key values
+        """
+        return PreparedRequest(self.charset, self.errors, Request.TNT_OP_SELECT,
+                               struct_LLLLL.pack(space_no, index_no, offset, limit, 1))
+
+    def prepare_insert(self, space_no, flags=Request.TNT_FLAG_ADD):
+        """
+        prepare insert (replace with flags=0, replace_req with flags=Request.TNT_FLAG_REPLACE,
+        add Request.TNT_FLAG_RETURN to get the tuple back), execute() arguments are the tuple values
+        """
+        return PreparedRequest(self.charset, self.errors, Request.TNT_OP_INSERT, struct_LL.pack(space_no, flags))
+
+    def prepare_delete(self, space_no, flags=0):
+        """
+        prepare delete, execute() arguments are the primary key values
+        """
+        return PreparedRequest(self.charset, self.errors, Request.TNT_OP_DELETE, struct_LL.pack(space_no, flags))
+
+    def prepare_update(self, space_no, flags=0):
+        """
+        prepare update, execute() arguments are key_tuple and op_list
+        """
+        return PreparedUpdate(self.charset, self.errors, Request.TNT_OP_UPDATE, struct_LL.pack(space_no, flags))
+
+    def prepare_call(self, proc_name, flags=0):
+        """
+        prepare call of the server procedure, execute() arguments are the procedure arguments
+        """
+        packer = Request(self.charset, self.errors)
+        return PreparedRequest(self.charset, self.errors, Request.TNT_OP_CALL,
+                               struct_L.pack(flags) + packer.pack_field(proc_name))
+
+
 class IprotoPacketReceiver(protocol.Protocol, basic._PauseableMixin):
+    """
+    Splits the byte stream into Iproto packets.
+
+    Received data is appended to a single bytearray, ``_offset`` points to the first
+    unconsumed byte. Packet bodies are copied out as bytes, or handed out as memoryview
+    slices of that buffer if ``viewBodies`` is set. The bytes which were already handed
+    out are never modified in place: the buffer is compacted by copying the unconsumed
+    tail into a new bytearray.
+    """
 
     _header_size = 12
     _busyReceiving = False
     _header = None  # (type, body_length, request_id)
     _buffer = None
-    _length = 0
+    _offset = 0
+    _streaming = False
+    _streamRemaining = 0
 
     MAX_BODY = 16 * 1024
 
+    # Pass packet bodies to packetReceived() and packetLengthExceeded() as memoryview
+    # slices of the receive buffer instead of bytes
+    viewBodies = False
+
+    # Consumed bytes are dropped only when there are at least that many of them
+    # and they take more than a half of the buffer, so every byte is copied O(1) times
+    COMPACT_THRESHOLD = 64 * 1024
+
     def clearPacketBuffer(self):
-        b = b''.join(self._buffer)
+        b = bytes(self._buffer[self._offset:]) if self._buffer is not None else b''
 
         if self._header:
             b = struct_LLL.pack(*self._header) + b
 
         self._header = None
         self._buffer = None
-        self._length = 0
+        self._offset = 0
+        self._streaming = False
+        self._streamRemaining = 0
 
         return b
 
+    def _compactBuffer(self):
+        self._buffer = self._buffer[self._offset:]
+        self._offset = 0
+
+    def _body(self, start, end=None):
+        view = memoryview(self._buffer)[start:end]
+        return view if self.viewBodies else view.tobytes()
+
     def dataReceived(self, data):
         if self._buffer is None:
-            self._buffer = []
+            self._buffer = bytearray()
 
-        self._buffer.append(data)
-        self._length += len(data)
+        try:
+            self._buffer.extend(data)
+        except BufferError:
+            # Buffer can't be resized while packet bodies handed out earlier are still referenced
+            self._compactBuffer()
+            self._buffer.extend(data)
+
+        # packetReceived() may pause us or feed more data (e.g. resumeProducing()),
+        # in this case the outer loop will pick it up
+        if self._busyReceiving:
+            return
 
-        if self._header is None:
-            if self._length < self._header_size:
-                return
+        self._busyReceiving = True
+        try:
+            while not self.paused and not self.transport.disconnecting:
+                available = len(self._buffer) - self._offset
+
+                if self._header is None:
+                    if available < self._header_size:
+                        break
+
+                    self._header = struct_LLL.unpack_from(self._buffer, self._offset)
+                    self._offset += self._header_size
+                    available -= self._header_size
+
+                body_length = self._header[1]
+                if body_length > self.MAX_BODY and not self._streaming:
+                    if not self.packetStreamStarted(self._header):
+                        return self.packetLengthExceeded(self._header, self._body(self._offset))
+                    self._streaming = True
+                    self._streamRemaining = body_length
+
+                if self._streaming:
+                    header = self._header
+                    size = min(available, self._streamRemaining)
+                    consumed = self.packetStreamReceived(header, memoryview(self._buffer)[self._offset:self._offset + size])
+                    if consumed < size == self._streamRemaining:
+                        # The whole rest of the body has been offered, but it wasn't consumed
+                        return self.transport.loseConnection()
+
+                    self._offset += consumed
+                    self._streamRemaining -= consumed
+                    if self._streamRemaining:
+                        break
+
+                    self._header = None
+                    self._streaming = False
+                    self.packetStreamFinished(header)
+                    continue
+
+                if available < body_length:
+                    break
 
-            data = b''.join(self._buffer)
-            self._header = struct_LLL.unpack_from(data, 0)
-            self._buffer = [data[self._header_size:]]
-            self._length -= self._header_size
+                header = self._header
+                start = self._offset
+                self._offset += body_length
+                self._header = None
 
-        if self._header[1] > self.MAX_BODY:
-            return self.packetLengthExceeded(self._header, self._buffer)
+                self.packetReceived(header, self._body(start, self._offset))
+        finally:
+            self._busyReceiving = False
 
-        if self._length < self._header[1]:
-            return
+        if self._buffer is not None:
+            if self._offset == len(self._buffer):
+                self._buffer = bytearray()
+                self._offset = 0
+            elif self._offset >= self.COMPACT_THRESHOLD and self._offset * 2 >= len(self._buffer):
+                self._compactBuffer()
+
+    def packetLengthExceeded(self, header, body):
+        return self.transport.loseConnection()
 
-        header = self._header
-        body_length = self._header[1]
-        data = b''.join(self._buffer)
+    def packetStreamStarted(self, header):
+        """
+        Override this to receive bodies longer than MAX_BODY by parts instead of
+        dropping the connection.
 
-        self._length -= body_length
-        self._buffer = [data[body_length:]]
-        self._header = None
+        @param header: The Iproto header of the oversized packet.
+        @type header: T{type, body_length, request_id}
 
-        self.packetReceived(header, data[:body_length])
+        @return: True if the body is to be passed to packetStreamReceived().
+        @rtype: C{bool}
+        """
+        return False
 
-    def packetLengthExceeded(self, header, body):
-        return self.transport.loseConnection()
+    def packetStreamReceived(self, header, data):
+        """
+        Override this for when a part of the streamed packet body is received.
+
+        Unconsumed bytes are offered again with the next part, so the method can take
+        only the complete items of the body. When the part holds the whole rest of the
+        body it must be consumed entirely.
+
+        @param header: The Iproto header of the streamed packet.
+        @type header: T{type, body_length, request_id}
+
+        @param data: Received bytes of the body which were not consumed yet.
+            The view must not be retained after the method returns.
+        @type data: C{memoryview}
+
+        @return: Number of bytes consumed from the beginning of C{data}.
+        @rtype: C{int}
+        """
+        raise NotImplementedError("Abstract method must be overridden")
+
+    def packetStreamFinished(self, header):
+        """
+        Override this for when the whole body of the streamed packet is consumed.
+
+        @param header: The Iproto header of the streamed packet.
+        @type header: T{type, body_length, request_id}
+        """
+        raise NotImplementedError("Abstract method must be overridden")
 
     def packetReceived(self, header, body):
         """
@@ -446,8 +792,10 @@ class IprotoPacketReceiver(protocol.Protocol, basic._PauseableMixin):
         @param header: The Iproto header which was received.
         @type header: T{type, body_length, request_id}
 
-        @param body: The Iproto packet body of size body_length.
-        @type body: C{bytes}
+        @param body: The Iproto packet body of size body_length. If C{viewBodies} is set,
+            the view stays valid after this method returns, but it keeps the underlying
+            receive buffer alive.
+        @type body: C{bytes} or C{memoryview}
         """
         raise NotImplementedError("Abstract method must be overridden")
 
@@ -500,6 +848,99 @@ class field(bytes):
             raise ValueError("Unable to cast field to int: length must be 8 bytes, field length is %d" % len(self))
 
 
+class fieldview(object):
+    """
+    Represents a single element of the Tarantool's tuple without copying it:
+    the value references its bytes in the received packet body by offset and length.
+
+    Field value is copied only when it is converted, e.g. with ``bytes()``, ``int()``
+    or ``long()``. Use :attr:`view` to pass the bytes on without copying.
+    """
+
+    __slots__ = ("_buff", "_offset", "_length")
+
+    def __init__(self, buff, offset, length):
+        self._buff = buff
+        self._offset = offset
+        self._length = length
+
+    @property
+    def view(self):
+        """
+        :type: memoryview
+
+        Field bytes
+        """
+        return memoryview(self._buff)[self._offset:self._offset + self._length]
+
+    def tobytes(self):
+        """
+        Copy field value
+
+        :rtype: bytes
+        """
+        return struct.unpack_from("<%ds" % self._length, self._buff, self._offset)[0]
+    __bytes__ = __str__ = tobytes
+
+    def decode(self, charset="utf-8", errors="strict"):
+        return self.tobytes().decode(charset, errors)
+
+    def __len__(self):
+        return self._length
+
+    def __int__(self):
+        """
+        Cast filed to int
+        """
+        if self._length == 4:
+            return struct_L.unpack_from(self._buff, self._offset)[0]
+        else:
+            raise ValueError("Unable to cast field to int: length must be 4 bytes, field length is %d" % self._length)
+
+    def __long__(self):
+        """
+        Cast filed to long
+        """
+        if self._length == 8:
+            return struct_Q.unpack_from(self._buff, self._offset)[0]
+        else:
+            raise ValueError("Unable to cast field to int: length must be 8 bytes, field length is %d" % self._length)
+
+    def __eq__(self, other):
+        if isinstance(other, fieldview):
+            return self._length == other._length and self.view == other.view
+        if isinstance(other, (bytes, bytearray)):
+            return self._length == len(other) and self.tobytes() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __lt__(self, other):
+        return self.tobytes() < bytes(other)
+
+    def __le__(self, other):
+        return self.tobytes() <= bytes(other)
+
+    def __gt__(self, other):
+        return self.tobytes() > bytes(other)
+
+    def __ge__(self, other):
+        return self.tobytes() >= bytes(other)
+
+    def __hash__(self):
+        # Must be equal to the hash of the same bytes
+        return hash(self.tobytes())
+
+    def __repr__(self):
+        return "fieldview(%r)" % self.tobytes()
+
+
+# Values of the two-byte base 128 varints (128..16383) by their bytes, inverse of Request._int_base128
+_int_base128_values = dict((packed, value) for value, packed in enumerate(Request._int_base128) if value >= 0x80)
+
+
 class Response(list):
     """
     Represents a single response from the server in compliance with the Tarantool protocol.
@@ -507,6 +948,12 @@ class Response(list):
     packet received from the server.
     """
 
+    # Unpack fields as fieldview instances referencing the body instead of copying them
+    zero_copy = False
+
+    _decode_tuple = None
+    _append_tuple = list.append
+
     def __init__(self, header, body, charset="utf-8", errors="strict", field_types=None):
         """
         Create an instance of `Response` using data received from the server.
@@ -548,41 +995,40 @@ class Response(list):
     def _unpack_int_base128(varint, offset):
         """Implement Perl unpack's 'w' option, aka base 128 decoding."""
         res = ord(varint[offset])
-        if ord(varint[offset]) >= 0x80:
-            offset += 1
-            res = ((res - 0x80) << 7) + ord(varint[offset])
-            if ord(varint[offset]) >= 0x80:
-                offset += 1
-                res = ((res - 0x80) << 7) + ord(varint[offset])
-                if ord(varint[offset]) >= 0x80:
-                    offset += 1
-                    res = ((res - 0x80) << 7) + ord(varint[offset])
-                    if ord(varint[offset]) >= 0x80:
-                        offset += 1
-                        res = ((res - 0x80) << 7) + ord(varint[offset])
-        return res, offset + 1
-
-    def _unpack_tuple(self, buff):
+        if res < 0x80:
+            return res, offset + 1
+        byte = ord(varint[offset + 1])
+        if byte < 0x80:
+            return ((res - 0x80) << 7) + byte, offset + 2
+        res = ((res - 0x80) << 7) + byte - 0x80
+        byte = ord(varint[offset + 2])
+        if byte < 0x80:
+            return (res << 7) + byte, offset + 3
+        res = (res << 7) + byte - 0x80
+        byte = ord(varint[offset + 3])
+        if byte < 0x80:
+            return (res << 7) + byte, offset + 4
+        return (((res << 7) + byte - 0x80) << 7) + ord(varint[offset + 4]), offset + 5
+
+    def _unpack_tuple(self, buff, offset=0):
         """
         Unpacks the tuple from byte buffer
         <tuple> ::= <cardinality><field>+
 
-        :param buff: byte array of the form <cardinality><field>+
+        :param buff: byte array containing <cardinality><field>+ at the given offset
         :type buff: ctypes buffer or bytes
+        :param offset: offset of the tuple
+        :type offset: int
 
-        :return: tuple of unpacked values
+        :return: tuple of unpacked values, casted if field_types were given
+            (fieldview instances instead of raw fields if :attr:`zero_copy` is set)
         :rtype: tuple
         """
-        cardinality = struct_L.unpack_from(buff)[0]
-        _tuple = ['']*cardinality
-        offset = 4    # The first 4 bytes in the response body is the <count> we have already read
-        for i in xrange(cardinality):
-            field_size, offset = self._unpack_int_base128(buff, offset)
-            field_data = struct.unpack_from("<%ds" % field_size, buff, offset)[0]
-            _tuple[i] = field(field_data)
-            offset += field_size
-
-        return tuple(_tuple)
+        decode_tuple = self._decode_tuple
+        if decode_tuple is None:
+            decode_tuple = self._decode_tuple = get_tuple_decoder(
+                self.field_types, self.charset, self.errors, self.zero_copy)
+        return decode_tuple(buff, offset)
 
     def _unpack_body(self, buff):
         """
@@ -599,6 +1045,35 @@ class Response(list):
         :param buff: buffer containing request body
         :type byff: ctypes buffer
         """
+        if isinstance(buff, memoryview) and not self.zero_copy:
+            # Slicing bytes is the cheapest way to copy the fields
+            buff = buff.tobytes()
+
+        if not self._unpack_status(buff):
+            return
+
+        # If the response doesn't contain any tuple - there is nothing to unpack
+        if self._body_length == 8:
+            return
+
+        # Parse response tuples (<fq_tuple>)
+        if self._rowcount > 0:
+            offset = 8    # The first 4 bytes in the response body is the <count> we have already read
+            while offset < self._body_length:
+                tuple_value, offset = self._unpack_fq_tuple(buff, offset)
+                self.append(tuple_value)
+
+    def _unpack_status(self, buff):
+        """
+        Parse the beginning of the response body: <return_code> followed by
+        <count> or by an error message.
+
+        :param buff: buffer containing request body (at least 8 bytes or the whole body in case of an error)
+        :type byff: ctypes buffer
+
+        :return: False if the body contains an error message instead of tuples
+        :rtype: bool
+        """
 
         # Unpack <return_code> and <count> (how many records affected or selected)
         self._return_code = struct_L.unpack_from(buff, offset=0)[0]
@@ -609,34 +1084,35 @@ class Response(list):
 
         # In case of an error unpack the body as an error message
         if self._return_code != 0:
-            self._return_message = unicode(buff[4:-1], self.charset, self.errors)
+            message = struct.unpack_from("<%ds" % (len(buff) - 5), buff, 4)[0]
+            self._return_message = unicode(message, self.charset, self.errors)
             if self._completion_status == 2:
                 raise TarantoolError(self._return_code, self._return_message)
+            return False
 
         # Unpack <count> (how many records affected or selected)
         self._rowcount = struct_L.unpack_from(buff, offset=4)[0]
+        return True
 
-        # If the response doesn't contain any tuple - there is nothing to unpack
-        if self._body_length == 8:
-            return
+    def _unpack_fq_tuple(self, buff, offset):
+        """
+        Unpacks the tuple prefixed with its size
+        <fq_tuple> ::= <size><tuple>
 
-        # Parse response tuples (<fq_tuple>)
-        if self._rowcount > 0:
-            offset = 8    # The first 4 bytes in the response body is the <count> we have already read
-            while offset < self._body_length:
-                # In resonse tuples have the form <size><tuple> (<fq_tuple> ::= <size><tuple>).
-                # Attribute <size> takes into account only size of tuple's <field> payload,
-                # but does not include 4-byte of <cardinality> field.
-                #Therefore the actual size of the <tuple> is greater to 4 bytes.
-                tuple_size = struct.unpack_from("<L", buff, offset)[0] + 4
-                tuple_data = struct.unpack_from("<%ds" % (tuple_size), buff, offset+4)[0]
-                tuple_value = self._unpack_tuple(tuple_data)
-                if self.field_types:
-                    self.append(self._cast_tuple(tuple_value))
-                else:
-                    self.append(tuple_value)
+        :param buff: buffer containing <fq_tuple> at the given offset
+        :type buff: ctypes buffer or bytes
+        :param offset: offset of the <fq_tuple>
+        :type offset: int
 
-                offset = offset + tuple_size + 4    # This '4' is a size of <size> attribute
+        :return: unpacked (and casted if field_types were given) tuple and offset of the next <fq_tuple>
+        :rtype: (tuple, int)
+        """
+        # In resonse tuples have the form <size><tuple> (<fq_tuple> ::= <size><tuple>).
+        # Attribute <size> takes into account only size of tuple's <field> payload,
+        # but does not include 4-byte of <cardinality> field.
+        #Therefore the actual size of the <tuple> is greater to 4 bytes.
+        tuple_size = struct_L.unpack_from(buff, offset)[0] + 4
+        return self._unpack_tuple(buff, offset + 4), offset + tuple_size + 4    # This '4' is a size of <size> attribute
 
     @property
     def completion_status(self):
@@ -649,7 +1125,7 @@ class Response(list):
 
             * ``0`` -- "success"; the only possible :attr:`return_code` with this status is ``0``
             * ``1`` -- "try again"; an indicator of an intermittent error.
-                    This status is handled automatically by this module.
+                    Such requests are sent again automatically, see :attr:`TarantoolProtocol.maxRetries`.
             * ``2`` -- "error"; in this case :attr:`return_code` holds the actual error.
         """
         return self._completion_status
@@ -683,51 +1159,6 @@ class Response(list):
         """
         return self._return_message
 
-    def _cast_field(self, cast_to, value):
-        """
-        Convert field type from raw bytes to native python type
-
-        :param cast_to: native python type to cast to
-        :type cast_to: a type object (one of bytes, int, unicode (str for py3k))
-        :param value: raw value from the database
-        :type value: bytes
-
-        :return: converted value
-        :rtype: value of native python type (one of bytes, int, unicode (str for py3k))
-        """
-        if cast_to in (int, long, str):
-            return cast_to(value)
-        elif cast_to == unicode:
-            try:
-                value = value.decode(self.charset, self.errors)
-            except UnicodeEncodeError, e:
-                raise InvalidData("Error encoding unicode value '%s': %s" % (repr(value), e))
-
-            return value
-        elif cast_to in (any, bytes):
-            return value
-        else:
-            raise TypeError("Invalid field type %s" % (cast_to))
-
-    def _cast_tuple(self, values):
-        """
-        Convert values of the tuple from raw bytes to native python types
-
-        :param values: tuple of the raw database values
-        :type value: tuple of bytes
-
-        :return: converted tuple value
-        :rtype: value of native python types (bytes, int, unicode (or str for py3k))
-        """
-        result = []
-        for i, value in enumerate(values):
-            if i < len(self.field_types):
-                result.append(self._cast_field(self.field_types[i], value))
-            else:
-                result.append(self._cast_field(self.field_types[-1], value))
-
-        return tuple(result)
-
     def __repr__(self):
         """
         Return user friendy string representation of the object.
@@ -753,250 +1184,1597 @@ class Response(list):
         return affected + " affected"
 
 
-class QueueUnderflow(Exception):
-    pass
+class Record(object):
+    """
+    Base class of the records generated by :func:`record_class`.
 
+    Records keep fields in slots and behave as tuples: they can be indexed, iterated,
+    unpacked and compared with tuples.
+    """
+    __slots__ = ()
 
-class IproDeferredQueue(object):
+    # Field names and types, set by record_class()
+    _fields = ()
+    field_types = ()
 
-    def __init__(self, backlog=None):
-        self.waiting = {0: deque()}
-        self.backlog = backlog
-        self.id = 1
+    def _astuple(self):
+        return ()
 
-    def _cancelGet(self, d):
-        if d._ipro_request_id != 0:
-            self.waiting.pop(d._ipro_request_id)
-        else:
-            self.waiting.get(0).remove(d)
+    def __iter__(self):
+        return iter(self._astuple())
 
-    def broadcast(self, obj):
-        for request_id in self.waiting.iterkeys():
-            if request_id != 0:
-                self.waiting.pop(request_id).callback(obj)
-            else:
-                for p in self.waiting.get(0):
-                    p.callback(obj)
+    def __len__(self):
+        return len(self._fields)
 
-    def check_id(self, request_id):
-        if request_id != 0:
-            return request_id in self.waiting
-        else:
-            return len(self.waiting.get(0)) != 0
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._astuple()[index]
+        return getattr(self, self._fields[index])
 
-    def put(self, request_id, obj):
-        if request_id != 0:
-            self.waiting.pop(request_id).callback(obj)
-        else:
-            self.waiting.get(0).popleft().callback(obj)
+    def __eq__(self, other):
+        if isinstance(other, (Record, tuple)):
+            return self._astuple() == tuple(other)
+        return NotImplemented
 
-    def get_ping(self):
-        d = defer.Deferred(canceller=self._cancelGet)
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
 
-        d._ipro_request_id = 0
-        l = self.waiting.get(0)
-        l.append(d)
+    def __hash__(self):
+        return hash(self._astuple())
 
-        return d
+    def __reduce__(self):
+        return self.__class__, self._astuple()
 
-    def get(self):
-        if self.backlog is None or len(self.waiting) - 1 < self.backlog:
-            d = defer.Deferred(canceller=self._cancelGet)
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__,
+                           ", ".join("%s=%r" % (name, value) for name, value in zip(self._fields, self._astuple())))
 
-            d._ipro_request_id = self.id
-            self.waiting[self.id] = d
 
-            while True:
-                self.id += 1
-                if self.id > 0xffffffff:
-                    self.id = 1
-                if not self.id in self.waiting:
-                    break
+def record_class(name, fields):
+    """
+    Generate record class for the tuples of a space.
 
-            return d
-        else:
-            raise QueueUnderflow()
+    The class can be passed instead of field_types to the commands, then every tuple
+    of the reply is decoded right into the record. Tuples shorter than the record
+    get None in the missing fields, longer ones raise InvalidData.
 
+    :param name: class name
+    :type name: str
+    :param fields: field names and types to cast fields to
+    :type fields: sequence of (name, type) pairs, types are the same as for field_types
 
-class TarantoolProtocol(IprotoPacketReceiver, policies.TimeoutMixin, object):
-    """
-    Tarantool client protocol.
+    :return: Record subclass with a slot per field
+    :rtype: type
     """
-    space_no = 0
+    fields = tuple(fields)
+    names = tuple(n for n, _ in fields)
+    for n in names:
+        if not isinstance(n, str) or not re.match(r"^[A-Za-z][A-Za-z0-9_]*$", n) or keyword.iskeyword(n):
+            raise ValueError("Invalid field name %r" % (n,))
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicate field names in %r" % (names,))
+    if not names:
+        raise ValueError("Record must have at least one field")
+
+    source = (
+        "def __init__(self, %(args)s):\n"
+        "    %(assign)s\n"
+        "def _astuple(self):\n"
+        "    return (%(values)s,)\n"
+    ) % {
+        "args": ", ".join("%s=None" % n for n in names),
+        "assign": "\n    ".join("self.%s = %s" % (n, n) for n in names),
+        "values": ", ".join("self.%s" % n for n in names),
+    }
+    namespace = {}
+    exec source in namespace
+
+    return type(name, (Record,), {
+        # Let records be pickled if the class is defined at module level
+        "__module__": sys._getframe(1).f_globals.get("__name__", "__main__"),
+        "__slots__": names,
+        "__init__": namespace["__init__"],
+        "_astuple": namespace["_astuple"],
+        "_fields": names,
+        "field_types": tuple(t for _, t in fields),
+        "_decoders": {},
+    })
+
+
+# Source of the tuple decoders compiled by get_tuple_decoder():
+# the value of a field of the given type, buff[offset:offset + size] holds its bytes
+_FIELD_DECODERS = {
+    None: "new_field(field, buff[offset:offset + size])",
+    str: "buff[offset:offset + size]",
+    unicode: "buff[offset:offset + size].decode(charset, errors)",
+    int: "unpack_L(buff, offset)[0] if size == 4 else cast_error(int, 4, size)",
+    long: "unpack_Q(buff, offset)[0] if size == 8 else cast_error(long, 8, size)",
+}
+_FIELD_DECODERS[any] = _FIELD_DECODERS[None]
+
+# The same for the zero-copy decoders, buff can be a memoryview in this case
+_FIELD_DECODERS_ZERO_COPY = {
+    None: "fieldview(buff, offset, size)",
+    str: "(buff[offset:offset + size] if is_bytes else buff[offset:offset + size].tobytes())",
+    unicode: "(buff[offset:offset + size] if is_bytes else buff[offset:offset + size].tobytes()).decode(charset, errors)",
+    int: _FIELD_DECODERS[int],
+    long: _FIELD_DECODERS[long],
+}
+_FIELD_DECODERS_ZERO_COPY[any] = _FIELD_DECODERS_ZERO_COPY[None]
+
+_FIELD_DECODER_TEMPLATE = """\
+size = ord(buff[offset])
+if size < 0x80:
+    offset += 1
+else:
+    size, offset = unpack_int_base128(buff, offset)
+if offset + size > end:
+    truncated(size, offset, end)
+append(%s)
+offset += size"""
+
+# Two-byte sizes are looked up in the table if buff is bytes (memoryview slices are not hashable)
+_FIELD_DECODER_TEMPLATE_BYTES = """\
+size = ord(buff[offset])
+if size < 0x80:
+    offset += 1
+else:
+    size = int_base128_values.get(buff[offset:offset + 2])
+    if size is None:
+        size, offset = unpack_int_base128(buff, offset)
+    else:
+        offset += 2
+if offset + size > end:
+    truncated(size, offset, end)
+append(%s)
+offset += size"""
 
-    def __init__(self, charset="utf-8", errors="strict"):
-        self.charset = charset
-        self.errors = errors
+_tuple_decoders = {}
 
-        self.replyQueue = IproDeferredQueue()
 
-    def connectionMade(self):
-        self.connected = 1
-        self.factory.addConnection(self)
+def _cast_error(cast_to, length, size):
+    raise ValueError("Unable to cast field to %s: length must be %d bytes, field length is %d"
+                     % (cast_to.__name__, length, size))
 
-    def connectionLost(self, why):
-        self.connected = 0
-        self.factory.delConnection(self)
-        IprotoPacketReceiver.connectionLost(self, why)
-        self.replyQueue.broadcast(ConnectionError("Lost connection"))
 
-    def packetReceived(self, header, body):
-        self.resetTimeout()
+def _truncated_error(size, offset, end):
+    raise InvalidData("Field of %d bytes at offset %d is truncated, the buffer ends at %d" % (size, offset, end))
 
-        if not self.replyQueue.check_id(header[2]):
-            return self.transport.loseConnection()
 
-        self.replyQueue.put(header[2], (header, body))
+def _compile_tuple_decoder(field_types, charset, errors, zero_copy):
+    """
+    Generate the function decoding <tuple> into a tuple of the field_types values.
 
-    @staticmethod
-    def handle_reply(r, charset, errors, field_types):
-        if isinstance(r, Exception):
-            raise r
+    Every type but the last one is decoded by its own unrolled code, the last type
+    is used for all the remaining fields. Field size and value are decoded in place,
+    without intermediate field objects.
+    """
+    record = None
+    if isinstance(field_types, type) and issubclass(field_types, Record):
+        record, field_types = field_types, field_types.field_types
+
+    decoders = _FIELD_DECODERS_ZERO_COPY if zero_copy else _FIELD_DECODERS
+    try:
+        fields = [decoders[t] for t in field_types or (None,)]
+    except (KeyError, TypeError):
+        raise TypeError("Invalid field type in %s" % (field_types,))
+
+    template = _FIELD_DECODER_TEMPLATE if zero_copy else _FIELD_DECODER_TEMPLATE_BYTES
+
+    def field_code(expr, indent):
+        return "\n".join(indent + line for line in (template % expr).split("\n"))
+
+    lines = [
+        "def decode_tuple(buff, offset):",
+        "    end = len(buff)",
+        "    cardinality = unpack_L(buff, offset)[0]",
+        "    offset += 4",
+        "    values = []",
+        "    append = values.append",
+    ]
+    if zero_copy:
+        lines.append("    is_bytes = buff.__class__ is bytes")
+    if record is None:
+        for i, expr in enumerate(fields[:-1]):
+            lines.append("    if cardinality <= %d:" % i)
+            lines.append("        return tuple(values)")
+            lines.append(field_code(expr, "    "))
+        lines.append("    for i in xrange(%d, cardinality):" % (len(fields) - 1))
+        lines.append(field_code(fields[-1], "        "))
+        lines.append("    return tuple(values)")
+    else:
+        # Record is created right from the decoded values, missing trailing fields are None
+        lines.append("    if cardinality > %d:" % len(fields))
+        lines.append("        raise InvalidData('Tuple of %%d fields does not fit %s record' %% cardinality)"
+                     % record.__name__)
+        for i, expr in enumerate(fields):
+            lines.append("    if cardinality <= %d:" % i)
+            lines.append("        return record(*values)")
+            lines.append(field_code(expr, "    "))
+        lines.append("    return record(*values)")
+
+    # Malformed bodies raise InvalidData, not the errors of the code reading them
+    body = "\n".join(lines[1:]).split("\n")
+    lines = [lines[0], "    start = offset", "    try:"] + ["    " + line for line in body] + [
+        "    except UnicodeDecodeError as e:",
+        "        raise InvalidData('Error decoding unicode value %r: %s' % (e.object[e.start:e.end], e))",
+        "    except (IndexError, struct_error) as e:",
+        "        raise InvalidData('Tuple at offset %d is malformed: %s' % (start, e))",
+    ]
+
+    namespace = {
+        "unpack_L": struct_L.unpack_from,
+        "unpack_Q": struct_Q.unpack_from,
+        "unpack_int_base128": Response._unpack_int_base128,
+        "int_base128_values": _int_base128_values,
+        "new_field": bytes.__new__,
+        "field": field,
+        "fieldview": fieldview,
+        "cast_error": _cast_error,
+        "truncated": _truncated_error,
+        "struct_error": struct.error,
+        "charset": charset,
+        "errors": errors,
+        "record": record,
+        "InvalidData": InvalidData,
+    }
+    exec "\n".join(lines) in namespace
+    return namespace["decode_tuple"]
+
+
+def get_tuple_decoder(field_types, charset="utf-8", errors="strict", zero_copy=False):
+    """
+    Get the function decoding <tuple> into a tuple of native python values.
+    Decoders are compiled once per field types and cached.
+
+    :param field_types: types to cast fields to, the last one is used for all the remaining
+        fields; if empty, fields are decoded as :class:`field` instances. Tuples are decoded
+        into records if a :class:`Record` subclass is given.
+    :type field_types: tuple or list of types (bytes, str, int, long, unicode, any) or Record subclass
+    :param zero_copy: decode raw fields as :class:`fieldview` instances referencing the buffer
+
+    :return: function taking buffer and offset of the <tuple> and returning a tuple
+    :rtype: callable
+    """
+    if isinstance(field_types, type):
+        # Decoders of records are kept by their classes to go away with the classes created on the fly
+        decoders = field_types.__dict__.get("_decoders")
+        if decoders is None:
+            decoders = field_types._decoders = {}
+        key = (charset, errors, zero_copy)
+        try:
+            return decoders[key]
+        except KeyError:
+            decoder = decoders[key] = _compile_tuple_decoder(field_types, charset, errors, zero_copy)
+            return decoder
+
+    key = (tuple(field_types) if field_types else None, charset, errors, zero_copy)
+    try:
+        return _tuple_decoders[key]
+    except KeyError:
+        decoder = _tuple_decoders[key] = _compile_tuple_decoder(key[0], charset, errors, zero_copy)
+        return decoder
+
+
+# Placeholder of the LazyResponse item which is not decoded yet
+_NOT_DECODED = object()
+
+
+class LazyResponse(Response):
+    """
+    Response which decodes tuples on first access.
+
+    On receipt only the <size> prefixes of the tuples are scanned to find their offsets
+    in the body. Every tuple is decoded (and casted) when it is indexed or iterated for
+    the first time and cached then, so decoding errors are raised on access. The body
+    is referenced until all the tuples are decoded.
+    """
+
+    _buff = None
+    _offsets = None
+    _pending = 0
+
+    def _unpack_body(self, buff):
+        """
+        Index the response body, see :meth:`Response._unpack_body`
+        """
+        if isinstance(buff, memoryview) and not self.zero_copy:
+            buff = buff.tobytes()
+
+        if not self._unpack_status(buff):
+            return
+
+        if self._body_length == 8 or self._rowcount == 0:
+            return
+
+        offsets = []
+        offset = 8
+        while offset < self._body_length:
+            offsets.append(offset)
+            offset += struct_L.unpack_from(buff, offset)[0] + 8    # <size> + <cardinality> + <field>+
+
+        self._buff = buff
+        self._offsets = offsets
+        self._pending = len(offsets)
+        list.extend(self, itertools.repeat(_NOT_DECODED, len(offsets)))
+
+    def _decode(self, index):
+        value = list.__getitem__(self, index)
+        if value is _NOT_DECODED:
+            value = self._unpack_fq_tuple(self._buff, self._offsets[index])[0]
+            list.__setitem__(self, index, value)
+            self._pending -= 1
+            if not self._pending:
+                self._buff = self._offsets = None
+        return value
+
+    def _decode_all(self):
+        if self._pending:
+            for i in xrange(len(self)):
+                self._decode(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode(i) for i in xrange(*index.indices(len(self)))]
+        return self._decode(index)
+
+    def __getslice__(self, i, j):
+        return self.__getitem__(slice(i, j))
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self._decode(i)
+
+    def __reversed__(self):
+        for i in xrange(len(self) - 1, -1, -1):
+            yield self._decode(i)
+
+    def __repr__(self):
+        self._decode_all()
+        return super(LazyResponse, self).__repr__()
+
+    def __radd__(self, other):
+        if not isinstance(other, list):
+            return NotImplemented
+        self._decode_all()
+        return list.__add__(other, self)
+
+
+def _decoding_all(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._decode_all()
+        for arg in args:
+            if isinstance(arg, LazyResponse):
+                arg._decode_all()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+# Comparison and the methods which move items around need all the tuples decoded
+for _name in ("__eq__", "__ne__", "__lt__", "__le__", "__gt__", "__ge__", "__contains__",
+              "__add__", "__mul__", "__rmul__", "__iadd__", "__imul__", "__delitem__", "__delslice__",
+              "__setslice__", "index", "count", "insert", "pop", "remove", "reverse", "sort"):
+    setattr(LazyResponse, _name, _decoding_all(_name))
+
+
+class ZeroCopyResponse(Response):
+    """
+    Response which unpacks fields as :class:`fieldview` instances referencing the body.
+    """
+    zero_copy = True
+
+
+class LazyZeroCopyResponse(LazyResponse):
+    """
+    LazyResponse which unpacks fields as :class:`fieldview` instances referencing the body.
+    """
+    zero_copy = True
+
+
+# array typecodes of the 32 and 64 bit unsigned integers
+_ARRAY_TYPECODES = {}
+for _typecode in "QLI":
+    try:
+        _ARRAY_TYPECODES.setdefault(array.array(_typecode).itemsize, _typecode)
+    except ValueError:
+        pass
+
+
+class ColumnarResponse(Response):
+    """
+    Response which holds the tuples by columns: ``response[i]`` is the sequence of the
+    i-th fields of all the tuples, all the tuples must have the same cardinality.
+
+    Columns of ``int`` and ``long`` field types are arrays of unsigned integers, other
+    columns are lists. If NumPy is installed and all the tuples have the same layout
+    (e.g. contain integer fields only), integer columns are read-only numpy arrays
+    viewing the body bytes, so no Python object is created per field.
+    """
+
+    def _append_tuple(self, value):
+        if not len(self):
+            for i in xrange(len(value)):
+                list.append(self, self._new_column(i))
+        elif len(value) != len(self):
+            raise InvalidData("Tuples of different cardinality (%d and %d) can't be stored by columns"
+                              % (len(self), len(value)))
+
+        for column, v in itertools.izip(self, value):
+            column.append(v)
+
+    def _column_type(self, i):
+        field_types = getattr(self.field_types, "field_types", self.field_types)
+        if not field_types:
+            return None
+        return field_types[i] if i < len(field_types) else field_types[-1]
+
+    def _new_column(self, i):
+        cast_to = self._column_type(i)
+        if cast_to is int and 4 in _ARRAY_TYPECODES:
+            return array.array(_ARRAY_TYPECODES[4])
+        if cast_to is long and 8 in _ARRAY_TYPECODES:
+            return array.array(_ARRAY_TYPECODES[8])
+        return []
+
+    def _unpack_body(self, buff):
+        """
+        Parse the response body into columns, see :meth:`Response._unpack_body`
+        """
+        if isinstance(buff, memoryview):
+            buff = buff.tobytes()
+
+        if not self._unpack_status(buff):
+            return
+
+        if self._body_length == 8 or self._rowcount == 0:
+            return
+
+        if numpy is not None and self._unpack_strided(buff):
+            return
+
+        offset = 8
+        while offset < self._body_length:
+            tuple_value, offset = self._unpack_fq_tuple(buff, offset)
+            self._append_tuple(tuple_value)
+
+    def _unpack_strided(self, buff):
+        """
+        Build columns as strided views of the body if all the tuples have the same layout.
+
+        :return: False if the layout of the tuples differs
+        :rtype: bool
+        """
+        count = self._rowcount
+        stride = struct_L.unpack_from(buff, 8)[0] + 8    # <size> + <cardinality> + <field>+
+        if 8 + count * stride != self._body_length:
+            return False
+
+        def column(offset, dtype):
+            return numpy.ndarray((count,), dtype, buff, offset, (stride,))
+
+        # All the tuples have the same <size> and <cardinality>
+        cardinality = struct_L.unpack_from(buff, 12)[0]
+        if (column(8, "<u4") != stride - 8).any() or (column(12, "<u4") != cardinality).any():
+            return False
+
+        # Fields of all the tuples have the same sizes, i.e. the same varint prefixes
+        layout = []
+        offset = 16
+        for i in xrange(cardinality):
+            size, data_offset = self._unpack_int_base128(buff, offset)
+            for prefix_offset in xrange(offset, data_offset):
+                if (column(prefix_offset, "u1") != ord(buff[prefix_offset])).any():
+                    return False
+            layout.append((data_offset, size))
+            offset = data_offset + size
+
+        columns = []
+        for i, (offset, size) in enumerate(layout):
+            cast_to = self._column_type(i)
+            offsets = xrange(offset, offset + count * stride, stride)
+            if cast_to is int:
+                columns.append(column(offset, "<u4") if size == 4 else _cast_error(int, 4, size))
+            elif cast_to is long:
+                columns.append(column(offset, "<u8") if size == 8 else _cast_error(long, 8, size))
+            elif cast_to is str:
+                columns.append([buff[o:o + size] for o in offsets])
+            elif cast_to is unicode:
+                columns.append([buff[o:o + size].decode(self.charset, self.errors) for o in offsets])
+            elif cast_to in (None, any):
+                columns.append([bytes.__new__(field, buff[o:o + size]) for o in offsets])
+            else:
+                raise TypeError("Invalid field type %s" % (cast_to,))
+
+        list.extend(self, columns)
+        return True
+
+
+class ResponseDecoder(object):
+    """
+    Incremental decoder of the response body.
+
+    Used for the bodies which are received by parts: every tuple is decoded
+    as soon as all its bytes are received, so the raw body is never buffered
+    as a whole, only the tuple being received. The decoded tuples are still
+    collected in the :attr:`response` unless a consumer takes them.
+    """
+
+    def __init__(self, header, charset="utf-8", errors="strict", field_types=None, consumer=None,
+                 response_class=Response):
+        """
+        :param header: header of the response
+        :type header: tuple (type, body_length, request_id)
+        :param consumer: callable to pass decoded tuples to, by default
+            they are appended to the :attr:`response`
+        :type consumer: callable
+        :param response_class: class of the :attr:`response`
+        :type response_class: Response subclass
+        """
+        self.response = response_class(header, None, charset, errors, field_types)
+        self.error = None
+        self._consumer = consumer or self.response._append_tuple
+        self._remaining = header[1]
+        self._status_unpacked = False
+
+    def feed(self, data):
+        """
+        Decode complete tuples from the beginning of the data.
+
+        :param data: received bytes of the body which were not consumed yet
+        :type data: memoryview or bytes
+
+        :return: number of bytes consumed
+        :rtype: int
+        """
+        size = len(data)
+        if self.error is not None:
+            # The rest of the body is useless, just skip it
+            self._remaining -= size
+            return size
+
+        response = self.response
+        # The view is valid during the call only, so the bytes of every complete tuple are copied out
+        is_view = isinstance(data, memoryview)
+        offset = 0
+        try:
+            if not self._status_unpacked:
+                if size < 8:
+                    return 0
+
+                if struct_L.unpack_from(data, 0)[0] != 0 and size < self._remaining:
+                    # An error message is unpacked at once
+                    return 0
 
-        return Response(r[0], r[1], charset, errors, field_types)
+                self._status_unpacked = True
+                if not response._unpack_status(data):
+                    offset = size
+                else:
+                    offset = 8
+
+            while size - offset >= 4:
+                end = offset + struct_L.unpack_from(data, offset)[0] + 8
+                if end > size:
+                    break
+                if is_view:
+                    tuple_value = response._unpack_fq_tuple(data[offset:end].tobytes(), 0)[0]
+                else:
+                    tuple_value = response._unpack_fq_tuple(data, offset)[0]
+                offset = end
+                self._consumer(tuple_value)
+        except Exception as e:
+            self.error = e
+            offset = size
+
+        self._remaining -= offset
+        return offset
+
+    @property
+    def finished(self):
+        """
+        :type: bool
+
+        True if the whole body has been consumed.
+        """
+        return self._remaining == 0
+
+
+class QueueUnderflow(Exception):
+    pass
+
+
+class IproDeferredQueue(object):
+    """
+    Deferreds of the requests waiting for reply.
+
+    Request ids are allocated from a table of slots: the low SLOT_BITS of the id are the
+    number of the slot, the high bits are the generation of the slot which is incremented
+    every time the slot is reused, so a late reply to a cancelled request never matches
+    a new one. Free slots are kept in a stack, so an id is allocated in constant time and
+    the table grows only up to the max number of requests waiting at once. Ping requests
+    have id 0 and are replied in order.
+    """
+
+    SLOT_BITS = 20
+    SLOT_MASK = (1 << SLOT_BITS) - 1
+
+    def __init__(self, backlog=None):
+        self.backlog = backlog
+        self.waiting = {}
+        self._pings = deque()
+        # The last id of every slot, slot 0 is never used, so request id is never 0
+        self._ids = [0]
+        self._free = []
+
+    def _cancelGet(self, d):
+        # Cancelled ping stays in the queue till its reply, as ping replies are matched by order
+        if d._ipro_request_id != 0:
+            if self.waiting.get(d._ipro_request_id) is d:
+                self._release(d._ipro_request_id)
+
+    def _release(self, request_id):
+        self._free.append(request_id & self.SLOT_MASK)
+        return self.waiting.pop(request_id)
+
+    def broadcast(self, obj):
+        deferreds = [self._release(request_id) for request_id in self.waiting.keys()]
+        deferreds.extend(self._pings)
+        self._pings = deque()
+        for d in deferreds:
+            if not d.called:
+                d.callback(obj)
+
+    def peek(self, request_id):
+        return self.waiting.get(request_id) if request_id != 0 else None
+
+    def __len__(self):
+        """
+        Number of the requests waiting for reply
+        """
+        return len(self.waiting) + len(self._pings)
+
+    def is_stale(self, request_id):
+        """
+        Check if the id was given to a request which is not waiting for reply anymore
+        """
+        slot = request_id & self.SLOT_MASK
+        if request_id in self.waiting or not 0 < slot < len(self._ids):
+            return False
+        # The id is of the current or one of the previous generations of the slot
+        return ((self._ids[slot] - request_id) & 0xffffffff) >> self.SLOT_BITS < 1 << (31 - self.SLOT_BITS)
+
+    def check_id(self, request_id):
+        if request_id != 0:
+            return request_id in self.waiting
+        else:
+            return len(self._pings) != 0
+
+    def put(self, request_id, obj):
+        if request_id != 0:
+            self._free.append(request_id & self.SLOT_MASK)
+            self.waiting.pop(request_id).callback(obj)
+        else:
+            d = self._pings.popleft()
+            if not d.called:
+                d.callback(obj)
+
+    def get_ping(self):
+        d = defer.Deferred(canceller=self._cancelGet)
+
+        d._ipro_request_id = 0
+        self._pings.append(d)
+
+        return d
+
+    def get(self):
+        if self.backlog is not None and len(self.waiting) >= self.backlog:
+            raise QueueUnderflow()
+
+        if self._free:
+            slot = self._free.pop()
+            # The next generation of the slot
+            request_id = self._ids[slot] = (self._ids[slot] + (1 << self.SLOT_BITS)) & 0xffffffff
+        else:
+            slot = len(self._ids)
+            if slot > self.SLOT_MASK:
+                raise QueueUnderflow()
+            self._ids.append(slot)
+            request_id = slot
+
+        d = defer.Deferred(canceller=self._cancelGet)
+        d._ipro_request_id = request_id
+        self.waiting[request_id] = d
+        return d
+
+
+class TimerWheel(object):
+    """
+    Hashed timer wheel.
+
+    A timer is put to the bucket of the tick it expires at modulo the number of buckets,
+    ticks are counted in resolution intervals. While there are timers a single delayed call
+    turns the wheel every resolution seconds and fires the due timers of the passed buckets,
+    so adding and cancelling a timer take constant time and need no delayed call of its own.
+    """
+
+    def __init__(self, clock, resolution=0.01, size=512):
+        """
+        :param clock: provider of the current time and delayed calls, e.g. reactor
+        :type clock: IReactorTime
+        :param resolution: length of the tick in seconds, timers fire up to that late
+        :type resolution: float
+        :param size: number of buckets
+        :type size: int
+        """
+        self.clock = clock
+        self.resolution = resolution
+        self._buckets = [{} for _ in xrange(size)]
+        self._tick = self._now_tick()
+        self._serial = itertools.count()
+        self._count = 0
+        self._call = None
+
+    def __len__(self):
+        return self._count
+
+    def _now_tick(self):
+        return int(self.clock.seconds() / self.resolution)
+
+    def add(self, deadline, callback, *args):
+        """
+        Call callback(*args) once the time reaches the deadline
+
+        :param deadline: time as returned by clock.seconds()
+        :type deadline: float
+
+        :return: timer to be passed to :meth:`cancel`
+        """
+        tick = max(-int(-deadline // self.resolution), self._tick + 1)
+        timer = (tick, next(self._serial))
+        self._buckets[tick % len(self._buckets)][timer] = (callback, args)
+        self._count += 1
+        if self._call is None:
+            self._call = self.clock.callLater(self.resolution, self._turn)
+        return timer
+
+    def cancel(self, timer):
+        """
+        Cancel the timer which has not fired yet
+        """
+        if self._buckets[timer[0] % len(self._buckets)].pop(timer, None) is not None:
+            self._count -= 1
+            if self._count == 0:
+                self.stop()
+
+    def stop(self):
+        """
+        Cancel all the timers
+        """
+        if self._call is not None:
+            if self._call.active():
+                self._call.cancel()
+            self._call = None
+        if self._count:
+            for bucket in self._buckets:
+                bucket.clear()
+            self._count = 0
+
+    def _turn(self):
+        self._call = None
+        now = self._now_tick()
+        due = []
+        # Every bucket is visited once at most, even if the wheel is late by more than a round
+        for tick in xrange(self._tick + 1, min(now, self._tick + len(self._buckets)) + 1):
+            bucket = self._buckets[tick % len(self._buckets)]
+            for timer in [timer for timer in bucket if timer[0] <= now]:
+                due.append(bucket.pop(timer))
+        self._tick = max(now, self._tick)
+        self._count -= len(due)
+
+        if self._count and self._call is None:
+            self._call = self.clock.callLater(self.resolution, self._turn)
+
+        for callback, args in due:
+            try:
+                callback(*args)
+            except:
+                log.err()
+
+
+class RetryBudget(object):
+    """
+    Limits retries of the "try again" replies to a share of the requests.
+
+    Every request deposits ratio of a retry to the budget and every retry takes a whole one,
+    so retries never add more than ratio of the load to the overloaded server. The balance
+    is capped by reserve, which is also the initial balance, so the rarely sent requests can
+    be retried too. The budget is shared by all the connections of a factory.
+    """
+
+    def __init__(self, ratio=0.1, reserve=10):
+        """
+        :param ratio: number of retries per request
+        :type ratio: float
+        :param reserve: max number of retries which can be made in a row
+        :type reserve: int
+        """
+        self.ratio = ratio
+        self.reserve = reserve
+        self.balance = float(reserve)
+
+        # Number of the retries made
+        self.retries = 0
+        # Number of the replies not retried because the budget was exhausted
+        self.denied = 0
+        # Number of the replies not retried because the request was retried maxRetries times already
+        self.exhausted = 0
+
+    def deposit(self):
+        self.balance = min(self.balance + self.ratio, self.reserve)
+
+    def withdraw(self):
+        """
+        Take a retry from the budget
+
+        :return: False if the budget is exhausted
+        :rtype: bool
+        """
+        if self.balance < 1:
+            self.denied += 1
+            return False
+        self.balance -= 1
+        self.retries += 1
+        return True
+
+
+@implementer(interfaces.IPushProducer)
+class RequestProducer(object):
+    """
+    Producer of the requests of TarantoolProtocol registered with its transport:
+    the transport pauses it when its write buffer is full, and new requests wait
+    for admission until the buffer is written out and the producer is resumed.
+    """
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.paused = False
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.protocol._admit_waiting()
+
+    def stopProducing(self):
+        self.paused = True
+
+
+class TarantoolProtocol(IprotoPacketReceiver, policies.TimeoutMixin, PreparedRequestsMixin):
+    """
+    Tarantool client protocol.
+    """
+    space_no = 0
+
+    # Replies longer than MAX_BODY are decoded by parts instead of dropping the connection
+    streamReplies = True
+
+    # Class of the replies, e.g. LazyResponse
+    responseClass = Response
+
+    # Replies are decoded from the receive buffer without copying the bodies
+    viewBodies = True
+
+    # Requests are collected and written together after corkDelay seconds (0 - on the next
+    # reactor iteration) or as soon as corkMaxBytes are collected if corkWrites is set
+    corkWrites = False
+    corkDelay = 0
+    corkMaxBytes = 64 * 1024
+
+    # Requests wait for admission while there are maxPending requests waiting for reply
+    # or the transport's write buffer is full, no more than maxWaiting of them can wait
+    maxPending = None
+    maxWaiting = 10000
+
+    # Default timeout of the requests in seconds, expiry is checked every timeoutResolution seconds
+    requestTimeout = None
+    timeoutResolution = 0.01
+    clock = reactor
+
+    # Requests replied with "try again" status are sent again up to maxRetries times after
+    # a random delay up to retryDelay doubled with every retry, but no more than retryMaxDelay
+    maxRetries = 3
+    retryDelay = 0.01
+    retryMaxDelay = 1.0
+
+    # Number of the packets written, the connection is closed by the pool autoscaler if it is not growing
+    packetsSent = 0
+    retired = False
+
+    # Reply latency is averaged with the weight of the previous value decaying with latencyDecay seconds
+    latencyDecay = 10.0
+    _latency = 0.0
+    _latencyStamp = 0.0
+
+    def __init__(self, charset="utf-8", errors="strict"):
+        self.charset = charset
+        self.errors = errors
+
+        self.replyQueue = IproDeferredQueue()
+        self._decoder = None
+        self._corked = []
+        self._corkedBytes = 0
+        self._flushCall = None
+        self._admissionQueue = deque()
+        self.producer = RequestProducer(self)
+        self._timers = None
+        self.retryBudget = RetryBudget()
+        self._retryCalls = {}
+
+    def connectionMade(self):
+        self.connected = 1
+        self.transport.registerProducer(self.producer, True)
+        self.factory.addConnection(self)
+
+    def connectionLost(self, why):
+        self.connected = 0
+        if self._timers is not None:
+            self._timers.stop()
+        if self._flushCall is not None:
+            self._flushCall.cancel()
+            self._flushCall = None
+        self._corked = []
+        self._corkedBytes = 0
+        self.factory.delConnection(self)
+        IprotoPacketReceiver.connectionLost(self, why)
+        self.replyQueue.broadcast(ConnectionError("Lost connection"))
+
+        waiting, self._admissionQueue = self._admissionQueue, deque()
+        for d in waiting:
+            d.errback(ConnectionError("Lost connection"))
+
+        retrying, self._retryCalls = self._retryCalls, {}
+        for call, d in retrying.items():
+            call.cancel()
+            d.errback(ConnectionError("Lost connection"))
+
+    def packetReceived(self, header, body):
+        self.resetTimeout()
+
+        if not self.replyQueue.check_id(header[2]):
+            if self.replyQueue.is_stale(header[2]):
+                # Late reply to the expired or cancelled request
+                return
+            return self.transport.loseConnection()
+
+        d = self.replyQueue.peek(header[2])
+        if d is not None:
+            self._observe_latency(d)
+        if getattr(d, '_ipro_consumer', None) is not None:
+            # Streaming request: tuples go to the consumer instead of the response
+            decoder = self._response_decoder(header, d)
+            decoder.feed(body)
+            self.replyQueue.put(header[2], decoder.error if decoder.error is not None else decoder.response)
+        else:
+            self.replyQueue.put(header[2], (header, body))
+        self._admit_waiting()
+
+    def packetStreamStarted(self, header):
+        d = self.replyQueue.peek(header[2])
+        if not self.streamReplies:
+            return False
+
+        if d is None:
+            if not self.replyQueue.is_stale(header[2]):
+                return False
+            # Late reply to the expired or cancelled request, the decoder skips the body once it has an error
+            self._decoder = ResponseDecoder(header)
+            self._decoder.error = TimeoutError("Request %d is expired" % header[2])
+            return True
+
+        self._decoder = self._response_decoder(header, d)
+        return True
+
+    def packetStreamReceived(self, header, data):
+        self.resetTimeout()
+        return self._decoder.feed(data)
+
+    def packetStreamFinished(self, header):
+        decoder, self._decoder = self._decoder, None
+
+        # The request could be cancelled while its reply was being received
+        if self.replyQueue.check_id(header[2]):
+            if header[2] != 0:
+                self._observe_latency(self.replyQueue.peek(header[2]))
+            self.replyQueue.put(header[2], decoder.error if decoder.error is not None else decoder.response)
+            self._admit_waiting()
+
+    def _response_decoder(self, header, d):
+        """
+        Create incremental decoder of the reply to the request of the deferred
+        """
+        return ResponseDecoder(header, self.charset, self.errors, getattr(d, '_ipro_field_types', None),
+                               getattr(d, '_ipro_consumer', None), getattr(d, '_ipro_response_class', Response))
+
+    @staticmethod
+    def handle_reply(r, charset, errors, field_types, response_class=Response):
+        if isinstance(r, Exception):
+            raise r
+
+        if isinstance(r, Response):
+            return r
+
+        return response_class(r[0], r[1], charset, errors, field_types)
+
+    def write(self, data):
+        """
+        Write packet to the transport or collect it to be written with the others if corkWrites is set
+        """
+        self.packetsSent += 1
+        if not self.corkWrites:
+            return self.transport.write(data)
+
+        self._corked.append(data)
+        self._corkedBytes += len(data)
+        if self._corkedBytes >= self.corkMaxBytes:
+            self.flush()
+        elif self._flushCall is None:
+            self._flushCall = self.callLater(self.corkDelay, self.flush)
+
+    def flush(self):
+        """
+        Write collected packets to the transport at once
+        """
+        if self._flushCall is not None:
+            if self._flushCall.active():
+                self._flushCall.cancel()
+            self._flushCall = None
+
+        if self._corked:
+            corked, self._corked = self._corked, []
+            self._corkedBytes = 0
+            self.transport.writeSequence(corked)
+
+    def send_packet(self, packet, field_types=None):
+        self.write(bytes(packet))
+        d = self.replyQueue.get()
+        d._ipro_sent = self.clock.seconds()
+        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types)
+
+    def _observe_latency(self, d):
+        """
+        Account reply latency of the request: a peak is taken at once, lower values are averaged in
+        """
+        sent = getattr(d, '_ipro_sent', None)
+        if sent is None:
+            return
+        now = self.clock.seconds()
+        sample = now - sent
+        latency = self._latency
+        if sample > latency:
+            self._latency = sample
+        else:
+            weight = math.exp(-max(now - self._latencyStamp, 0) / self.latencyDecay)
+            self._latency = latency * weight + sample * (1 - weight)
+        self._latencyStamp = now
+
+    @property
+    def latency(self):
+        """
+        Average reply latency in seconds, decaying while no replies are received
+        """
+        return self._latency * math.exp(-max(self.clock.seconds() - self._latencyStamp, 0) / self.latencyDecay)
+
+    @property
+    def outstanding(self):
+        """
+        Number of the requests waiting for reply or for admission
+        """
+        return len(self.replyQueue) + len(self._admissionQueue)
+
+    @property
+    def available(self):
+        """
+        Whether a new request is sent right away
+        """
+        return self._admitted() and not self._admissionQueue
+
+    def _admitted(self):
+        """
+        Check if a new request can be sent right away
+        """
+        return not self.producer.paused and (self.maxPending is None or len(self.replyQueue) < self.maxPending)
+
+    def _admit_waiting(self):
+        """
+        Send the requests waiting for admission while there is capacity
+        """
+        while self._admissionQueue and self._admitted():
+            self._admissionQueue.popleft().callback(None)
+
+    def _when_admitted(self, send, *args):
+        """
+        Call send(*args) at once or when the requests waiting for admission before it are sent,
+        errors of send() fail the returned deferred either way
+
+        :return: deferred of the reply
+        """
+        if not self._admissionQueue and self._admitted():
+            return defer.maybeDeferred(send, *args)
+
+        if self.maxWaiting is not None and len(self._admissionQueue) >= self.maxWaiting:
+            return defer.fail(QueueUnderflow("Too many requests are waiting to be sent"))
+
+        d = defer.Deferred(canceller=self._admissionQueue.remove)
+        self._admissionQueue.append(d)
+        return d.addCallback(lambda _: send(*args))
+
+    def _with_retries(self, send, *args):
+        """
+        Send the request when admitted and send it again if the server replies "try again",
+        while the request's retries and the retry budget allow
+
+        :return: deferred of the last reply
+        """
+        budget = self.retryBudget
+        budget.deposit()
+        current = [None]
+
+        def cancel(_):
+            self._retryCalls.pop(current[0], None)
+            current[0].cancel()
+
+        result = defer.Deferred(canceller=cancel)
+
+        def attempt(retries):
+            current[0] = self._when_admitted(send, *args)
+            current[0].addCallbacks(replied, failed, (retries,))
+
+        def retry(retries):
+            del self._retryCalls[current[0]]
+            attempt(retries)
+
+        def replied(response, retries):
+            if result.called:
+                return
+            if getattr(response, "completion_status", 0) == 1:
+                if retries >= self.maxRetries:
+                    budget.exhausted += 1
+                elif budget.withdraw():
+                    delay = random.uniform(0, min(self.retryMaxDelay, self.retryDelay * 2 ** retries))
+                    current[0] = self.clock.callLater(delay, retry, retries + 1)
+                    self._retryCalls[current[0]] = result
+                    return
+            result.callback(response)
+
+        def failed(reason):
+            if not result.called:
+                result.errback(reason)
+
+        attempt(0)
+        return result
+
+    def _with_deadline(self, d, kwargs):
+        """
+        Cancel the request and fail it with TimeoutError if it is not replied
+        within timeout seconds or by the deadline
+
+        :param timeout: seconds, by default :attr:`requestTimeout` is used
+        :param deadline: time as returned by :attr:`clock`.seconds()
+        """
+        timeout = kwargs.get("timeout", self.requestTimeout)
+        deadline = kwargs.get("deadline")
+        if timeout is not None:
+            deadline = min(deadline, self.clock.seconds() + timeout) if deadline is not None \
+                else self.clock.seconds() + timeout
+        if deadline is None or d.called:
+            return d
+
+        if self._timers is None:
+            self._timers = TimerWheel(self.clock, self.timeoutResolution)
+        expired = []
+
+        def expire():
+            expired.append(True)
+            d.cancel()
+
+        timer = self._timers.add(deadline, expire)
+
+        def done(result):
+            if not expired:
+                self._timers.cancel(timer)
+            elif isinstance(result, failure.Failure) and result.check(defer.CancelledError):
+                raise TimeoutError("Request is not replied in time")
+            return result
+
+        return d.addBoth(done)
+
+    # Keyword arguments accepted by all the requests, a misspelled option fails the request;
+    # options of the particular requests (e.g. offset and limit of select_many) are taken out before
+    REQUEST_OPTIONS = frozenset(("response_class", "consumer", "timeout", "deadline", "columnar"))
+
+    def _check_options(self, kwargs):
+        unknown = set(kwargs).difference(self.REQUEST_OPTIONS)
+        if unknown:
+            raise TypeError("Unexpected keyword argument(s) %s" % ", ".join(sorted(unknown)))
+
+    def _request(self, request_class, field_types, *args, **kwargs):
+        """
+        Send request of the given type, args are passed to the request constructor after the request id
+
+        :param response_class: class of the reply, by default :attr:`responseClass` is used
+        :param consumer: callable to pass decoded tuples to instead of collecting them in the reply
+        :param timeout: seconds to wait for reply
+        :param deadline: time to wait for reply till
+        """
+        self._check_options(kwargs)
+        return self._with_deadline(self._with_retries(self._send_request, request_class, field_types, args, kwargs),
+                                   kwargs)
+
+    def _send_request(self, request_class, field_types, args, kwargs):
+        d = self._expect_reply(field_types, kwargs)
+        try:
+            packet = request_class(self.charset, self.errors, d._ipro_request_id, *args)
+        except:
+            self.replyQueue._cancelGet(d)
+            raise
+        self.write(bytes(packet))
+        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types, d._ipro_response_class)
+
+    def _expect_reply(self, field_types, kwargs):
+        """
+        Allocate request id and deferred of the reply
+        """
+        d = self.replyQueue.get()
+        d._ipro_sent = self.clock.seconds()
+        d._ipro_field_types = field_types
+        d._ipro_response_class = kwargs.get("response_class") or \
+            (ColumnarResponse if kwargs.get("columnar") else self.responseClass)
+        d._ipro_consumer = kwargs.get("consumer")
+        return d
+
+    def execute(self, request, field_types, *args, **kwargs):
+        """
+        send prepared request (see prepare_* methods) with the given arguments;
+        with columnar=True tuples are returned by columns (see ColumnarResponse)
+        """
+        self._check_options(kwargs)
+        return self._with_deadline(self._with_retries(self._send_prepared, request, field_types, args, kwargs), kwargs)
 
-    def send_packet(self, packet, field_types=None):
-        self.transport.write(bytes(packet))
-        d = self.replyQueue.get()
-        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types)
+    def _send_prepared(self, request, field_types, args, kwargs):
+        d = self._expect_reply(field_types, kwargs)
+        try:
+            packet = request.packet(d._ipro_request_id, args)
+        except:
+            self.replyQueue._cancelGet(d)
+            raise
+        self.write(packet)
+        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types, d._ipro_response_class)
 
     # Tarantool COMMANDS
 
-    def ping(self):
+    def ping(self, **kwargs):
         """
         send ping packet to tarantool server and receive response with empty body
         """
+        self._check_options(kwargs)
+        return self._with_deadline(self._when_admitted(self._send_ping), kwargs)
+
+    def _send_ping(self):
         d = self.replyQueue.get_ping()
         packet = RequestPing(self.charset, self.errors)
-        self.transport.write(bytes(packet))
+        self.write(bytes(packet))
         return d.addCallback(self.handle_reply, self.charset, self.errors, None)
 
-    def insert(self, space_no, *args):
+    def insert(self, space_no, *args, **kwargs):
         """
         insert tuple, if primary key exists server will return error
         """
-        d = self.replyQueue.get()
-        packet = RequestInsert(self.charset, self.errors, d._ipro_request_id, space_no, Request.TNT_FLAG_ADD, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, None)
+        return self._request(RequestInsert, None, space_no, Request.TNT_FLAG_ADD, *args, **kwargs)
 
-    def insert_ret(self, space_no, field_types, *args):
+    def insert_ret(self, space_no, field_types, *args, **kwargs):
         """
         insert tuple, inserted tuple is sent back, if primary key exists server will return error
         """
-        d = self.replyQueue.get()
-        packet = RequestInsert(self.charset, self.errors, d._ipro_request_id,
-                               space_no, Request.TNT_FLAG_ADD | Request.TNT_FLAG_RETURN, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types)
+        return self._request(RequestInsert, field_types, space_no, Request.TNT_FLAG_ADD | Request.TNT_FLAG_RETURN, *args, **kwargs)
 
-    def select(self, space_no, index_no, field_types, *args):
+    def select(self, space_no, index_no, field_types, *args, **kwargs):
         """
-        select tuple(s)
+        select tuple(s), with columnar=True tuples are returned by columns (see ColumnarResponse)
         """
-        d = self.replyQueue.get()
-        packet = RequestSelect(self.charset, self.errors, d._ipro_request_id, space_no, index_no, 0, 0xffffffff, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types)
+        return self._request(RequestSelect, field_types, space_no, index_no, 0, 0xffffffff, *args, **kwargs)
 
-    def select_ext(self, space_no, index_no, offset, limit, field_types, *args):
+    def select_ext(self, space_no, index_no, offset, limit, field_types, *args, **kwargs):
         """
-        select tuple(s), additional parameters are submitted: offset and limit
+        select tuple(s), additional parameters are submitted: offset and limit;
+        with columnar=True tuples are returned by columns (see ColumnarResponse)
         """
-        d = self.replyQueue.get()
-        packet = RequestSelect(self.charset, self.errors, d._ipro_request_id, space_no, index_no, offset, limit, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types)
+        return self._request(RequestSelect, field_types, space_no, index_no, offset, limit, *args, **kwargs)
+
+    def select_many(self, space_no, index_no, field_types, keys, **kwargs):
+        """
+        select tuple(s) by several keys in a single request, optional offset and limit
+        parameters can be given as keyword arguments; with key_fields (numbers of the index
+        fields in the tuple) the deferred fires with the list of tuples of every key,
+        otherwise with all the tuples (by columns with columnar=True).
+        Tuples are grouped by the full keys: every key must have a value for each of the
+        key fields, keys matching a prefix of the index raise ValueError
+        """
+        offset = kwargs.pop("offset", 0)
+        limit = kwargs.pop("limit", 0xffffffff)
+        key_fields = kwargs.pop("key_fields", None)
+        if key_fields:
+            if kwargs.get("columnar") or issubclass(kwargs.get("response_class") or Response, ColumnarResponse):
+                raise ValueError("Tuples grouped by key fields can not be returned by columns")
+            if issubclass(self.responseClass, ColumnarResponse):
+                # Tuples are split by rows, the default class of the replies is replaced
+                kwargs["response_class"] = Response
+            groups, group_by_key = self._key_groups(keys, key_fields, field_types)
+
+        d = self._request(RequestSelectMany, field_types, space_no, index_no, offset, limit, keys, **kwargs)
+        if key_fields:
+            d.addCallback(self._group_by_keys, groups, group_by_key, key_fields)
+        return d
+
+    def _key_groups(self, keys, key_fields, field_types):
+        """
+        Create empty list of tuples for every key of select_many() and map the keys to them
+        """
+        # Key values are packed and decoded the same way as the fields of the reply to be comparable
+        types = getattr(field_types, "field_types", field_types) or (None,)
+        decode_key = get_tuple_decoder([types[i] if i < len(types) else types[-1] for i in key_fields],
+                                       self.charset, self.errors)
+        packer = Request(self.charset, self.errors)
+
+        groups = []
+        group_by_key = {}
+        for key in keys:
+            key = key if isinstance(key, (tuple, list)) else (key,)
+            if len(key) != len(key_fields):
+                raise ValueError("Key %r does not match key fields %r" % (key, key_fields))
+            groups.append(group_by_key.setdefault(decode_key(packer.pack_tuple(key), 0), []))
+        return groups, group_by_key
+
+    @staticmethod
+    def _group_by_keys(rows, groups, group_by_key, key_fields):
+        """
+        Split tuples of the select_many() reply by the keys they match
+        """
+        for row in rows:
+            group = group_by_key.get(tuple(row[i] for i in key_fields))
+            if group is None:
+                raise InvalidData("Tuple %r does not match any key" % (row,))
+            group.append(row)
+        return groups
+
+    def select_stream(self, space_no, index_no, field_types, callback, *args, **kwargs):
+        """
+        select tuple(s) passing every tuple to the callback as soon as it is decoded,
+        so the whole result is never held in memory; optional offset and limit
+        parameters can be given as keyword arguments.
+        The deferred fires with the number of tuples passed to the callback, an exception
+        raised by the callback fails it and the rest of the reply is skipped.
+        """
+        counter = [0]
+
+        def consumer(value):
+            counter[0] += 1
+            callback(value)
+
+        def rowcount(r):
+            if r.return_code != 0:
+                raise TarantoolError(r.return_code, r.return_message)
+            return counter[0]
 
-    def update(self, space_no, key_tuple, op_list):
+        offset = kwargs.pop("offset", 0)
+        limit = kwargs.pop("limit", 0xffffffff)
+        d = self._request(RequestSelect, field_types, space_no, index_no, offset, limit, *args,
+                          **dict(kwargs, consumer=consumer))
+        return d.addCallback(rowcount)
+
+    def update(self, space_no, key_tuple, op_list, **kwargs):
         """
         send update command(s)
         """
-        d = self.replyQueue.get()
-        packet = RequestUpdate(self.charset, self.errors, d._ipro_request_id, space_no, 0, key_tuple, op_list)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, None)
+        return self._request(RequestUpdate, None, space_no, 0, key_tuple, op_list, **kwargs)
 
-    def update_ret(self, space_no, field_types, key_tuple, op_list):
+    def update_ret(self, space_no, field_types, key_tuple, op_list, **kwargs):
         """
         send update command(s), updated tuple(s) is(are) sent back
         """
-        d = self.replyQueue.get()
-        packet = RequestUpdate(self.charset, self.errors, d._ipro_request_id,
-                               space_no, Request.TNT_FLAG_RETURN, key_tuple, op_list)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types)
+        return self._request(RequestUpdate, field_types, space_no, Request.TNT_FLAG_RETURN, key_tuple, op_list, **kwargs)
 
-    def delete(self, space_no, *args):
+    def delete(self, space_no, *args, **kwargs):
         """
         delete tuple by primary key
         """
-        d = self.replyQueue.get()
-        packet = RequestDelete(self.charset, self.errors, d._ipro_request_id, space_no, 0, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, None)
+        return self._request(RequestDelete, None, space_no, 0, *args, **kwargs)
 
-    def delete_ret(self, space_no, field_types, *args):
+    def delete_ret(self, space_no, field_types, *args, **kwargs):
         """
         delete tuple by primary key, deleted tuple is sent back
         """
-        d = self.replyQueue.get()
-        packet = RequestDelete(self.charset, self.errors, d._ipro_request_id, space_no, Request.TNT_FLAG_RETURN, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types)
+        return self._request(RequestDelete, field_types, space_no, Request.TNT_FLAG_RETURN, *args, **kwargs)
 
-    def replace(self, space_no, *args):
+    def replace(self, space_no, *args, **kwargs):
         """
         insert tuple, if primary key exists it will be rewritten
         """
-        d = self.replyQueue.get()
-        packet = RequestInsert(self.charset, self.errors, d._ipro_request_id, space_no, 0, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, None)
+        return self._request(RequestInsert, None, space_no, 0, *args, **kwargs)
 
-    def replace_ret(self, space_no, field_types, *args):
+    def replace_ret(self, space_no, field_types, *args, **kwargs):
         """
         insert tuple, inserted tuple is sent back, if primary key exists it will be rewritten
         """
-        d = self.replyQueue.get()
-        packet = RequestInsert(self.charset, self.errors, d._ipro_request_id, space_no, Request.TNT_FLAG_RETURN, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types)
+        return self._request(RequestInsert, field_types, space_no, Request.TNT_FLAG_RETURN, *args, **kwargs)
 
-    def replace_req(self, space_no, *args):
+    def replace_req(self, space_no, *args, **kwargs):
         """
         insert tuple, if tuple with same primary key doesn't exist server will return error
         """
-        d = self.replyQueue.get()
-        packet = RequestInsert(self.charset, self.errors, d._ipro_request_id, space_no, Request.TNT_FLAG_REPLACE, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, None)
+        return self._request(RequestInsert, None, space_no, Request.TNT_FLAG_REPLACE, *args, **kwargs)
 
-    def replace_req_ret(self, space_no, field_types, *args):
+    def replace_req_ret(self, space_no, field_types, *args, **kwargs):
         """
         insert tuple, inserted tuple is sent back, if tuple with same primary key doesn't exist server will return error
         """
-        d = self.replyQueue.get()
-        packet = RequestInsert(self.charset, self.errors, d._ipro_request_id,
-                               space_no, Request.TNT_FLAG_REPLACE | Request.TNT_FLAG_RETURN, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types)
+        return self._request(RequestInsert, field_types, space_no, Request.TNT_FLAG_REPLACE | Request.TNT_FLAG_RETURN, *args, **kwargs)
 
-    def call(self, proc_name, field_types, *args):
+    def call(self, proc_name, field_types, *args, **kwargs):
         """
         call server procedure
         """
-        d = self.replyQueue.get()
-        packet = RequestCall(self.charset, self.errors, d._ipro_request_id, proc_name, 0, *args)
-        self.transport.write(bytes(packet))
-        return d.addCallback(self.handle_reply, self.charset, self.errors, field_types)
+        return self._request(RequestCall, field_types, proc_name, 0, *args, **kwargs)
+
+
+class RoundRobinPolicy(object):
+    """
+    Picks the candidates in turn, skipping the ones which can not send a request right away
+    if there are others; if all of them are busy - the one with the least outstanding requests.
+
+    Candidates are connections or connection handlers, they have ``available`` (a request
+    can be sent right away), ``outstanding`` (number of requests in flight) and ``latency``
+    (average reply latency) attributes.
+    """
+
+    def __init__(self):
+        self.idx = 0
+
+    def pick(self, candidates):
+        least_busy = None
+        for _ in xrange(len(candidates)):
+            self.idx = (self.idx + 1) % len(candidates)
+            candidate = candidates[self.idx]
+            if candidate.available:
+                return candidate
+            if least_busy is None or candidate.outstanding < least_busy.outstanding:
+                least_busy = candidate
+        return least_busy
+
+
+class LeastOutstandingPolicy(object):
+    """
+    Picks the candidate with the least outstanding requests
+    """
+
+    def pick(self, candidates):
+        if not candidates:
+            return None
+        return min(candidates, key=lambda candidate: candidate.outstanding)
 
 
-class ConnectionHandler(object):
+class PowerOfTwoPolicy(object):
+    """
+    Picks the cheaper of two random candidates, the cost is the average reply latency
+    multiplied by the number of outstanding requests plus one, so a connection stuck behind
+    a slow request gets new requests only when the others are slower still. Comparing two
+    random candidates instead of all of them keeps the pick O(1) and spreads the requests
+    which are issued before the costs are updated.
+    """
+
+    def __init__(self, random=random):
+        self.random = random
+
+    @staticmethod
+    def cost(candidate):
+        return candidate.latency * (candidate.outstanding + 1)
+
+    def pick(self, candidates):
+        if len(candidates) < 2:
+            return candidates[0] if candidates else None
+        a, b = self.random.sample(candidates, 2)
+        return a if self.cost(a) <= self.cost(b) else b
+
+
+class ConnectionHandler(PreparedRequestsMixin):
+
+    # Provider of the current time for the deadlines of waiting for a free connection
+    clock = reactor
 
     def __init__(self, factory):
         self._factory = factory
         self._connected = factory.deferred
+        self._batches = {}
+        self._packer = Request(self.charset, self.errors)
+
+    def callLater(self, period, func, *args):
+        """
+        Wrapper around reactor.callLater for test purpose.
+        """
+        return reactor.callLater(period, func, *args)
+
+    # Keyword arguments of select() which are passed through to the batched select_many()
+    BATCH_KWARGS = frozenset(("timeout", "deadline", "response_class"))
+
+    def select(self, space_no, index_no, field_types, *args, **kwargs):
+        """
+        select tuple(s); if key fields of the index are given by the batchKeyFields factory
+        option, selects issued within batchDelay with the same timeout, deadline and
+        response_class are sent as a single select_many()
+        """
+        key_fields = (self._factory.batchKeyFields or {}).get((space_no, index_no))
+        if key_fields is None or len(args) != len(key_fields) or not self.BATCH_KWARGS.issuperset(kwargs):
+            return self.__getattr__("select")(space_no, index_no, field_types, *args, **kwargs)
+
+        if field_types is not None and not isinstance(field_types, type):
+            field_types = tuple(field_types)
+        batch_key = (space_no, index_no, field_types, tuple(sorted(kwargs.items())))
+        batch = self._batches.get(batch_key)
+        if batch is None:
+            batch = self._batches[batch_key] = ([], self.callLater(self._factory.batchDelay, self._send_batch, batch_key))
+
+        d = defer.Deferred()
+        # Keys are told apart as they are sent, e.g. 1 and 1L are packed as different fields
+        try:
+            packed = self._packer.pack_tuple(args)
+        except Exception:
+            return defer.fail()
+        batch[0].append((packed, args, d))
+        if len(batch[0]) >= self._factory.batchMaxKeys:
+            self._send_batch(batch_key)
+        return d
+
+    def _send_batch(self, batch_key):
+        """
+        Send collected selects as a single request and pass every caller its tuples
+        """
+        requests, call = self._batches.pop(batch_key)
+        if call.active():
+            call.cancel()
+
+        space_no, index_no, field_types, options = batch_key
+        options = dict(options)
+        response_class = options.get("response_class") or self._factory.responseClass
+        keys = []
+        key_index = {}
+        for packed, key, _ in requests:
+            if packed not in key_index:
+                key_index[packed] = len(keys)
+                keys.append(key)
+
+        def distribute(groups):
+            for packed, _, d in requests:
+                response = response_class((Request.TNT_OP_SELECT, 0, 0), None, self.charset, self.errors, field_types)
+                response._return_code = response._completion_status = 0
+                group = groups[key_index[packed]]
+                for value in group:
+                    response._append_tuple(value)
+                response._rowcount = len(group)
+                d.callback(response)
+
+        def fail(failure):
+            for _, _, d in requests:
+                d.errback(failure)
+
+        if issubclass(response_class, ColumnarResponse):
+            # Tuples are grouped by rows and then stored by columns for every caller
+            options.pop("response_class", None)
+        d = self.__getattr__("select_many")(space_no, index_no, field_types, keys,
+                                            key_fields=self._factory.batchKeyFields[(space_no, index_no)], **options)
+        d.addCallbacks(distribute, fail)
 
     def _wait_pool_cleanup(self, deferred):
         if self._factory.size == 0:
@@ -1016,11 +2794,88 @@ class ConnectionHandler(object):
         t.start(.5)
         return d
 
+    def _pick_connection(self):
+        """
+        Get the connection of the pool chosen by the factory's selectionPolicy,
+        if it is busy the request waits for admission there
+        """
+        return self._factory.selectionPolicy.pick([conn for conn in self._factory.pool if conn.connected])
+
+    @property
+    def outstanding(self):
+        """
+        Average number of the requests in flight per connection
+        """
+        pool = self._factory.pool
+        return float(sum(conn.outstanding for conn in pool)) / len(pool) if pool else 0.0
+
+    @property
+    def latency(self):
+        """
+        Average reply latency of the connections
+        """
+        pool = self._factory.pool
+        return sum(conn.latency for conn in pool) / len(pool) if pool else 0.0
+
+    @property
+    def available(self):
+        return any(conn.available for conn in self._factory.pool)
+
+    def _call_multiplexed(self, method, args, kwargs):
+        """
+        Send request over one of the connections without taking it from the pool
+        """
+        conn = self._pick_connection()
+        if conn is None:
+            return defer.fail(ConnectionError("Not connected"))
+
+        def switch_to_errback(reply):
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+
+        try:
+            d = getattr(conn, method)(*args, **kwargs)
+        except:
+            return defer.fail()
+        return d.addCallback(switch_to_errback)
+
+    def _wait_connection(self, d, deadline):
+        """
+        Stop waiting for a free connection of the pool and fail with TimeoutError at the deadline
+        """
+        call = self.clock.callLater(deadline - self.clock.seconds(), d.cancel)
+
+        def done(result):
+            if call.active():
+                call.cancel()
+            elif isinstance(result, failure.Failure) and result.check(defer.CancelledError):
+                raise TimeoutError("No connection is free in time")
+            return result
+
+        return d.addBoth(done)
+
     def __getattr__(self, method):
         def wrapper(*args, **kwargs):
+            if self._factory.multiplexed:
+                return self._call_multiplexed(method, args, kwargs)
+
+            if kwargs.get("timeout") is not None:
+                # Time spent waiting for a free connection counts too
+                deadline = self.clock.seconds() + kwargs.pop("timeout")
+                kwargs["deadline"] = min(deadline, kwargs.get("deadline") or deadline)
+            deadline = kwargs.get("deadline")
+            if deadline is not None and self.clock.seconds() >= deadline:
+                return defer.fail(TimeoutError("Request deadline has passed"))
+
             d = self._factory.getConnection()
+            if deadline is not None:
+                d = self._wait_connection(d, deadline)
 
             def callback(connection):
+                if deadline is not None and self.clock.seconds() >= deadline:
+                    self._factory.connectionQueue.put(connection)
+                    raise TimeoutError("Request deadline has passed")
                 protocol_method = getattr(connection, method)
                 try:
                     d = protocol_method(*args, **kwargs)
@@ -1070,17 +2925,734 @@ class UnixConnectionHandler(ConnectionHandler):
                    (cli.name, self._factory.size, 's' if self._factory.size > 1 else '')
 
 
+class ReplicatedConnectionHandler(PreparedRequestsMixin):
+    """
+    Routes reads to the pools of the read-only replicas (e.g. secondary_port of the server)
+    and mutations and calls to the pool of the primary.
+
+    Every request can be routed explicitly with replica=True (to a replica) or replica=False
+    (to the primary) keyword argument. Reads go to the connected replica chosen by the policy,
+    if none is connected - to the primary.
+    """
+
+    READ_METHODS = frozenset(("select", "select_ext", "select_many", "select_stream", "ping"))
+
+    def __init__(self, primary, replicas, policy=None):
+        """
+        :param primary: handler of the primary's pool
+        :type primary: ConnectionHandler
+        :param replicas: handlers of the replicas' pools
+        :type replicas: list of ConnectionHandler
+        :param policy: selection policy of the replica, by default RoundRobinPolicy
+        """
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.policy = policy if policy is not None else RoundRobinPolicy()
+
+    def _pick_replica(self):
+        """
+        Get the handler of the connected replica chosen by the policy or of the primary if none is connected
+        """
+        return self.policy.pick([replica for replica in self.replicas if replica._factory.size]) or self.primary
+
+    def _route(self, method, args, kwargs):
+        replica = kwargs.pop("replica", None)
+        if replica is None:
+            if method == "execute":
+                replica = args[0].request_type == Request.TNT_OP_SELECT
+            else:
+                replica = method in self.READ_METHODS
+        return self._pick_replica() if replica else self.primary
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        def wrapper(*args, **kwargs):
+            return getattr(self._route(method, args, kwargs), method)(*args, **kwargs)
+
+        return wrapper
+
+    def disconnect(self):
+        return defer.gatherResults([handler.disconnect() for handler in [self.primary] + self.replicas])
+
+    def __repr__(self):
+        return "<Tarantool Replicated Connection: %r, replicas: %s>" % \
+               (self.primary, ", ".join(repr(replica) for replica in self.replicas))
+
+
+class HashRing(object):
+    """
+    Consistent hash ring with virtual nodes.
+
+    Every node is put to the ring at vnodes points (md5 of its name), a key belongs to the node
+    of the first point following the key's hash (crc32), so adding or removing one of N nodes
+    moves only about 1/N of the keys.
+    """
+
+    def __init__(self, vnodes=160):
+        """
+        :param vnodes: number of the points of every node
+        :type vnodes: int
+        """
+        self.vnodes = vnodes
+        self.nodes = {}
+        self._points = []
+        self._owners = []
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, name, node):
+        """
+        Add the node, the same name always gets the same points
+        """
+        self.nodes[name] = node
+        self._rebuild()
+
+    def remove(self, name):
+        del self.nodes[name]
+        self._rebuild()
+
+    def _rebuild(self):
+        points = []
+        for name in self.nodes:
+            for i in xrange(0, self.vnodes, 4):
+                digest = hashlib.md5(b"%s-%d" % (name, i)).digest()
+                points.extend((point, name) for point in struct.unpack("<4L", digest)[:self.vnodes - i])
+        points.sort()
+        self._points = [point for point, _ in points]
+        self._owners = [self.nodes[name] for _, name in points]
+
+    def get(self, key):
+        """
+        Get the node of the key
+
+        :param key: packed key
+        :type key: bytes
+        """
+        if not self._owners:
+            raise ConnectionError("No shards")
+        i = bisect.bisect(self._points, zlib.crc32(key) & 0xffffffff)
+        return self._owners[i if i < len(self._owners) else 0]
+
+
+def _concat_columns(columns):
+    """
+    Concatenate columns of ColumnarResponse keeping their type if they are of the same one
+    """
+    if numpy is not None and any(isinstance(column, numpy.ndarray) for column in columns):
+        return numpy.concatenate(columns)
+    if all(isinstance(column, array.array) for column in columns) and \
+            len(set(column.typecode for column in columns)) == 1:
+        result = array.array(columns[0].typecode)
+        for column in columns:
+            result.extend(column)
+        return result
+    return list(itertools.chain.from_iterable(columns))
+
+
+class ShardedConnectionHandler(PreparedRequestsMixin):
+    """
+    Routes requests to the pools of several servers by the primary key of the tuple.
+
+    Requests by the primary key (index 0) go to the shard the key hashes to, selects by the
+    other indexes are sent to all the shards in parallel and their results are concatenated.
+    select_many() by the primary key sends every shard only the keys it owns. Calls and
+    prepared calls are routed with shard (name of the shard) or shard_key keyword argument,
+    which can be given to any request to override the routing.
+    """
+
+    def __init__(self, shards, vnodes=160, keyExtractors=None, keyTypes=None):
+        """
+        :param shards: handlers of the servers' pools by the shard names
+        :type shards: dict
+        :param vnodes: number of the points of every shard on the hash ring
+        :type vnodes: int
+        :param keyExtractors: callables getting the primary key tuple from the tuple values
+            by space_no, by default the key is the first field
+        :type keyExtractors: dict
+        :param keyTypes: types of the primary key fields (int, long, str or unicode) by space_no,
+            the last type is used for all the remaining fields; by default integers are
+            routed by their value and the other values by their bytes
+        :type keyTypes: dict
+        """
+        self.ring = HashRing(vnodes)
+        self.keyExtractors = keyExtractors or {}
+        self.keyTypes = keyTypes or {}
+        self._packer = Request(self.charset, self.errors)
+        for name, handler in shards.items():
+            self.ring.add(name, handler)
+
+    @property
+    def shards(self):
+        return self.ring.nodes
+
+    def add_shard(self, name, handler):
+        self.ring.add(name, handler)
+
+    def remove_shard(self, name):
+        """
+        Remove the shard from the ring and close its pool
+
+        :return: deferred of the pool disconnection
+        """
+        handler = self.shards[name]
+        self.ring.remove(name)
+        return handler.disconnect()
+
+    def shard_for(self, key, space_no=None):
+        """
+        Get the handler of the shard owning the primary key
+
+        :param key: key value or tuple of values
+        :param space_no: space of the key, the key is packed by its keyTypes
+        """
+        return self.ring.get(self._route_key(key if isinstance(key, (tuple, list)) else (key,),
+                                             self.keyTypes.get(space_no)))
+
+    def _route_key(self, key, key_types):
+        """
+        Pack the key to be hashed: integers are packed as 64-bit values, so the same number
+        is routed to the same shard whatever its python type or size in the tuple
+        """
+        packed = []
+        for i, value in enumerate(key):
+            cast_to = key_types[min(i, len(key_types) - 1)] if key_types else None
+            if cast_to in (int, long):
+                value = struct_Q.pack(cast_to(value))
+            elif cast_to is None and isinstance(value, (int, long)):
+                value = struct_Q.pack(value)
+            elif not isinstance(value, unicode):
+                value = bytes(value)
+            packed.append(self._packer.pack_field(value))
+        return b''.join(packed)
+
+    def _tuple_shard(self, space_no, values, kwargs):
+        extractor = self.keyExtractors.get(space_no)
+        return self._key_shard(extractor(values) if extractor is not None else values[:1], kwargs, space_no)
+
+    def _key_shard(self, key, kwargs, space_no=None):
+        if kwargs:
+            if "shard" in kwargs:
+                return self.shards[kwargs.pop("shard")]
+            if "shard_key" in kwargs:
+                key = kwargs.pop("shard_key")
+        return self.shard_for(key, space_no)
+
+    def _explicit_shard(self, kwargs):
+        if "shard" not in kwargs and "shard_key" not in kwargs:
+            raise ValueError("Request can not be routed by key, shard or shard_key is required")
+        return self._key_shard(None, kwargs)
+
+    @staticmethod
+    def _gather(ds):
+        return defer.gatherResults(ds, consumeErrors=True).addErrback(lambda f: f.value.subFailure)
+
+    def _merge(self, responses, field_types, response_class=None):
+        """
+        Concatenate tuples of the shards' replies into a reply of their class,
+        columns of the columnar replies are concatenated one by one;
+        a failed reply is returned as is
+        """
+        for r in responses:
+            if getattr(r, "return_code", 0) != 0:
+                return r
+        if response_class is None:
+            response_class = next((r.__class__ for r in responses if isinstance(r, Response)), Response)
+        response = response_class((Request.TNT_OP_SELECT, 0, 0), None, self.charset, self.errors, field_types)
+        response._return_code = response._completion_status = 0
+
+        if isinstance(response, ColumnarResponse):
+            replies = [r for r in responses if len(r)]
+            if len(set(len(r) for r in replies)) > 1:
+                raise InvalidData("Tuples of different cardinality can't be stored by columns")
+            list.extend(response, [_concat_columns(columns) for columns in zip(*replies)])
+            response._rowcount = sum(len(r[0]) for r in replies)
+            return response
+
+        for r in responses:
+            for value in r:
+                response._append_tuple(value)
+        response._rowcount = len(response)
+        return response
+
+    def _scatter(self, method, field_types, *args, **kwargs):
+        ds = [getattr(handler, method)(*args, **kwargs) for handler in self.shards.values()]
+        return self._gather(ds).addCallback(self._merge, field_types)
+
+    def insert(self, space_no, *args, **kwargs):
+        return self._tuple_shard(space_no, args, kwargs).insert(space_no, *args, **kwargs)
+
+    def insert_ret(self, space_no, field_types, *args, **kwargs):
+        return self._tuple_shard(space_no, args, kwargs).insert_ret(space_no, field_types, *args, **kwargs)
+
+    def replace(self, space_no, *args, **kwargs):
+        return self._tuple_shard(space_no, args, kwargs).replace(space_no, *args, **kwargs)
+
+    def replace_ret(self, space_no, field_types, *args, **kwargs):
+        return self._tuple_shard(space_no, args, kwargs).replace_ret(space_no, field_types, *args, **kwargs)
+
+    def replace_req(self, space_no, *args, **kwargs):
+        return self._tuple_shard(space_no, args, kwargs).replace_req(space_no, *args, **kwargs)
+
+    def replace_req_ret(self, space_no, field_types, *args, **kwargs):
+        return self._tuple_shard(space_no, args, kwargs).replace_req_ret(space_no, field_types, *args, **kwargs)
+
+    def update(self, space_no, key_tuple, op_list, **kwargs):
+        return self._key_shard(key_tuple, kwargs, space_no).update(space_no, key_tuple, op_list, **kwargs)
+
+    def update_ret(self, space_no, field_types, key_tuple, op_list, **kwargs):
+        return self._key_shard(key_tuple, kwargs, space_no).update_ret(space_no, field_types, key_tuple, op_list,
+                                                                       **kwargs)
+
+    def delete(self, space_no, *args, **kwargs):
+        return self._key_shard(args, kwargs, space_no).delete(space_no, *args, **kwargs)
+
+    def delete_ret(self, space_no, field_types, *args, **kwargs):
+        return self._key_shard(args, kwargs, space_no).delete_ret(space_no, field_types, *args, **kwargs)
+
+    def call(self, proc_name, field_types, *args, **kwargs):
+        return self._explicit_shard(kwargs).call(proc_name, field_types, *args, **kwargs)
+
+    def ping(self, **kwargs):
+        """
+        ping all the shards
+        """
+        return self._gather([handler.ping(**kwargs) for handler in self.shards.values()])
+
+    def select(self, space_no, index_no, field_types, *args, **kwargs):
+        if index_no == 0 or "shard" in kwargs or "shard_key" in kwargs:
+            return self._key_shard(args, kwargs, space_no).select(space_no, index_no, field_types, *args, **kwargs)
+        return self._scatter("select", field_types, space_no, index_no, field_types, *args, **kwargs)
+
+    def select_ext(self, space_no, index_no, offset, limit, field_types, *args, **kwargs):
+        """
+        select with offset and limit, a select by a secondary index gets offset + limit
+        tuples of every shard and skips offset tuples of their concatenation,
+        see select_range() for the tuples ordered by the index
+        """
+        if index_no == 0 or "shard" in kwargs or "shard_key" in kwargs:
+            return self._key_shard(args, kwargs, space_no).select_ext(space_no, index_no, offset, limit, field_types,
+                                                                      *args, **kwargs)
+
+        def page(response):
+            if response.return_code == 0:
+                if isinstance(response, ColumnarResponse):
+                    response[:] = [column[offset:offset + limit] for column in response]
+                    response._rowcount = len(response[0]) if len(response) else 0
+                else:
+                    response[:] = response[offset:offset + limit]
+                    response._rowcount = len(response)
+            return response
+
+        d = self._scatter("select_ext", field_types, space_no, index_no, 0, min(offset + limit, 0xffffffff),
+                          field_types, *args, **kwargs)
+        return d.addCallback(page)
+
+    @defer.inlineCallbacks
+    def select_range(self, space_no, index_no, field_types, key_fields, *args, **kwargs):
+        """
+        select tuples of all the shards in the order of the TREE index, optional offset and limit
+        parameters can be given as keyword arguments.
+
+        Every shard is asked for a page of its tuples (page_size keyword argument, by default
+        offset + limit divided by the number of the shards), the pages are merged with a heap
+        by the key fields casted to key_types. The next page of a shard is fetched only when
+        its tuples are merged and more tuples are still needed, so offset + limit tuples cost
+        about offset + limit tuples of transfer regardless of the number of the shards.
+
+        :param key_fields: numbers of the index fields in the tuple
+        :type key_fields: list of int
+        :param key_types: types of the index fields (int, long, str or unicode) as they are
+            compared by the index, by default they are taken from field_types
+        :type key_types: list of types
+        """
+        if kwargs.get("columnar"):
+            raise ValueError("Tuples merged in the index order can not be returned by columns")
+        offset = kwargs.pop("offset", 0)
+        limit = kwargs.pop("limit", 0xffffffff)
+        need = min(offset + limit, 0xffffffff)
+        shards = self.shards.values()
+        page_size = kwargs.pop("page_size", None) or max(1, -(-need // max(len(shards), 1)))
+        sort_key = self._range_key(key_fields, kwargs.pop("key_types", None), field_types)
+
+        def fetch(i, start, size):
+            return shards[i].select_ext(space_no, index_no, start, size, field_types, *args, **kwargs)
+
+        pages = yield self._gather([fetch(i, 0, min(page_size, need)) for i in xrange(len(shards))])
+        fetched = []
+        more = []
+        heap = []
+        for i, page in enumerate(pages):
+            if page.return_code != 0:
+                defer.returnValue(page)
+            fetched.append(len(page))
+            more.append(len(page) == min(page_size, need))
+            if page:
+                heap.append((sort_key(page[0]), i, 0))
+        heapq.heapify(heap)
+
+        rows = []
+        while heap and len(rows) < need:
+            _, i, pos = heapq.heappop(heap)
+            page = pages[i]
+            rows.append(page[pos])
+            pos += 1
+            if pos == len(page) and more[i] and len(rows) < need:
+                size = min(page_size, need - len(rows))
+                page = pages[i] = yield fetch(i, fetched[i], size)
+                if page.return_code != 0:
+                    defer.returnValue(page)
+                fetched[i] += len(page)
+                more[i] = len(page) == size
+                pos = 0
+            if pos < len(page):
+                heapq.heappush(heap, (sort_key(page[pos]), i, pos))
+
+        defer.returnValue(self._merge([rows[offset:]], field_types, pages[0].__class__ if pages else None))
+
+    def _range_key(self, key_fields, key_types, field_types):
+        """
+        Get the function returning the key of the tuple comparable in the index order,
+        raw fields are compared as little-endian bytes otherwise
+        """
+        if key_types is None:
+            types = getattr(field_types, "field_types", field_types) or (None,)
+            key_types = [types[i] if i < len(types) else types[-1] for i in key_fields]
+        if len(key_types) != len(key_fields):
+            raise ValueError("Key types %r do not match key fields %r" % (key_types, key_fields))
+
+        charset, errors = self.charset, self.errors
+
+        def to_unicode(value):
+            return value if isinstance(value, unicode) else bytes(value).decode(charset, errors)
+
+        casts = {int: int, long: long, str: bytes, unicode: to_unicode}
+        try:
+            fields = [(i, casts[t]) for i, t in zip(key_fields, key_types)]
+        except KeyError:
+            raise ValueError("Types of the key fields %r are required to merge tuples in the index order, "
+                             "got %r" % (key_fields, key_types))
+        return lambda row: tuple(cast(row[i]) for i, cast in fields)
+
+    def select_many(self, space_no, index_no, field_types, keys, **kwargs):
+        """
+        select by several keys, keys of the primary index are split by their shards,
+        keys of the other indexes are sent to all the shards
+        """
+        key_fields = kwargs.get("key_fields")
+        if "shard" in kwargs or "shard_key" in kwargs:
+            return self._key_shard(None, kwargs, space_no).select_many(space_no, index_no, field_types, keys, **kwargs)
+
+        if index_no != 0:
+            ds = [handler.select_many(space_no, index_no, field_types, keys, **kwargs)
+                  for handler in self.shards.values()]
+            if not key_fields:
+                return self._gather(ds).addCallback(self._merge, field_types)
+            return self._gather(ds).addCallback(lambda replies: [sum(groups, []) for groups in zip(*replies)])
+
+        positions = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(self.shard_for(key, space_no), []).append(i)
+        handlers = list(positions)
+        ds = [handler.select_many(space_no, index_no, field_types, [keys[i] for i in positions[handler]], **kwargs)
+              for handler in handlers]
+        if not key_fields:
+            return self._gather(ds).addCallback(self._merge, field_types)
+
+        def regroup(replies):
+            groups = [None] * len(keys)
+            for handler, reply in zip(handlers, replies):
+                for i, group in zip(positions[handler], reply):
+                    groups[i] = group
+            return groups
+
+        return self._gather(ds).addCallback(regroup)
+
+    def select_stream(self, space_no, index_no, field_types, callback, *args, **kwargs):
+        """
+        select passing tuples to the callback, by a secondary index tuples of all the shards are
+        passed as they arrive and the deferred fires with their total number
+        """
+        if index_no == 0 or "shard" in kwargs or "shard_key" in kwargs:
+            return self._key_shard(args, kwargs, space_no).select_stream(space_no, index_no, field_types, callback,
+                                                                         *args, **kwargs)
+        ds = [handler.select_stream(space_no, index_no, field_types, callback, *args, **kwargs)
+              for handler in self.shards.values()]
+        return self._gather(ds).addCallback(sum)
+
+    def execute(self, request, field_types, *args, **kwargs):
+        """
+        send prepared request to the shard of its key, selects by a secondary index and calls
+        require shard or shard_key keyword argument
+        """
+        space_no = struct_L.unpack_from(request.prefix)[0] if request.request_type != Request.TNT_OP_CALL else None
+        if "shard" in kwargs or "shard_key" in kwargs:
+            handler = self._key_shard(None, kwargs, space_no)
+        elif request.request_type == Request.TNT_OP_INSERT:
+            handler = self._tuple_shard(space_no, args, kwargs)
+        elif request.request_type == Request.TNT_OP_UPDATE:
+            handler = self.shard_for(args[0], space_no)
+        elif request.request_type == Request.TNT_OP_DELETE or (
+                request.request_type == Request.TNT_OP_SELECT and struct_L.unpack_from(request.prefix, 4)[0] == 0):
+            handler = self.shard_for(args, space_no)
+        else:
+            handler = self._explicit_shard(kwargs)
+        return handler.execute(request, field_types, *args, **kwargs)
+
+    def disconnect(self):
+        return defer.gatherResults([handler.disconnect() for handler in self.shards.values()])
+
+    def __repr__(self):
+        return "<Tarantool Sharded Connection: %s>" % ", ".join(sorted(self.shards))
+
+
+class PoolAutoscaler(object):
+    """
+    Adds connections to the pool of a factory when requests wait for a connection or
+    there are too many requests in flight per connection, closes idle connections.
+
+    Every interval seconds the autoscaler checks the average time requests waited for
+    a free connection (the pool where a connection carries a single request at a time),
+    or how long the oldest of the requests still waiting has waited if that is longer,
+    and the average number of requests in flight or waiting for admission per connection
+    (multiplexed pool). If any of them crosses its threshold, the pool grows by a half
+    up to maxSize. Otherwise connections which have not sent a packet for idleTimeout
+    seconds are closed down to minSize, but not earlier than idleTimeout seconds after
+    the pool grew.
+    """
+
+    def __init__(self, factory, minSize, maxSize, interval=1.0, upWait=0.01, upDepth=None, idleTimeout=60.0,
+                 clock=reactor):
+        """
+        :param minSize: min number of connections
+        :type minSize: int
+        :param maxSize: max number of connections
+        :type maxSize: int
+        :param interval: seconds between the checks
+        :type interval: float
+        :param upWait: average seconds requests wait for a connection to add connections
+        :type upWait: float
+        :param upDepth: average number of requests in flight per connection to add connections,
+            by default a half of the factory's maxPending
+        :type upDepth: float
+        :param idleTimeout: seconds without requests to close a connection
+        :type idleTimeout: float
+        """
+        self.factory = factory
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.interval = interval
+        self.upWait = upWait
+        self.upDepth = upDepth if upDepth is not None else (factory.maxPending or 0) / 2.0 or None
+        self.idleTimeout = idleTimeout
+        self.clock = clock
+
+        self.scaledUp = 0
+        self.scaledDown = 0
+        self.decisions = deque(maxlen=100)
+        self._waitTotal = 0.0
+        self._waitCount = 0
+        self._activity = {}
+        self._connectors = set()
+        self._lastScaleUp = None
+        self._loop = None
+
+    @property
+    def connecting(self):
+        """
+        Number of the connections added by the autoscaler which are not established yet
+        """
+        return len(self._connectors)
+
+    def connection_done(self, connector):
+        """
+        Stop counting the connection as connecting once it is established or failed
+        """
+        self._connectors.discard(connector)
+
+    def start(self):
+        if self._loop is None:
+            self._loop = task.LoopingCall(self.check)
+            self._loop.clock = self.clock
+            self._loop.start(self.interval, now=False)
+
+    def stop(self):
+        if self._loop is not None:
+            if self._loop.running:
+                self._loop.stop()
+            self._loop = None
+
+    def record_wait(self, seconds):
+        """
+        Account time a request waited for a free connection
+        """
+        self._waitTotal += seconds
+        self._waitCount += 1
+
+    def stats(self):
+        """
+        :return: current size of the pool, the load seen by the last check and the decisions made,
+            every decision is (time, "up" or "down", number of connections, reason)
+        :rtype: dict
+        """
+        return {
+            "size": self.factory.size,
+            "connecting": self.connecting,
+            "minSize": self.minSize,
+            "maxSize": self.maxSize,
+            "scaledUp": self.scaledUp,
+            "scaledDown": self.scaledDown,
+            "decisions": list(self.decisions),
+        }
+
+    def check(self):
+        factory = self.factory
+        if not factory.continueTrying:
+            return self.stop()
+
+        now = self.clock.seconds()
+        pool = factory.pool
+        size = factory.size + self.connecting
+        wait = self._waitTotal / self._waitCount if self._waitCount else 0.0
+        self._waitTotal, self._waitCount = 0.0, 0
+        # Requests still waiting are seen too, e.g. none records its wait while all the connections are stuck
+        waiting = factory.connectionQueue.waiting
+        if waiting:
+            wait = max(wait, now - getattr(waiting[0], "_ipro_waiting", now))
+        depth = float(sum(len(conn.replyQueue) + len(conn._admissionQueue) for conn in pool)) / len(pool) \
+            if pool else 0.0
+
+        reason = None
+        if wait >= self.upWait:
+            reason = "wait %.3fs, %d waiting" % (wait, len(waiting))
+        elif self.upDepth is not None and depth >= self.upDepth:
+            reason = "depth %.1f" % depth
+        if reason is not None and size < self.maxSize:
+            count = min(self.maxSize - size, max(1, size // 2))
+            for _ in xrange(count):
+                self._connectors.add(factory.connect())
+            self.scaledUp += count
+            self._lastScaleUp = now
+            self.decisions.append((now, "up", count, reason))
+            return
+
+        for conn in pool:
+            activity = self._activity.get(conn)
+            if activity is None or activity[0] != conn.packetsSent:
+                self._activity[conn] = (conn.packetsSent, now)
+        for conn in list(self._activity):
+            if conn not in pool:
+                del self._activity[conn]
+
+        if reason is not None or (self._lastScaleUp is not None and now - self._lastScaleUp < self.idleTimeout):
+            return
+        idle = [conn for conn in pool if now - self._activity[conn][1] >= self.idleTimeout
+                and not len(conn.replyQueue) and not conn._admissionQueue]
+        count = min(len(idle), factory.size - self.minSize)
+        if count > 0:
+            for conn in idle[:count]:
+                factory.retire(conn)
+            self.scaledDown += count
+            self.decisions.append((now, "down", count, "idle %ds" % self.idleTimeout))
+
+
 class TarantoolFactory(protocol.ReconnectingClientFactory):
 
     maxDelay = 10
     protocol = TarantoolProtocol
 
-    def __init__(self, poolsize, isLazy=False, handler=ConnectionHandler):
+    def __init__(self, poolsize, isLazy=False, handler=ConnectionHandler, maxBody=None, streamReplies=True,
+                 responseClass=Response, corkWrites=False, corkDelay=0, corkMaxBytes=64 * 1024,
+                 batchKeyFields=None, batchDelay=0, batchMaxKeys=1000, multiplexed=False, maxPending=100,
+                 maxWaiting=10000, requestTimeout=None, maxRetries=3, retryDelay=0.01, retryMaxDelay=1.0,
+                 retryBudget=None, minPoolSize=None, maxPoolSize=None, scaleInterval=1.0, scaleUpWait=0.01,
+                 scaleUpDepth=None, idleTimeout=60.0, selectionPolicy=None):
+        """
+        :param maxBody: replies with longer bodies are not buffered as a whole, by default
+            IprotoPacketReceiver.MAX_BODY is used
+        :type maxBody: int
+        :param streamReplies: decode tuples of the replies longer than maxBody as their bytes
+            arrive, otherwise such replies drop the connection
+        :type streamReplies: bool
+        :param responseClass: class of the replies, LazyResponse decodes tuples on access
+        :type responseClass: Response subclass
+        :param corkWrites: collect requests and write them to the socket together
+        :type corkWrites: bool
+        :param corkDelay: seconds to wait for more requests before writing collected ones,
+            0 - until the next reactor iteration
+        :type corkDelay: float
+        :param corkMaxBytes: collected requests are written at once when their size reaches this limit
+        :type corkMaxBytes: int
+        :param batchKeyFields: numbers of the key fields of the indexes by (space_no, index_no),
+            selects by full keys of these indexes are batched by the connection handler
+        :type batchKeyFields: dict
+        :param batchDelay: seconds to collect selects to be sent together, 0 - until the next reactor iteration
+        :type batchDelay: float
+        :param batchMaxKeys: collected selects are sent at once when there are that many of them
+        :type batchMaxKeys: int
+        :param multiplexed: send requests over the pool connections without waiting for the replies
+            to the previous ones, otherwise every connection carries a single request at a time
+        :type multiplexed: bool
+        :param maxPending: max number of requests waiting for reply per connection, further requests
+            wait for admission
+        :type maxPending: int
+        :param maxWaiting: max number of requests waiting for admission per connection, further requests
+            fail with QueueUnderflow
+        :type maxWaiting: int
+        :param requestTimeout: default timeout of the requests in seconds, requests which are not
+            replied in time fail with TimeoutError
+        :type requestTimeout: float
+        :param maxRetries: max number of times a request replied with "try again" status is sent again
+        :type maxRetries: int
+        :param retryDelay: max delay before the first retry in seconds, doubled with every next retry
+        :type retryDelay: float
+        :param retryMaxDelay: max delay before a retry in seconds
+        :type retryMaxDelay: float
+        :param retryBudget: limit of the retries shared by all the connections, by default
+            a retry per 10 requests is allowed
+        :type retryBudget: RetryBudget
+        :param minPoolSize: min number of connections, by default poolsize
+        :type minPoolSize: int
+        :param maxPoolSize: max number of connections, by default poolsize; if it is greater
+            than minPoolSize the pool is resized by PoolAutoscaler
+        :type maxPoolSize: int
+        :param scaleInterval: seconds between the checks of the pool size
+        :type scaleInterval: float
+        :param scaleUpWait: average seconds requests wait for a free connection to add connections
+        :type scaleUpWait: float
+        :param scaleUpDepth: average number of requests in flight per connection to add connections,
+            by default a half of maxPending
+        :type scaleUpDepth: float
+        :param idleTimeout: seconds without requests to close a connection above minPoolSize
+        :type idleTimeout: float
+        :param selectionPolicy: policy choosing the connection for a request, RoundRobinPolicy,
+            LeastOutstandingPolicy or PowerOfTwoPolicy; by default RoundRobinPolicy
+        """
         if not isinstance(poolsize, int):
             raise ValueError("Tarantool poolsize must be an integer, not %s" % type(poolsize).__name__)
 
         self.poolsize = poolsize
         self.isLazy = isLazy
+        self.maxBody = maxBody
+        self.streamReplies = streamReplies
+        self.responseClass = responseClass
+        self.corkWrites = corkWrites
+        self.corkDelay = corkDelay
+        self.corkMaxBytes = corkMaxBytes
+        self.batchKeyFields = batchKeyFields
+        self.batchDelay = batchDelay
+        self.batchMaxKeys = batchMaxKeys
+        self.multiplexed = multiplexed
+        self.maxPending = maxPending
+        self.maxWaiting = maxWaiting
+        self.requestTimeout = requestTimeout
+        self.maxRetries = maxRetries
+        self.retryDelay = retryDelay
+        self.retryMaxDelay = retryMaxDelay
+        self.retryBudget = retryBudget if retryBudget is not None else RetryBudget()
+        self.selectionPolicy = selectionPolicy if selectionPolicy is not None else RoundRobinPolicy()
 
         self.idx = 0
         self.size = 0
@@ -1088,11 +3660,41 @@ class TarantoolFactory(protocol.ReconnectingClientFactory):
         self.deferred = defer.Deferred()
         self.handler = handler(self)
         self.connectionQueue = defer.DeferredQueue()
+        self.connect = None
+        self._retired = set()
+
+        minPoolSize = poolsize if minPoolSize is None else minPoolSize
+        maxPoolSize = poolsize if maxPoolSize is None else maxPoolSize
+        self.autoscaler = None
+        if maxPoolSize > minPoolSize:
+            self.autoscaler = PoolAutoscaler(self, minPoolSize, maxPoolSize, scaleInterval, scaleUpWait,
+                                             scaleUpDepth, idleTimeout)
+
+    def buildProtocol(self, addr):
+        p = protocol.ReconnectingClientFactory.buildProtocol(self, addr)
+        if self.maxBody is not None:
+            p.MAX_BODY = self.maxBody
+        p.streamReplies = self.streamReplies
+        p.responseClass = self.responseClass
+        p.corkWrites = self.corkWrites
+        p.corkDelay = self.corkDelay
+        p.corkMaxBytes = self.corkMaxBytes
+        p.maxPending = self.maxPending
+        p.maxWaiting = self.maxWaiting
+        p.requestTimeout = self.requestTimeout
+        p.maxRetries = self.maxRetries
+        p.retryDelay = self.retryDelay
+        p.retryMaxDelay = self.retryMaxDelay
+        p.retryBudget = self.retryBudget
+        return p
 
     def addConnection(self, conn):
         self.connectionQueue.put(conn)
         self.pool.append(conn)
         self.size = len(self.pool)
+        if self.autoscaler is not None:
+            self.autoscaler.connection_done(getattr(conn.transport, "connector", None))
+            self.autoscaler.start()
         if self.deferred:
             if self.size == self.poolsize:
                 self.deferred.callback(self.handler)
@@ -1106,6 +3708,29 @@ class TarantoolFactory(protocol.ReconnectingClientFactory):
 
         self.size = len(self.pool)
 
+    def retire(self, conn):
+        """
+        Remove the connection from the pool and close it without reconnecting
+        """
+        conn.retired = True
+        self.delConnection(conn)
+        connector = getattr(conn.transport, "connector", None)
+        if connector is not None:
+            self._retired.add(connector)
+        conn.transport.loseConnection()
+
+    def clientConnectionFailed(self, connector, reason):
+        if self.autoscaler is not None:
+            # The connection is retried as any other, the autoscaler may decide to add another one meanwhile
+            self.autoscaler.connection_done(connector)
+        protocol.ReconnectingClientFactory.clientConnectionFailed(self, connector, reason)
+
+    def clientConnectionLost(self, connector, unused_reason):
+        if connector in self._retired:
+            self._retired.discard(connector)
+            return
+        protocol.ReconnectingClientFactory.clientConnectionLost(self, connector, unused_reason)
+
     def connectionError(self, why):
         if self.deferred:
             self.deferred.errback(ValueError(why))
@@ -1116,21 +3741,35 @@ class TarantoolFactory(protocol.ReconnectingClientFactory):
         if not self.size:
             raise ConnectionError("Not connected")
 
+        if self.autoscaler is not None:
+            started = self.autoscaler.clock.seconds()
         while True:
-            conn = yield self.connectionQueue.get()
-            if conn.connected == 0:
+            free = self.connectionQueue.pending
+            if len(free) > 1:
+                # Any of the free connections can be taken, let the policy choose
+                conn = self.selectionPolicy.pick(free)
+                free.remove(conn)
+            else:
+                d = self.connectionQueue.get()
+                if self.autoscaler is not None:
+                    d._ipro_waiting = started
+                conn = yield d
+            if conn.connected == 0 or conn.retired:
                 log.msg('Discarding dead connection.')
             else:
+                if self.autoscaler is not None:
+                    self.autoscaler.record_wait(self.autoscaler.clock.seconds() - started)
                 if put_back:
                     self.connectionQueue.put(conn)
                 defer.returnValue(conn)
 
 
-def makeConnection(host, port, poolsize, reconnect, isLazy):
-    factory = TarantoolFactory(poolsize, isLazy, ConnectionHandler)
+def makeConnection(host, port, poolsize, reconnect, isLazy, **kwargs):
+    factory = TarantoolFactory(poolsize, isLazy, ConnectionHandler, **kwargs)
     factory.continueTrying = reconnect
+    factory.connect = lambda: reactor.connectTCP(host, port, factory)
     for x in xrange(poolsize):
-        reactor.connectTCP(host, port, factory)
+        factory.connect()
 
     if isLazy:
         return factory.handler
@@ -1138,27 +3777,76 @@ def makeConnection(host, port, poolsize, reconnect, isLazy):
         return factory.deferred
 
 
-def Connection(host="localhost", port=33013, reconnect=True):
-    return makeConnection(host, port, 1, reconnect, False)
+def Connection(host="localhost", port=33013, reconnect=True, **kwargs):
+    return makeConnection(host, port, 1, reconnect, False, **kwargs)
+
+
+def lazyConnection(host="localhost", port=33013, reconnect=True, **kwargs):
+    return makeConnection(host, port, 1, reconnect, True, **kwargs)
+
 
+def ConnectionPool(host="localhost", port=33013, poolsize=10, reconnect=True, **kwargs):
+    return makeConnection(host, port, poolsize, reconnect, False, **kwargs)
 
-def lazyConnection(host="localhost", port=33013, reconnect=True):
-    return makeConnection(host, port, 1, reconnect, True)
+
+def lazyConnectionPool(host="localhost", port=33013, poolsize=10, reconnect=True, **kwargs):
+    return makeConnection(host, port, poolsize, reconnect, True, **kwargs)
+
+
+def makeReplicatedConnection(primary, replicas, poolsize, reconnect, isLazy, replicaPolicy=None, **kwargs):
+    handlers = [makeConnection(host, port, poolsize, reconnect, True, **kwargs)
+                for host, port in [primary] + list(replicas)]
+    handler = ReplicatedConnectionHandler(handlers[0], handlers[1:], replicaPolicy)
+
+    if isLazy:
+        return handler
+    else:
+        # Reads go to the primary until a replica is connected, so only the primary is waited for
+        for replica in handlers[1:]:
+            replica._connected.addErrback(log.err)
+        return handlers[0]._connected.addCallback(lambda _: handler)
+
+
+def ReplicatedConnectionPool(primary=("localhost", 33013), replicas=(("localhost", 33014),), poolsize=10,
+                             reconnect=True, **kwargs):
+    return makeReplicatedConnection(primary, replicas, poolsize, reconnect, False, **kwargs)
+
+
+def lazyReplicatedConnectionPool(primary=("localhost", 33013), replicas=(("localhost", 33014),), poolsize=10,
+                                 reconnect=True, **kwargs):
+    return makeReplicatedConnection(primary, replicas, poolsize, reconnect, True, **kwargs)
+
+
+def makeShardedConnection(shards, poolsize, reconnect, isLazy, vnodes=160, keyExtractors=None, keyTypes=None,
+                          **kwargs):
+    if isinstance(shards, dict):
+        shards = shards.items()
+    else:
+        shards = [("%s:%d" % (host, port), (host, port)) for host, port in shards]
+    handlers = dict((name, makeConnection(host, port, poolsize, reconnect, True, **kwargs))
+                    for name, (host, port) in shards)
+    handler = ShardedConnectionHandler(handlers, vnodes, keyExtractors, keyTypes)
+
+    if isLazy:
+        return handler
+    else:
+        return defer.gatherResults([h._connected for h in handlers.values()]).addCallback(lambda _: handler)
 
 
-def ConnectionPool(host="localhost", port=33013, poolsize=10, reconnect=True):
-    return makeConnection(host, port, poolsize, reconnect, False)
+def ShardedConnectionPool(shards, poolsize=10, reconnect=True, **kwargs):
+    return makeShardedConnection(shards, poolsize, reconnect, False, **kwargs)
 
 
-def lazyConnectionPool(host="localhost", port=33013, poolsize=10, reconnect=True):
-    return makeConnection(host, port, poolsize, reconnect, True)
+def lazyShardedConnectionPool(shards, poolsize=10, reconnect=True, **kwargs):
+    return makeShardedConnection(shards, poolsize, reconnect, True, **kwargs)
 
 
-def makeUnixConnection(path, poolsize, reconnect, isLazy):
-    factory = TarantoolFactory(poolsize, isLazy, UnixConnectionHandler)
+def makeUnixConnection(path, poolsize, reconnect, isLazy, **kwargs):
+    factory = TarantoolFactory(poolsize, isLazy, UnixConnectionHandler, **kwargs)
     factory.continueTrying = reconnect
+    factory.connect = lambda: reactor.connectUNIX(path, factory)
     for x in xrange(poolsize):
-        reactor.connectUNIX(path, factory)
+        factory.connect()
 
     if isLazy:
         return factory.handler
@@ -1166,20 +3854,20 @@ def makeUnixConnection(path, poolsize, reconnect, isLazy):
         return factory.deferred
 
 
-def UnixConnection(path="/tmp/tarantool.sock", reconnect=True):
-    return makeUnixConnection(path, 1, reconnect, False)
+def UnixConnection(path="/tmp/tarantool.sock", reconnect=True, **kwargs):
+    return makeUnixConnection(path, 1, reconnect, False, **kwargs)
 
 
-def lazyUnixConnection(path="/tmp/tarantool.sock", reconnect=True):
-    return makeUnixConnection(path, 1, reconnect, True)
+def lazyUnixConnection(path="/tmp/tarantool.sock", reconnect=True, **kwargs):
+    return makeUnixConnection(path, 1, reconnect, True, **kwargs)
 
 
-def UnixConnectionPool(path="/tmp/tarantool.sock", poolsize=10, reconnect=True):
-    return makeUnixConnection(path, poolsize, reconnect, False)
+def UnixConnectionPool(path="/tmp/tarantool.sock", poolsize=10, reconnect=True, **kwargs):
+    return makeUnixConnection(path, poolsize, reconnect, False, **kwargs)
 
 
-def lazyUnixConnectionPool(path="/tmp/tarantool.sock", poolsize=10, reconnect=True):
-    return makeUnixConnection(path, poolsize, reconnect, True)
+def lazyUnixConnectionPool(path="/tmp/tarantool.sock", poolsize=10, reconnect=True, **kwargs):
+    return makeUnixConnection(path, poolsize, reconnect, True, **kwargs)
 
 
 __all__ = [
@@ -1187,6 +3875,8 @@ __all__ = [
     ConnectionPool, lazyConnectionPool,
     UnixConnection, lazyUnixConnection,
     UnixConnectionPool, lazyUnixConnectionPool,
+    ReplicatedConnectionPool, lazyReplicatedConnectionPool,
+    ShardedConnectionPool, lazyShardedConnectionPool,
 ]
 
 __author__ = "Alexander V. Panfilov"